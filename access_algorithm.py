@@ -5,12 +5,48 @@
 """
 
 import asyncio
+import difflib
+import glob
 import json
 import os
 import sys
-from playwright.async_api import async_playwright
-from browser_utils import create_isolated_browser, print_isolated_browser_info
+import time
+import weakref
+import zlib
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from browser_utils import open_browser_context, print_isolated_browser_info
 from path_config import get_auth_state_file
+from log_parser import parse_execution_log
+from log_tail import start_log_tail, stop_log_tail
+from preflight import (
+    check_strategy_source, check_strategy_files, check_strategy_sources, print_preflight_report,
+    format_preflight_errors
+)
+from result_cache import (
+    CACHEABLE_STATUSES, compute_strategy_hash, get_cached_result, normalize_strategy_source, put_cached_result
+)
+from file_watcher import FileWatcher
+from algorithm_slots import (
+    DEFAULT_ALGORITHM_ID,
+    AlgorithmSlotPool,
+    SlotLeaseTimeout,
+    algorithm_pool_id,
+    algorithm_url,
+    load_algorithm_ids,
+)
+from run_timing import (
+    phase, start_run_timer, emit_timing_record, print_timing_summary, report_run_timing, write_trace_file,
+    start_playwright_trace, stop_playwright_trace
+)
+from run_history import record_run_async
+from error_signature import ErrorIndex, print_error_index
+from response_capture import ResponseCapture, payload_status, save_capture
+from session_manager import (
+    LOGIN_URL_KEYWORDS, SessionExpiredError, ensure_session_cookies, invalidate_session, is_login_url
+)
+from selector_cache import (
+    race_selectors, ordered_selectors, get_learned_selector, remember_selector, forget_selector
+)
 
 async def read_strategy_file(strategy_file):
     """读取策略文件内容"""
@@ -24,124 +60,306 @@ async def read_strategy_file(strategy_file):
         print(f"✗ 读取策略文件失败: {e}")
         return None
 
+# Ace编辑器接收键盘输入的textarea
+EDITOR_INPUT_SELECTORS = [
+    ".ace_text-input",
+    ".ace_editor textarea",
+]
+
+# 与Ace编辑器同步的隐藏textarea
+CODE_TEXTAREA_SELECTORS = [
+    "#code",
+    "textarea[name='code']",
+]
+
+# 编译运行按钮的可能选择器（基于您提供的HTML结构）
+COMPILE_BUTTON_SELECTORS = [
+    "#buildBtn",
+    "#buildBtn span",
+    "#buildBtn .active-text",
+    "span[title='编译运行(Ctrl+Alt+B)']",
+    "span:has-text('编译运行')",
+    "button:has-text('编译运行')",
+    "button:has-text('运行')",
+    "button:has-text('执行')",
+    "button:has-text('Run')",
+    "button:has-text('Compile')",
+    ".compile-btn",
+    ".run-btn",
+    "[data-testid='compile-run']",
+    "[data-testid='run']",
+    "button.run-button",
+    "button.compile-button",
+    ".btn-primary:has-text('运行')",
+    ".btn-success:has-text('运行')",
+    "button.btn.run"
+]
+
+# 查找编译运行按钮的总超时（毫秒）
+COMPILE_BUTTON_TIMEOUT = 5000
+
+# 前几个选择器只会匹配"编译运行"按钮，先竞速一小段时间；
+# 后面的通用选择器（如"运行"）可能匹配到"运行回测"按钮，只作为后备
+COMPILE_BUTTON_PRIORITY = 6
+
+# 超过这个长度不再逐字符键盘输入（太慢，且会被Ace自动缩进打乱）
+KEYBOARD_TYPE_MAX_CHARS = 2000
+
+# insertText 每次发送的字符数
+INSERT_TEXT_CHUNK_SIZE = 16 * 1024
+
+# 代码注入方法的默认尝试顺序，上次成功的方法会排到最前
+PASTE_METHODS = ["ace_api", "insert_text", "fill_textarea", "clipboard", "keyboard_type"]
+
+# 增量更新时改动行的字符数超过新代码的这个比例就直接整体替换
+DELTA_MAX_CHANGED_RATIO = 0.5
+
+# 每个页面上次注入后编辑器中的内容 {page: (行列表, crc32)}，页面对象释放后自动清除
+_editor_documents = weakref.WeakKeyDictionary()
+
+async def _paste_via_ace_api(page, strategy_content):
+    """方法1: 通过隐藏textarea和Ace Editor API设置内容"""
+    result = await page.evaluate("""
+        (code) => {
+            // 查找隐藏的textarea（通常是Ace Editor的同步目标）
+            const hiddenTextarea = document.getElementById('code');
+            if (hiddenTextarea) {
+                // 设置textarea的值
+                hiddenTextarea.value = code;
+                // 触发input事件
+                hiddenTextarea.dispatchEvent(new Event('input', { bubbles: true }));
+                hiddenTextarea.dispatchEvent(new Event('change', { bubbles: true }));
+            }
+
+            // 查找Ace Editor实例并更新
+            for (let aceEl of document.querySelectorAll('.ace_editor')) {
+                // Ace Editor通常会在元素上存储editor实例，也可能放在 ace_editor 属性上
+                const editor = (aceEl.env && aceEl.env.editor) || aceEl.ace_editor;
+                if (editor && editor.session) {
+                    editor.session.setValue(code);
+                    editor.clearSelection();
+                    return true;
+                }
+            }
+            return false;
+        }
+    """, strategy_content)
+    return bool(result)
+
+async def _focus_and_clear_editor(page):
+    """点击Ace编辑器输入框并清空内容"""
+    _, ace_input = await race_selectors(page, "editor_input", EDITOR_INPUT_SELECTORS, timeout=3000)
+    if not ace_input:
+        return False
+
+    await ace_input.click()
+    await page.keyboard.press('Control+a')
+    await page.keyboard.press('Delete')
+    return True
+
+async def _paste_via_insert_text(page, strategy_content):
+    """方法2: 分块 insertText，每块只触发一次输入事件"""
+    if not await _focus_and_clear_editor(page):
+        return False
+
+    for start in range(0, len(strategy_content), INSERT_TEXT_CHUNK_SIZE):
+        await page.keyboard.insert_text(strategy_content[start:start + INSERT_TEXT_CHUNK_SIZE])
+    return True
+
+async def _paste_via_fill_textarea(page, strategy_content):
+    """方法3: 直接填充隐藏textarea"""
+    _, hidden_textarea = await race_selectors(page, "code_textarea", CODE_TEXTAREA_SELECTORS,
+                                               timeout=3000, state="attached")
+    if not hidden_textarea:
+        return False
+
+    await hidden_textarea.fill(strategy_content)
+    return True
+
+async def _paste_via_clipboard(page, strategy_content):
+    """方法4: 通过剪贴板粘贴"""
+    await page.evaluate("(text) => navigator.clipboard.writeText(text)", strategy_content)
+
+    if not await _focus_and_clear_editor(page):
+        return False
+
+    await page.keyboard.press('Control+v')
+    return True
+
+async def _paste_via_keyboard_type(page, strategy_content):
+    """方法5: 逐字符键盘输入，只用于很短的代码"""
+    if len(strategy_content) > KEYBOARD_TYPE_MAX_CHARS:
+        return False
+    if not await _focus_and_clear_editor(page):
+        return False
+
+    await page.keyboard.type(strategy_content)
+    return True
+
+_PASTE_METHOD_FUNCTIONS = {
+    "ace_api": _paste_via_ace_api,
+    "insert_text": _paste_via_insert_text,
+    "fill_textarea": _paste_via_fill_textarea,
+    "clipboard": _paste_via_clipboard,
+    "keyboard_type": _paste_via_keyboard_type,
+}
+
+async def read_editor_content(page):
+    """读取编辑器中当前的代码（优先Ace，其次隐藏textarea）"""
+    return await page.evaluate("""
+        () => {
+            for (const aceEl of document.querySelectorAll('.ace_editor')) {
+                const editor = (aceEl.env && aceEl.env.editor) || aceEl.ace_editor;
+                if (editor && editor.session) return editor.session.getValue();
+            }
+            const hiddenTextarea = document.getElementById('code');
+            return hiddenTextarea ? hiddenTextarea.value : null;
+        }
+    """)
+
+def _normalize_code(code):
+    """统一换行符和末尾空白，用于回读校验"""
+    return code.replace("\r\n", "\n").replace("\r", "\n").rstrip()
+
+def _document_lines(code):
+    """按Ace的方式把代码拆成行（不含换行符）"""
+    return code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+
+def _document_checksum(lines):
+    return zlib.crc32("\n".join(lines).encode("utf-8", "replace"))
+
+def _remember_editor_document(page, code):
+    lines = _document_lines(code)
+    _editor_documents[page] = (lines, _document_checksum(lines))
+
+def compute_line_changes(old_lines, new_lines):
+    """
+    按行比较新旧代码
+
+    Returns:
+        list: [(起始行, 结束行, 新行列表)]，表示把旧文档的 [起始行, 结束行) 换成新行，按行号升序
+    """
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [(i1, i2, new_lines[j1:j2]) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+async def _paste_via_ace_delta(page, strategy_content):
+    """
+    只把改动的行应用到Ace文档，用于同一个页面连续运行
+
+    编辑器里必须还是上次注入的内容（在页面中按crc32核对），应用后再核对一次结果，
+    整份代码不经过CDP传输也不回读。不可用或改动太多时返回None，由调用方整体替换。
+
+    Returns:
+        int: 改动的处数
+    """
+    record = _editor_documents.get(page)
+    if not record:
+        return None
+
+    old_lines, old_checksum = record
+    new_lines = _document_lines(strategy_content)
+    changes = compute_line_changes(old_lines, new_lines)
+    changed_chars = sum(len(line) + 1 for _, _, lines in changes for line in lines)
+    if changed_chars > len(strategy_content) * DELTA_MAX_CHANGED_RATIO:
+        print(f"改动较多（{changed_chars} 字符），整体替换编辑器内容")
+        return None
+
+    state = await page.evaluate("""
+        ({ changes, checksum, expected }) => {
+            let editor = null;
+            for (const aceEl of document.querySelectorAll('.ace_editor')) {
+                const candidate = (aceEl.env && aceEl.env.editor) || aceEl.ace_editor;
+                if (candidate && candidate.session) { editor = candidate; break; }
+            }
+            const doc = editor && editor.session.doc;
+            if (!doc || !doc.insertFullLines || !doc.removeFullLines) return 'unsupported';
+
+            const table = window.__jqCrcTable || (window.__jqCrcTable = (() => {
+                const t = new Uint32Array(256);
+                for (let n = 0; n < 256; n++) {
+                    let c = n;
+                    for (let k = 0; k < 8; k++) c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+                    t[n] = c >>> 0;
+                }
+                return t;
+            })());
+            const crc32 = (text) => {
+                let crc = 0xFFFFFFFF;
+                for (const byte of new TextEncoder().encode(text)) crc = table[(crc ^ byte) & 0xFF] ^ (crc >>> 8);
+                return (crc ^ 0xFFFFFFFF) >>> 0;
+            };
+
+            // 编辑器被手动改过或页面重新加载过
+            if (crc32(doc.getAllLines().join('\\n')) !== checksum) return 'stale';
+
+            // 从后往前应用，前面改动的行号不受影响；先插入再删除，文档不会被删空
+            for (let i = changes.length - 1; i >= 0; i--) {
+                const [start, end, lines] = changes[i];
+                if (lines.length) doc.insertFullLines(start, lines);
+                if (end > start) doc.removeFullLines(start + lines.length, end + lines.length - 1);
+            }
+
+            // 隐藏textarea同步，和 ace_api 方法一致
+            const hiddenTextarea = document.getElementById('code');
+            if (hiddenTextarea && hiddenTextarea.value !== doc.getValue()) {
+                hiddenTextarea.value = doc.getValue();
+                hiddenTextarea.dispatchEvent(new Event('input', { bubbles: true }));
+                hiddenTextarea.dispatchEvent(new Event('change', { bubbles: true }));
+            }
+            return crc32(doc.getAllLines().join('\\n')) === expected ? 'ok' : 'mismatch';
+        }
+    """, {"changes": changes, "checksum": old_checksum, "expected": _document_checksum(new_lines)})
+
+    if state != "ok":
+        print(f"✗ 增量更新不可用（{state}），整体替换编辑器内容")
+        return None
+
+    _editor_documents[page] = (new_lines, _document_checksum(new_lines))
+    return len(changes)
+
 async def paste_strategy_to_editor(page, strategy_content):
-    """将策略代码粘贴到代码编辑框"""
+    """
+    将策略代码注入代码编辑框
+
+    同一个页面上次注入的内容还在编辑器里时只应用改动的行；
+    否则从上次成功的方法开始尝试，每种方法注入后回读编辑器内容和源码比对，
+    不一致就换下一种方法。
+    """
     try:
         print("正在查找代码编辑框...")
+        expected = _normalize_code(strategy_content)
+        loop = asyncio.get_running_loop()
 
-        # 方法1: 尝试通过隐藏的textarea设置Ace Editor内容
-        print("尝试方法1: 通过隐藏textarea设置Ace Editor内容...")
+        started = loop.time()
         try:
-            result = await page.evaluate("""
-                (code) => {
-                    // 查找隐藏的textarea（通常是Ace Editor的同步目标）
-                    const hiddenTextarea = document.getElementById('code');
-                    if (hiddenTextarea) {
-                        // 设置textarea的值
-                        hiddenTextarea.value = code;
-                        // 触发input事件
-                        hiddenTextarea.dispatchEvent(new Event('input', { bubbles: true }));
-                        hiddenTextarea.dispatchEvent(new Event('change', { bubbles: true }));
-
-                        // 尝试查找Ace Editor实例并更新
-                        const aceEditors = document.querySelectorAll('.ace_editor');
-                        for (let aceEl of aceEditors) {
-                            // Ace Editor通常会在元素上存储editor实例
-                            if (aceEl.env && aceEl.env.editor) {
-                                const editor = aceEl.env.editor;
-                                if (editor.session) {
-                                    editor.session.setValue(code);
-                                    editor.clearSelection();
-                                    return { success: true, method: 'hidden_textarea_and_ace_api' };
-                                }
-                            }
-                            // 尝试其他可能的存储位置
-                            if (aceEl.ace_editor) {
-                                const editor = aceEl.ace_editor;
-                                if (editor.session) {
-                                    editor.session.setValue(code);
-                                    editor.clearSelection();
-                                    return { success: true, method: 'ace_editor_property' };
-                                }
-                            }
-                        }
-                        return { success: true, method: 'hidden_textarea_only' };
-                    }
-                    return { success: false, error: 'Hidden textarea not found' };
-                }
-            """, strategy_content)
-
-            if result['success']:
-                print(f"✓ 方法1成功: {result['method']}")
-                await page.wait_for_timeout(1000)
+            changes = await _paste_via_ace_delta(page, strategy_content)
+            if changes is not None:
+                print(f"✓ 增量更新编辑器 {changes} 处改动，耗时 {loop.time() - started:.2f} 秒")
                 return True
-            else:
-                print(f"✗ 方法1失败: {result['error']}")
-
         except Exception as e:
-            print(f"✗ 方法1执行失败: {e}")
+            print(f"✗ 增量更新失败: {e}")
+        _editor_documents.pop(page, None)
 
-        # 方法2: 直接操作Ace Editor的ace_text-input
-        print("尝试方法2: 通过ace_text-input...")
-        try:
-            ace_inputs = await page.query_selector_all(".ace_text-input")
-            for ace_input in ace_inputs:
-                if await ace_input.is_visible():
-                    await ace_input.click()
-                    await page.wait_for_timeout(500)
-
-                    # 全选并清空
-                    await page.keyboard.press('Control+a')
-                    await page.wait_for_timeout(200)
-                    await page.keyboard.press('Delete')
-                    await page.wait_for_timeout(200)
-
-                    # 输入新代码
-                    await page.keyboard.type(strategy_content)
-                    print("✓ 方法2成功: 通过ace_text-input键盘输入")
-                    await page.wait_for_timeout(1000)
+        for method in ordered_selectors("paste_method", PASTE_METHODS):
+            started = loop.time()
+            try:
+                if not await _PASTE_METHOD_FUNCTIONS[method](page, strategy_content):
+                    print(f"✗ 注入方法 {method} 不可用")
+                    continue
+
+                actual = await read_editor_content(page)
+                if actual is not None and _normalize_code(actual) == expected:
+                    print(f"✓ 注入方法 {method} 成功，校验一致，耗时 {loop.time() - started:.2f} 秒")
+                    remember_selector("paste_method", method)
+                    _remember_editor_document(page, actual)
                     return True
-        except Exception as e:
-            print(f"✗ 方法2执行失败: {e}")
 
-        # 方法3: 直接填充隐藏textarea
-        print("尝试方法3: 直接填充隐藏textarea...")
-        try:
-            hidden_textarea = await page.wait_for_selector("#code", timeout=3000)
-            if hidden_textarea:
-                await hidden_textarea.fill(strategy_content)
-                print("✓ 方法3成功: 直接填充隐藏textarea")
-                await page.wait_for_timeout(1000)
-                return True
-        except:
-            print("✗ 方法3: 未找到隐藏textarea")
+                print(f"✗ 注入方法 {method} 校验不一致，尝试下一种方法")
+            except Exception as e:
+                print(f"✗ 注入方法 {method} 执行失败: {e}")
 
-        # 方法4: 通过剪贴板粘贴
-        print("尝试方法4: 通过剪贴板粘贴...")
-        try:
-            # 设置剪贴板内容
-            await page.evaluate("""
-                (text) => {
-                    navigator.clipboard.writeText(text).then(() => {
-                        console.log('Clipboard set successfully');
-                    }).catch(err => {
-                        console.error('Failed to set clipboard:', err);
-                    });
-                }
-            """, strategy_content)
-
-            # 点击编辑器并粘贴
-            ace_inputs = await page.query_selector_all(".ace_text-input")
-            for ace_input in ace_inputs:
-                if await ace_input.is_visible():
-                    await ace_input.click()
-                    await page.wait_for_timeout(500)
-                    await page.keyboard.press('Control+v')
-                    print("✓ 方法4成功: 通过剪贴板粘贴")
-                    await page.wait_for_timeout(1000)
-                    return True
-        except Exception as e:
-            print(f"✗ 方法4执行失败: {e}")
+            if get_learned_selector("paste_method") == method:
+                forget_selector("paste_method")
 
         print("✗ 所有方法都失败了")
         return False
@@ -155,39 +373,16 @@ async def click_compile_and_run(page):
     try:
         print("正在查找编译运行按钮...")
 
-        # 编译运行按钮的可能选择器（基于您提供的HTML结构）
-        compile_selectors = [
-            "#buildBtn",
-            "#buildBtn span",
-            "#buildBtn .active-text",
-            "span[title='编译运行(Ctrl+Alt+B)']",
-            "span:has-text('编译运行')",
-            "button:has-text('编译运行')",
-            "button:has-text('运行')",
-            "button:has-text('执行')",
-            "button:has-text('Run')",
-            "button:has-text('Compile')",
-            ".compile-btn",
-            ".run-btn",
-            "[data-testid='compile-run']",
-            "[data-testid='run']",
-            "button.run-button",
-            "button.compile-button",
-            ".btn-primary:has-text('运行')",
-            ".btn-success:has-text('运行')",
-            "button.btn.run"
-        ]
-
-        for selector in compile_selectors:
-            try:
-                button = await page.wait_for_selector(selector, timeout=2000)
-                if button:
-                    print(f"✓ 找到编译运行按钮: {selector}")
-                    await button.click()
-                    print("✓ 成功点击编译运行按钮")
-                    return True
-            except:
-                continue
+        # 候选同时等待（通用选择器稍后加入），最多等待 COMPILE_BUTTON_TIMEOUT 毫秒
+        with phase("button_search"):
+            selector, button = await race_selectors(page, "compile_button", COMPILE_BUTTON_SELECTORS,
+                                                    timeout=COMPILE_BUTTON_TIMEOUT,
+                                                    priority=COMPILE_BUTTON_PRIORITY)
+        if button:
+            print(f"✓ 找到编译运行按钮: {selector}")
+            await button.click()
+            print("✓ 成功点击编译运行按钮")
+            return True
 
         print("✗ 未找到编译运行按钮")
         return False
@@ -196,89 +391,475 @@ async def click_compile_and_run(page):
         print(f"✗ 点击编译运行按钮失败: {e}")
         return False
 
-async def read_execution_logs(page):
-    """读取右下角的日志输出"""
+# 运行结束后的日志所在容器
+LOG_CONTAINER_SELECTORS = ["#log", "#daily-logs-container"]
+
+# 读取错误信息时依次检查的日志容器
+LOG_EXTRACT_SELECTORS = [
+    "#daily-logs-tab",
+    "#daily-logs-container",
+    "#log",
+    "#log pre",
+    ".logs-container",
+    ".logs-container pre"
+]
+
+# 运行的硬超时（秒），可通过 --timeout 覆盖
+DEFAULT_RUN_TIMEOUT = 180
+
+# 回测接口返回的终止状态
+TERMINAL_BACKTEST_STATUSES = {"done", "finished", "success", "failed", "error", "cancelled", "canceled"}
+
+# 日志面板出现终止标志后，再这么长时间没有新内容才判定完成（毫秒），
+# 避免 Traceback 分几次追加时在异常行出现之前就结束等待
+RUN_COMPLETION_QUIET_MS = 500
+
+async def arm_run_completion(page, capture):
+    """
+    在点击编译运行之前挂载运行完成检测
+
+    同时监听日志面板的DOM变化和 capture 捕获到的回测接口响应，
+    任意一方判定运行进入终止状态即完成。日志面板只在 Traceback 之后出现完整的异常行、
+    出现"结束."或成功提示，并且安静 RUN_COMPLETION_QUIET_MS 毫秒后才算终止，
+    普通的 log.error 输出不会提前结束等待。
+
+    Returns:
+        dict: 包含 page 和 dom/network 两个future，交给 wait_for_run_completion 等待
+    """
+    loop = asyncio.get_running_loop()
+    network_done = loop.create_future()
+
+    def on_payload(kind, payload):
+        status = payload_status(payload)
+        if status in TERMINAL_BACKTEST_STATUSES and not network_done.done():
+            network_done.set_result(f"network:{status}")
+
+    capture.add_listener(on_payload)
+
+    # 只根据点击之后的DOM变化判断：重复使用的页面上，这次的日志可能和上一次完全相同
+    await page.evaluate("""
+        ({ selectors, quietMs }) => {
+            // 同一个页面上次运行超时或被取消时留下的检测先停掉
+            if (window.__jqRunStop) window.__jqRunStop();
+
+            const findContainers = () => selectors.map(sel => document.querySelector(sel)).filter(el => el);
+            const readText = elements => elements.map(el => el.textContent || '').join('\\n');
+
+            let containers = findContainers();
+            // 点击前已有的内容不参与判断；日志被清空或改写后从头判断
+            let offset = readText(containers).length;
+            const classify = text => {
+                text = text.slice(offset);
+                // 只有 Traceback 之后已经出现异常行才算报错
+                const traceback = text.lastIndexOf('Traceback');
+                if (traceback >= 0 && /^[\\w.]+(Error|Exception)\\b.*$/m.test(text.slice(traceback))) return 'error';
+                if (text.includes('结束.')) return 'finished';
+                if (/运行成功|回测成功|回测完成/.test(text)) return 'success';
+                return null;
+            };
+
+            window.__jqRunDone = new Promise(resolve => {
+                let timer = null;
+                const stop = state => {
+                    observer.disconnect();
+                    if (timer !== null) clearTimeout(timer);
+                    window.__jqRunStop = null;
+                    resolve(state);
+                };
+                const settle = () => {
+                    timer = null;
+                    const state = classify(readText(containers));
+                    if (state) stop(state);
+                };
+                // 每次日志变化都重新计时，日志安静下来之后再确认一次状态
+                const observer = new MutationObserver(records => {
+                    const current = findContainers();
+                    const replaced = current.length !== containers.length ||
+                        current.some((el, i) => el !== containers[i]);
+                    containers = current;
+                    const touched = records.filter(record => containers.some(el => el.contains(record.target)));
+                    if (!replaced && !touched.length) return;
+
+                    const text = readText(containers);
+                    const rewritten = replaced || text.length < offset || touched.some(record =>
+                        record.removedNodes.length > 0 ||
+                        (record.type === 'characterData' && !(record.target.data || '').startsWith(record.oldValue || '')));
+                    if (rewritten) offset = 0;
+
+                    if (timer !== null) clearTimeout(timer);
+                    timer = classify(text) ? setTimeout(settle, quietMs) : null;
+                });
+                observer.observe(document.body, {
+                    childList: true, subtree: true, characterData: true, characterDataOldValue: true
+                });
+                window.__jqRunStop = () => stop(null);
+            });
+        }
+    """, {"selectors": LOG_CONTAINER_SELECTORS, "quietMs": RUN_COMPLETION_QUIET_MS})
+
+    dom_done = asyncio.ensure_future(page.evaluate("() => window.__jqRunDone"))
+
+    def detach(_):
+        capture.remove_listener(on_payload)
+
+    network_done.add_done_callback(detach)
+    return {"page": page, "dom": dom_done, "network": network_done}
+
+async def wait_for_run_completion(completion, timeout=DEFAULT_RUN_TIMEOUT):
+    """等待运行进入终止状态，超过硬超时则返回 'timeout'"""
+    dom_done = completion["dom"]
+    network_done = completion["network"]
     try:
-        print("等待20秒让代码执行...")
-        await page.wait_for_timeout(20000)
+        done, _ = await asyncio.wait({dom_done, network_done}, timeout=timeout,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            return "timeout"
 
-        print("正在读取执行日志...")
+        if dom_done in done:
+            return dom_done.result()
 
-        # 专门查找纯错误信息的JavaScript方法
+        # 接口先返回终止状态时，给日志面板一点时间渲染
+        await asyncio.wait({dom_done}, timeout=2)
+        return network_done.result()
+    except Exception as e:
+        print(f"⚠ 运行状态检测失败: {e}")
+        return "unknown"
+    finally:
+        # 取消未完成的一方，network future 的回调会顺带移除接口响应回调
+        dom_done.cancel()
+        network_done.cancel()
+        # 超时或被取消时页面上的检测还在，断开它，避免重复使用的页面上越积越多
         try:
-            error_logs = await page.evaluate("""
-                () => {
-                    // 查找包含错误的日志容器
-                    const errorContainers = [
-                        '#daily-logs-tab',
-                        '#daily-logs-container',
-                        '#log',
-                        '#log pre',
-                        '.logs-container',
-                        '.logs-container pre'
-                    ];
-
-                    let errorText = '';
-
-                    // 方法1: 从错误容器中查找
-                    errorContainers.forEach(selector => {
-                        const container = document.querySelector(selector);
-                        if (container) {
-                            const text = container.textContent || '';
-
-                            // 提取错误部分
-                            const errorMatch = text.match(/(?:ERROR|错误|Traceback|AttributeError)[\\s\\S]*?(?=\\n\\n|正在加载日志|结束\\.|$)/);
-                            if (errorMatch) {
-                                errorText = errorMatch[0].trim();
-                            }
-                        }
-                    });
-
-                    // 方法2: 如果没找到，从整个页面查找错误
-                    if (!errorText) {
-                        const allElements = document.querySelectorAll('div, pre, code');
-                        for (let el of allElements) {
-                            const text = el.textContent || '';
-
-                            // 查找包含关键错误信息的文本
-                            if (text.includes('Traceback') || text.includes('AttributeError') ||
-                                text.includes('ERROR') || text.includes('错误')) {
-
-                                // 提取错误堆栈
-                                const errorMatch = text.match(/(?:Traceback[\s\S]*?)(?=\\n\\n|$)/);
-                                if (errorMatch) {
-                                    errorText = errorMatch[0].trim();
-                                    break;
-                                }
-                            }
-                        }
-                    }
-
-                    return errorText;
+            await completion["page"].evaluate("() => window.__jqRunStop && window.__jqRunStop()")
+        except Exception:
+            pass
+
+# 每次最多读取的日志字符数（从末尾往前），保证提取开销与页面大小无关
+MAX_LOG_CHARS = 64 * 1024
+
+async def extract_structured_logs(page):
+    """
+    只读取已知的日志容器并解析成结构化结果
+
+    每个容器从最后一个子节点往前读，读满 MAX_LOG_CHARS 为止；
+    按顺序（上次找到错误的容器在前）使用第一个能提取出错误的容器，都没有错误时使用第一个存在的容器。
+
+    Returns:
+        dict: log_parser.parse_execution_log 的结果，另加 container 和 truncated 字段
+    """
+    containers = await page.evaluate("""
+        ({ selectors, maxChars }) => {
+            const found = [];
+            for (const selector of selectors) {
+                const container = document.querySelector(selector);
+                if (!container) continue;
+
+                const parts = [];
+                let length = 0;
+                let node = container.lastChild;
+                while (node && length < maxChars) {
+                    const text = node.textContent || '';
+                    parts.push(text);
+                    length += text.length;
+                    node = node.previousSibling;
                 }
-            """)
+                let text = parts.reverse().join('');
+                const truncated = Boolean(node) || text.length > maxChars;
+                if (text.length > maxChars) text = text.slice(text.length - maxChars);
+                found.push({ selector, text, truncated });
+            }
+            return found;
+        }
+    """, {"selectors": ordered_selectors("log_container", LOG_EXTRACT_SELECTORS), "maxChars": MAX_LOG_CHARS})
 
-            if error_logs and error_logs.strip():
-                print("✓ 成功提取错误信息")
-                return error_logs.strip()
-            else:
-                return "run successful"
+    found = {"selector": None, "text": "", "truncated": False}
+    details = None
+    for container in containers:
+        parsed = parse_execution_log(container["text"])
+        if parsed["error_text"]:
+            found, details = container, parsed
+            remember_selector("log_container", container["selector"])
+            break
+        if details is None:
+            found, details = container, parsed
+    if details is None:
+        details = parse_execution_log("")
+    details["container"] = found["selector"]
+    details["truncated"] = found["truncated"]
+    return details
 
-        except Exception as e:
-            print(f"错误查找失败: {e}")
-            return "错误信息提取失败"
+ALGORITHM_ID = DEFAULT_ALGORITHM_ID
+ALGORITHM_URL = algorithm_url(ALGORITHM_ID)
 
+# 批量模式默认同时运行的页面数（不超过可用的算法数）
+DEFAULT_CONCURRENCY = 3
 
-    except Exception as e:
-        print(f"✗ 读取日志失败: {e}")
-        return f"读取日志时出错: {e}"
+# 任务占用算法的最长时间为运行超时加上这个余量（秒），覆盖打开页面、粘贴和读取日志，
+# 超出后取消任务并归还算法
+SLOT_LEASE_GRACE = 60
 
-async def access_algorithm_page(strategy_file=None):
-    # 检查认证状态文件是否存在
+def check_auth_state_file():
+    """检查认证状态文件是否存在，存在时返回路径"""
     auth_file = get_auth_state_file()
     if not os.path.exists(auth_file):
         print(f"错误: 找不到认证状态文件 {auth_file}")
         print("请先运行 login_save.py 进行登录并保存认证信息")
+        return None
+    return auth_file
+
+async def load_auth_cookies(context, auth_file, profile="isolated"):
+    """加载保存的认证状态到浏览器上下文（数据目录里已有时跳过）"""
+    await ensure_session_cookies(context, auth_file, profile)
+
+# 等待编辑器就绪的最长时间（秒）
+EDITOR_READY_TIMEOUT = 30
+
+async def wait_for_editor_ready(page, timeout=EDITOR_READY_TIMEOUT):
+    """
+    等待 Ace 编辑器实例、#code 和 #buildBtn 全部就绪
+
+    不依赖 networkidle：长轮询或统计请求不会拖住就绪判断。
+
+    Returns:
+        float: 就绪耗时（秒），超时返回 None
+
+    Raises:
+        SessionExpiredError: 页面跳转到了登录页
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    try:
+        handle = await page.wait_for_function("""
+            (loginKeywords) => {
+                const url = location.href.toLowerCase();
+                if (loginKeywords.some(keyword => url.includes(keyword))) return 'login';
+
+                const aceReady = Array.from(document.querySelectorAll('.ace_editor'))
+                    .some(el => (el.env && el.env.editor && el.env.editor.session) ||
+                                (el.ace_editor && el.ace_editor.session));
+                const code = document.getElementById('code');
+                const button = document.getElementById('buildBtn');
+                const buttonReady = button &&
+                    button.getClientRects().length > 0 &&
+                    getComputedStyle(button).visibility !== 'hidden' &&
+                    !button.disabled &&
+                    !button.classList.contains('disabled') &&
+                    button.getAttribute('aria-disabled') !== 'true';
+                if (aceReady && code && buttonReady) return 'ready';
+
+                // 没有编辑器却出现了密码输入框，说明登录已失效
+                if (!aceReady && document.querySelector('input[type=password]')) return 'login';
+                return false;
+            }
+        """, arg=LOGIN_URL_KEYWORDS, timeout=timeout * 1000)
+        state = await handle.json_value()
+    except PlaywrightTimeoutError:
+        print(f"⚠ 编辑器在{timeout}秒内未就绪")
+        return None
+
+    if state == "login":
+        raise SessionExpiredError(f"登录已失效，页面跳转到了 {page.url}")
+
+    return loop.time() - started
+
+async def open_editor_page(page, algorithm_id=ALGORITHM_ID):
+    """在页面中打开算法编辑器并等待编辑器就绪"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    # 访问算法页面，DOM解析完即开始检测就绪，不等待全部网络请求
+    url = algorithm_url(algorithm_id)
+    print(f"正在访问算法页面: {url}")
+    with phase("navigate"):
+        await page.goto(url, wait_until="domcontentloaded")
+    if is_login_url(page.url):
+        raise SessionExpiredError(f"登录已失效，页面跳转到了 {page.url}")
+
+    with phase("editor_ready"):
+        ready_latency = await wait_for_editor_ready(page)
+    if ready_latency is not None:
+        print(f"⏱ 编辑器就绪，页面打开到就绪共 {loop.time() - started:.2f} 秒"
+              f"（DOM加载后 {ready_latency:.2f} 秒）")
+
+    # 已有状态的浏览器不需要点击跳过和不再提示按钮
+    print("✅ 已有登录状态，跳过提示操作")
+    return ready_latency
+
+async def run_strategy_on_page(page, strategy_content, run_timeout=DEFAULT_RUN_TIMEOUT, stream_logs=True,
+                               algorithm_id=ALGORITHM_ID):
+    """
+    在给定页面上打开编辑器、粘贴策略、编译运行并读取结果
+
+    Returns:
+        dict: {"status": success/error/timeout/paste_failed, "log": 日志文本, "elapsed": 秒}
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    try:
+        with phase("goto"):
+            ready_latency = await open_editor_page(page, algorithm_id)
+    except SessionExpiredError as e:
+        return session_expired_result(e, loop.time() - started)
+
+    result = await run_strategy_on_editor(page, strategy_content, run_timeout, stream_logs)
+    result["elapsed"] = loop.time() - started
+    result["ready_latency"] = ready_latency
+    return result
+
+async def run_strategy_with_slot(slot_pool, page, strategy_content, run_timeout=DEFAULT_RUN_TIMEOUT,
+                                 stream_logs=True, lease_timeout=None):
+    """
+    从算法池租用一个 algorithmId 运行策略，结束或超时后归还
+
+    Args:
+        slot_pool: AlgorithmSlotPool
+        lease_timeout: 等待空闲算法的最长时间（秒），None 表示一直等待
+    """
+    try:
+        async with slot_pool.slot(lease_timeout) as algorithm_id:
+            try:
+                result = await asyncio.wait_for(
+                    run_strategy_on_page(page, strategy_content, run_timeout, stream_logs, algorithm_id),
+                    run_timeout + SLOT_LEASE_GRACE)
+            except asyncio.TimeoutError:
+                print(f"✗ 任务超过 {run_timeout + SLOT_LEASE_GRACE:.0f} 秒仍未结束，已取消并归还算法 {algorithm_id}")
+                result = {"status": "timeout", "log": "", "elapsed": run_timeout + SLOT_LEASE_GRACE}
+            result["algorithm_id"] = algorithm_id
+            return result
+    except SlotLeaseTimeout as e:
+        print(f"✗ {e}")
+        return {"status": "slot_timeout", "log": str(e), "elapsed": lease_timeout or 0.0}
+
+async def run_strategy_on_editor(page, strategy_content, run_timeout=DEFAULT_RUN_TIMEOUT, stream_logs=True):
+    """
+    在已经打开编辑器的页面上粘贴策略、编译运行并读取结果
+
+    页面可以重复使用，守护进程用它跳过浏览器启动和页面加载。
+    stream_logs 为真时运行期间实时输出日志面板的新增行。
+    各阶段的耗时记在当前任务的计时器上（见 run_timing）。
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    # 粘贴策略代码到编辑框
+    with phase("paste"):
+        paste_success = await paste_strategy_to_editor(page, strategy_content)
+    if not paste_success:
+        print("✗ 无法粘贴策略代码，退出执行")
+        return {"status": "paste_failed", "log": "", "elapsed": loop.time() - started}
+
+    with phase("compile"):
+        # 点击之前挂载接口捕获和完成检测，保证不会错过很快出现的编译错误
+        capture = ResponseCapture(page).start()
+        completion = await arm_run_completion(page, capture)
+        tail_handler = await start_log_tail(page, LOG_CONTAINER_SELECTORS) if stream_logs else None
+
+        # 直接在编辑页面点击编译运行按钮
+        print("在编辑页面查找编译运行按钮...")
+        compile_success = await click_compile_and_run(page)
+        if not compile_success:
+            print("✗ 无法点击编译运行，尝试其他方法...")
+
+            # 尝试按Ctrl+Alt+B快捷键
+            print("尝试快捷键运行...")
+            await page.keyboard.press('Control+Alt+B')
+            await page.wait_for_timeout(2000)
+
+            # 或者尝试Ctrl+Enter
+            await page.keyboard.press('Control+Enter')
+            await page.wait_for_timeout(2000)
+
+    print(f"等待代码执行完成（最长{run_timeout}秒）...")
+    run_started = loop.time()
+    try:
+        with phase("run"):
+            state = await wait_for_run_completion(completion, run_timeout)
+    finally:
+        if tail_handler:
+            await stop_log_tail(page, tail_handler)
+    print(f"运行状态: {state}，耗时 {loop.time() - run_started:.1f} 秒")
+
+    # 读取执行日志：回测接口返回了完整的日志行时直接解析，否则读取日志面板
+    print("正在读取执行日志...")
+    try:
+        with phase("extract"):
+            await capture.stop()
+            captured_lines = capture.log_lines()
+            if captured_lines:
+                details = parse_execution_log("\n".join(captured_lines))
+                details["container"] = "network"
+                details["truncated"] = False
+            else:
+                details = await extract_structured_logs(page)
+    except Exception as e:
+        print(f"✗ 读取日志失败: {e}")
+        return {"status": "extract_failed", "log": f"读取日志时出错: {e}", "elapsed": loop.time() - started}
+
+    with phase("capture"):
+        capture_name = compute_strategy_hash(strategy_content, "")[:12]
+        capture_dir = await asyncio.to_thread(save_capture, capture.responses, capture_name)
+    if capture_dir:
+        print(f"📁 回测接口响应已保存: {capture_dir}（{len(capture.responses)} 个响应）")
+
+    if details["error_text"]:
+        print("✓ 成功提取错误信息")
+        status = "error"
+    elif state == "timeout":
+        status = "timeout"
+    else:
+        status = "success"
+
+    return {"status": status, "log": details["error_text"] or "run successful",
+            "details": details, "capture": capture_dir, "elapsed": loop.time() - started}
+
+def lookup_cached_result(strategy_content, algorithm_ids=None):
+    """
+    按策略源码和算法池的哈希查找缓存结果
+
+    Returns:
+        (cache_key, result)，未命中时 result 为 None
+    """
+    cache_id = algorithm_pool_id(algorithm_ids) if algorithm_ids else ALGORITHM_ID
+    cache_key = compute_strategy_hash(strategy_content, cache_id)
+    result = get_cached_result(cache_key)
+    if result:
+        print(f"⚡ 命中结果缓存 {cache_key[:12]}，跳过浏览器运行")
+    return cache_key, result
+
+def session_expired_result(error, elapsed=0.0):
+    """登录失效时的运行结果，同时清除Cookie注入记录，下次运行重新注入"""
+    print(f"✗ {error}")
+    print("请重新运行 login_save.py 登录并保存认证信息")
+    invalidate_session()
+    return {"status": "session_expired", "log": str(error), "elapsed": elapsed}
+
+def result_exit_code(result):
+    """单个策略运行的退出码：成功为0，其他情况为1（直接运行和守护进程提交一致）"""
+    return 0 if result and result.get("status") == "success" else 1
+
+def preflight_failed_result(report):
+    """预检失败时的运行结果，不会提交远程运行"""
+    return {"status": "preflight_failed", "log": format_preflight_errors(report),
+            "preflight": report, "elapsed": 0.0}
+
+def print_execution_logs(execution_logs):
+    """打印日志输出"""
+    print("\n" + "="*30)
+    print("log message")
+    print("="*30)
+    print(execution_logs)
+    print("="*30)
+
+async def access_algorithm_page(strategy_file=None, run_timeout=DEFAULT_RUN_TIMEOUT, browser_options=None,
+                                use_cache=True, stream_logs=True, preflight=True, algorithm_ids=None, timing=None):
+    # 各阶段耗时记在这个计时器上；timing 指定是否输出计时记录和 trace（见 parse_cli_args）
+    timer = start_run_timer(os.path.basename(strategy_file) if strategy_file else "page")
+    timing = timing or {}
+
+    # 检查认证状态文件是否存在
+    auth_file = check_auth_state_file()
+    if not auth_file:
         return
 
     # 读取策略文件
@@ -290,87 +871,461 @@ async def access_algorithm_page(strategy_file=None):
         print("⚠ 未提供策略文件，将只访问页面不执行代码")
         strategy_content = None
 
-    async with async_playwright() as p:
-        # 创建独立的浏览器实例
-        context = await create_isolated_browser(p, "chromium")
-        print("🔒 使用独立浏览器实例，与日常浏览器完全分离")
+    # 本地预检，有硬错误就不启动浏览器
+    if strategy_content and preflight:
+        with phase("preflight"):
+            report = check_strategy_source(strategy_content, strategy_file)
+        print_preflight_report(report)
+        if not report["ok"]:
+            result = preflight_failed_result(report)
+            print_execution_logs(result["log"])
+            await record_run_async(result, strategy_file, strategy_content)
+            return result
 
-        # 加载保存的认证状态
-        with open(auth_file, "r", encoding="utf-8") as f:
-            state = json.load(f)
+    # 同一份代码之前运行过，直接返回缓存结果
+    algorithm_ids = load_algorithm_ids(algorithm_ids)
+    cache_key = None
+    if strategy_content and use_cache:
+        with phase("cache_lookup"):
+            cache_key, cached = lookup_cached_result(strategy_content, algorithm_ids)
+        if cached:
+            print_execution_logs(cached["log"])
+            await record_run_async(cached, strategy_file, strategy_content)
+            return cached
+    slot_pool = AlgorithmSlotPool(algorithm_ids)
 
-        await context.add_cookies(state.get("cookies", []))
+    async with async_playwright() as p:
+        with phase("launch"):
+            # 创建独立的浏览器实例，或连接已在运行的调试Chrome
+            context, owns_context = await open_browser_context(p, browser_options)
+            if owns_context:
+                print("🔒 使用独立浏览器实例，与日常浏览器完全分离")
+
+            await load_auth_cookies(context, auth_file, "isolated" if owns_context else "attach")
 
-        # 创建新页面
-        page = await context.new_page()
+            # 创建新页面
+            page = await context.new_page()
 
+        tracing = timing.get("playwright_trace") and await start_playwright_trace(context)
+        result = None
         try:
-            # 访问算法页面
-            algorithm_url = "https://joinquant.com/algorithm/index/edit?algorithmId=c639f7b5fba58e5d1d18c693e713e87b"
-            print(f"正在访问算法页面: {algorithm_url}")
+            # 如果有策略代码，执行相关操作
+            if strategy_content:
+                # 其他终端或守护进程正在用的算法会被跳过，最多等待一次运行的时间
+                result = await run_strategy_with_slot(slot_pool, page, strategy_content, run_timeout,
+                                                      stream_logs, lease_timeout=run_timeout)
+                result["phases"] = timer.durations()
+                if result["status"] not in ("paste_failed", "slot_timeout"):
+                    print_execution_logs(result["log"])
+                if cache_key:
+                    put_cached_result(cache_key, result)
+                return result
 
-            await page.goto(algorithm_url)
+            await open_editor_page(page, algorithm_ids[0])
 
-            # 等待页面加载
-            await page.wait_for_load_state("networkidle")
+        except SessionExpiredError as e:
+            result = session_expired_result(e)
+            return result
+        except Exception as e:
+            print(f"✗ 执行过程中出现错误: {e}")
 
-            print("页面加载完成，等待3秒以便完全渲染...")
-            await page.wait_for_timeout(3000)
+        finally:
+            if result:
+                await record_run_async(result, strategy_file, strategy_content)
+            if tracing:
+                await stop_playwright_trace(context, timing["playwright_trace"])
 
-            # 已有状态的浏览器不需要点击跳过和不再提示按钮
-            print("✅ 已有登录状态，跳过提示操作")
+            # 自动关闭浏览器；连接的调试Chrome只关闭本次打开的标签页
+            with phase("close"):
+                await page.close()
+                if owns_context:
+                    await context.close()
 
-            # 如果有策略代码，执行相关操作
-            if strategy_content:
-                # 粘贴策略代码到编辑框
-                paste_success = await paste_strategy_to_editor(page, strategy_content)
-                if not paste_success:
-                    print("✗ 无法粘贴策略代码，退出执行")
-                    return
+            if timing:
+                report_run_timing(timer, timing, file=strategy_file, status=result and result["status"])
+                if timing.get("trace"):
+                    write_trace_file([timer], timing["trace"])
 
-                # 等待一下确保代码已经粘贴
-                await page.wait_for_timeout(1000)
+async def watch_strategy(strategy_file, run_timeout=DEFAULT_RUN_TIMEOUT, browser_options=None, use_cache=True,
+                         stream_logs=True, preflight=True, algorithm_ids=None, timing=None):
+    """
+    监听模式：浏览器和编辑器页面一直开着，策略文件每次保存后在同一个页面上重新运行
 
-                # 直接在编辑页面点击编译运行按钮
-                print("在编辑页面查找编译运行按钮...")
-                compile_success = await click_compile_and_run(page)
-                if not compile_success:
-                    print("✗ 无法点击编译运行，尝试其他方法...")
+    监听期间独占一个算法；规范化后内容没有变化的保存直接跳过，
+    所以每次重新运行只花粘贴和远程运行的时间。按 Ctrl+C 退出。
+    """
+    auth_file = check_auth_state_file()
+    if not auth_file:
+        return
 
-                    # 尝试按Ctrl+Alt+B快捷键
-                    print("尝试快捷键运行...")
-                    await page.keyboard.press('Control+Alt+B')
-                    await page.wait_for_timeout(2000)
+    timing = timing or {}
+    slot_pool = AlgorithmSlotPool(load_algorithm_ids(algorithm_ids))
+    watcher = FileWatcher(strategy_file)
 
-                    # 或者尝试Ctrl+Enter
-                    await page.keyboard.press('Control+Enter')
-                    await page.wait_for_timeout(2000)
+    async with async_playwright() as p:
+        context, owns_context = await open_browser_context(p, browser_options)
+        await load_auth_cookies(context, auth_file, "isolated" if owns_context else "attach")
+        page = None
 
-                # 读取执行日志
-                execution_logs = await read_execution_logs(page)
+        async def reopen_page():
+            nonlocal page
+            if page:
+                await page.close()
+            page = await context.new_page()
+            await open_editor_page(page, algorithm_id)
 
-                print("\n" + "="*30)
-                print("log message")
-                print("="*30)
-                print(execution_logs)
-                print("="*30)
+        try:
+            algorithm_id = await slot_pool.lease(timeout=run_timeout)
+            await reopen_page()
+            watch_mode = watcher.start()
+            print(f"👀 正在监听 {strategy_file}（{watch_mode}），保存后自动重新运行，Ctrl+C 退出")
 
+            last_source = None
+            first_run = True
+            while True:
+                if not first_run:
+                    await watcher.wait_for_change()
+                first_run = False
 
-        except Exception as e:
-            print(f"✗ 执行过程中出现错误: {e}")
+                timer = start_run_timer(os.path.basename(strategy_file))
+                strategy_content = await read_strategy_file(strategy_file)
+                if not strategy_content:
+                    continue
+                source = normalize_strategy_source(strategy_content)
+                if source == last_source:
+                    print("⏩ 内容没有变化，跳过")
+                    continue
+
+                print(f"\n🔁 {time.strftime('%H:%M:%S')} 检测到保存，重新运行")
+                result = None
+                if preflight:
+                    with phase("preflight"):
+                        report = check_strategy_source(strategy_content, strategy_file)
+                    print_preflight_report(report)
+                    if not report["ok"]:
+                        result = preflight_failed_result(report)
+
+                cache_key = None
+                if not result and use_cache:
+                    with phase("cache_lookup"):
+                        cache_key, result = lookup_cached_result(strategy_content, slot_pool.algorithm_ids)
 
+                if not result:
+                    try:
+                        result = await asyncio.wait_for(
+                            run_strategy_on_editor(page, strategy_content, run_timeout, stream_logs),
+                            run_timeout + SLOT_LEASE_GRACE)
+                    except asyncio.TimeoutError:
+                        result = {"status": "timeout", "log": "", "elapsed": run_timeout + SLOT_LEASE_GRACE}
+                    if cache_key:
+                        put_cached_result(cache_key, result)
+
+                if result["status"] != "paste_failed":
+                    print_execution_logs(result["log"])
+                result["algorithm_id"] = algorithm_id
+                await record_run_async(result, strategy_file, strategy_content)
+                if result["status"] in CACHEABLE_STATUSES or result["status"] == "preflight_failed":
+                    # 超时、粘贴失败等偶发情况下同样的内容再次保存时仍然重新运行
+                    last_source = source
+                if timing:
+                    report_run_timing(timer, timing, file=strategy_file, status=result["status"])
+                else:
+                    print_timing_summary(timer)
+
+                # 页面出问题（超时、粘贴失败、被登出）时重新打开，下一次保存在新页面上运行
+                if result["status"] in ("timeout", "paste_failed", "extract_failed") or is_login_url(page.url):
+                    await reopen_page()
+
+        except SlotLeaseTimeout as e:
+            print(f"✗ {e}")
+        except SessionExpiredError as e:
+            session_expired_result(e)
         finally:
-            # 自动关闭浏览器
-            if 'browser' in locals():
-                await browser.close()
+            watcher.close()
+            await slot_pool.close()
+            if page:
+                await page.close()
+            if owns_context:
+                await context.close()
+
+def expand_strategy_files(patterns):
+    """展开文件列表和通配符，去重并保持顺序"""
+    strategy_files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            print(f"⚠ 没有匹配的策略文件: {pattern}")
+        for path in matches:
+            path = os.path.abspath(path)
+            if path not in strategy_files:
+                strategy_files.append(path)
+    return strategy_files
+
+def write_batch_summary(summary_file, summary):
+    """写出批量运行的汇总JSON（先写临时文件再替换，读取方不会读到半个文件）"""
+    tmp_file = summary_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, summary_file)
+
+async def run_strategy_batch(strategy_files, concurrency=DEFAULT_CONCURRENCY,
+                             run_timeout=DEFAULT_RUN_TIMEOUT, summary_file=None, browser_options=None,
+                             use_cache=True, preflight=True, algorithm_ids=None, timing=None,
+                             sources=None, on_result=None):
+    """
+    在同一个浏览器上下文中并发运行多个策略文件
+
+    Args:
+        strategy_files: 策略文件路径列表；给出 sources 时是 sources 中的名字
+        concurrency: 同时打开的页面数，不超过可用的算法数
+        run_timeout: 单个策略的运行硬超时（秒）
+        summary_file: 汇总JSON的输出路径，每完成一个文件就更新一次
+        browser_options: 传给 open_browser_context 的参数（attach、headless、block_resources）
+        use_cache: 是否使用结果缓存，全部命中时不会启动浏览器
+        preflight: 是否先用进程池并行预检所有文件，有硬错误的文件不提交远程运行
+        algorithm_ids: 可用的 algorithmId 列表，每个任务租用其中一个，默认按 load_algorithm_ids 读取
+        timing: 计时输出选项（见 parse_cli_args），每个文件一行计时记录，trace 中每个文件一条轨道
+        sources: {名字: 策略源码}，直接运行内存中的代码，不读文件（参数扫描用）
+        on_result: 每完成一个文件调用一次，参数为该文件的结果
+
+    Returns:
+        dict: 汇总结果
+    """
+    auth_file = check_auth_state_file()
+    if not auth_file:
+        return None
+
+    # 批量本身的计时器记录预检、启动和关闭，每个文件另有自己的计时器
+    batch_timer = start_run_timer("batch")
+    timers = [batch_timer]
+    timing = timing or {}
+
+    # 每个算法同一时间只能运行一个策略，页面数超过算法数没有意义
+    algorithm_ids = load_algorithm_ids(algorithm_ids)
+    if concurrency > len(algorithm_ids):
+        print(f"⚠ 只有 {len(algorithm_ids)} 个可用算法，并发数从 {concurrency} 降为 {len(algorithm_ids)}")
+        concurrency = len(algorithm_ids)
+
+    loop = asyncio.get_running_loop()
+    batch_started = loop.time()
+    summary = {"total": len(strategy_files), "concurrency": concurrency,
+               "algorithm_ids": algorithm_ids, "counts": {}, "results": []}
+    # 失败的运行按错误标识分组，汇总时一眼看出有几种不同的错误
+    error_index = ErrorIndex()
+
+    async def report(result, strategy_content=None):
+        error = error_index.add(result, strategy_content)
+        await record_run_async(result, content=strategy_content)
+        result["elapsed"] = round(result["elapsed"], 2)
+        summary["results"].append(result)
+        summary["counts"][result["status"]] = summary["counts"].get(result["status"], 0) + 1
+
+        print(f"📄 [{len(summary['results'])}/{len(strategy_files)}] {result['status']:<8} "
+              f"{result['elapsed']:>7.1f}s  {result['file']}{'  (cached)' if result.get('cached') else ''}"
+              f"{'  [' + error['signature'][:8] + ']' if error else ''}")
+        if summary_file:
+            write_batch_summary(summary_file, summary)
+        if on_result:
+            on_result(result)
+
+    preflight_reports = {}
+    if preflight:
+        with phase("preflight"):
+            if sources is not None:
+                reports = await loop.run_in_executor(
+                    None, check_strategy_sources, {name: sources[name] for name in strategy_files})
+            else:
+                reports = await loop.run_in_executor(None, check_strategy_files, strategy_files)
+        preflight_reports = {report["file"]: report for report in reports}
+
+    # 先处理预检失败、读取失败和缓存命中的文件，剩下的才需要浏览器
+    pending = []
+    for strategy_file in strategy_files:
+        if sources is not None:
+            strategy_content = sources[strategy_file]
+        else:
+            strategy_content = await read_strategy_file(strategy_file)
+        if not strategy_content:
+            await report({"file": strategy_file, "status": "read_failed", "log": "", "elapsed": 0.0})
+            continue
+
+        preflight_report = preflight_reports.get(strategy_file)
+        if preflight_report and not preflight_report["ok"]:
+            print_preflight_report(preflight_report)
+            await report({"file": strategy_file, **preflight_failed_result(preflight_report)}, strategy_content)
+            continue
+
+        cache_key = None
+        if use_cache:
+            cache_key, cached = lookup_cached_result(strategy_content, algorithm_ids)
+            if cached:
+                await report({"file": strategy_file, **cached}, strategy_content)
+                continue
+        pending.append((strategy_file, strategy_content, cache_key))
+
+    if pending:
+        async with async_playwright() as p:
+            # 浏览器只启动一次，所有策略共用
+            with phase("launch"):
+                context, owns_context = await open_browser_context(p, browser_options)
+                await load_auth_cookies(context, auth_file, "isolated" if owns_context else "attach")
+            tracing = timing.get("playwright_trace") and await start_playwright_trace(context)
+
+            semaphore = asyncio.Semaphore(concurrency)
+            slot_pool = AlgorithmSlotPool(algorithm_ids)
+
+            async def run_one(strategy_file, strategy_content, cache_key):
+                async with semaphore:
+                    # 每个任务在自己的上下文里，计时互不干扰
+                    timer = start_run_timer(os.path.basename(strategy_file))
+                    timers.append(timer)
+                    page = await context.new_page()
+                    try:
+                        # 多个页面同时运行时实时日志会交错，批量模式只输出每个文件的结果
+                        result = await run_strategy_with_slot(slot_pool, page, strategy_content, run_timeout,
+                                                              stream_logs=False)
+                        if cache_key:
+                            put_cached_result(cache_key, result)
+                    except Exception as e:
+                        result = {"status": "exception", "log": str(e), "elapsed": 0.0}
+                    finally:
+                        await page.close()
+
+                    result["phases"] = timer.durations()
+                    if "log" in timing:
+                        emit_timing_record(timer.record(file=strategy_file, status=result["status"]), timing["log"])
+                    return {"file": strategy_file, **result}, strategy_content
+
+            try:
+                tasks = [asyncio.ensure_future(run_one(*job)) for job in pending]
+                for task in asyncio.as_completed(tasks):
+                    await report(*await task)
+            finally:
+                if tracing:
+                    await stop_playwright_trace(context, timing["playwright_trace"])
+                if owns_context:
+                    with phase("close"):
+                        await context.close()
+
+    summary["elapsed"] = round(loop.time() - batch_started, 2)
+    summary["distinct_errors"] = len(error_index.groups)
+    summary["errors"] = error_index.to_list()
+    if timing:
+        report_run_timing(batch_timer, timing, total_files=len(strategy_files))
+        if timing.get("trace"):
+            write_trace_file(timers, timing["trace"])
+    if summary_file:
+        write_batch_summary(summary_file, summary)
+        print(f"📊 汇总结果已写入: {summary_file}")
+
+    print("\n" + "="*30)
+    print("batch summary")
+    print("="*30)
+    if error_index.groups:
+        print_error_index(error_index)
+    print(json.dumps({k: v for k, v in summary.items() if k not in ("results", "errors")}, ensure_ascii=False))
+    print("="*30)
+    return summary
+
+def parse_cli_args(argv):
+    """解析命令行参数，返回 (策略文件/通配符列表, 选项字典)"""
+    strategy_patterns = []
+    options = {"run_timeout": DEFAULT_RUN_TIMEOUT, "browser_options": {}}
+    value_options = {
+        "--timeout": ("run_timeout", float),
+        "--concurrency": ("concurrency", int),
+        "--summary": ("summary_file", str),
+        "--algorithms": ("algorithm_ids", str),
+    }
+
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        name, _, value = arg.partition("=")
+        if name in value_options:
+            key, convert = value_options[name]
+            if not value:
+                if not args:
+                    print(f"⚠ 参数 {name} 缺少取值")
+                    continue
+                value = args.pop(0)
+            options[key] = convert(value)
+        elif name in ("--timing", "--trace", "--playwright-trace"):
+            # --timing 追加计时记录到 ~/.jq-run/timings.jsonl，--timing=FILE 写到指定文件，--timing=- 输出到终端；
+            # --trace 导出 Perfetto 可以打开的阶段时间线，--playwright-trace 导出 Playwright trace（zip）
+            key = {"--timing": "log", "--trace": "trace", "--playwright-trace": "playwright_trace"}[name]
+            if not value and name != "--timing":
+                if not args:
+                    print(f"⚠ 参数 {name} 缺少取值")
+                    continue
+                value = args.pop(0)
+            options.setdefault("timing", {})[key] = value or None
+        elif arg == "--headless":
+            # 无头模式默认同时开启资源拦截，可用 --no-block 关闭
+            options["browser_options"].setdefault("block_resources", True)
+            options["browser_options"]["headless"] = True
+        elif arg == "--watch":
+            options["watch"] = True
+        elif arg == "--no-preflight":
+            options["preflight"] = False
+        elif arg == "--no-tail":
+            options["stream_logs"] = False
+        elif arg == "--json":
+            options["print_json"] = True
+        elif arg == "--no-cache":
+            options["use_cache"] = False
+        elif arg == "--attach":
+            options["browser_options"]["attach"] = True
+        elif arg == "--block-resources":
+            options["browser_options"]["block_resources"] = True
+        elif arg == "--no-block":
+            options["browser_options"]["block_resources"] = False
+        elif arg.startswith("--"):
+            print(f"⚠ 忽略未知参数: {arg}")
+        else:
+            strategy_patterns.append(arg)
+
+    return strategy_patterns, options
 
 if __name__ == "__main__":
-    strategy_file = None
-    if len(sys.argv) > 1:
-        strategy_file = sys.argv[1]
+    if sys.argv[1:2] == ["history"]:
+        from run_history import main as history_main
+        sys.exit(history_main(sys.argv[2:]))
+
+    strategy_patterns, options = parse_cli_args(sys.argv[1:])
+    print_json = options.pop("print_json", False)
+    batch_options = {k: options.pop(k) for k in ("concurrency", "summary_file") if k in options}
+    strategy_files = expand_strategy_files(strategy_patterns)
+
+    if options.pop("watch", False):
+        if len(strategy_files) != 1:
+            print("❌ 监听模式只支持一个策略文件")
+            sys.exit(1)
+        try:
+            asyncio.run(watch_strategy(strategy_files[0], **options))
+        except KeyboardInterrupt:
+            print("\n👋 已停止监听")
+        sys.exit(0)
+
+    if len(strategy_files) > 1 or batch_options:
+        print(f"批量模式: {len(strategy_files)} 个策略文件")
+        options.pop("stream_logs", None)
+        summary = asyncio.run(run_strategy_batch(strategy_files, **batch_options, **options))
+        sys.exit(0 if summary and summary["counts"].get("success", 0) == summary["total"] else 1)
+
+    strategy_file = strategy_files[0] if strategy_files else None
+    if strategy_file:
         print(f"使用策略文件: {strategy_file}")
     else:
         print("未提供策略文件参数")
-        print("用法: python access_algorithm.py [strategy_file.py]")
+        print("用法: python access_algorithm.py [strategy_file.py ...|'strategies/*.py'] "
+              "[--timeout 秒] [--concurrency N] [--summary summary.json] [--algorithms id1,id2] "
+              "[--attach] [--headless] [--block-resources|--no-block] [--no-cache] [--no-tail] [--no-preflight] [--json] "
+              "[--timing[=FILE]] [--trace FILE] [--playwright-trace FILE.zip] [--watch]")
 
-    asyncio.run(access_algorithm_page(strategy_file))
+    result = asyncio.run(access_algorithm_page(strategy_file, **options))
+    if print_json and result:
+        # 结构化结果单独占一行，方便其他工具直接解析
+        print(json.dumps(result, ensure_ascii=False))
+    if strategy_file:
+        sys.exit(result_exit_code(result))
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+算法编辑器租用池：每个 algorithmId 同一时间只能运行一个策略，
+多个任务并发时各自租用一个空闲的 algorithmId，结束后归还，避免互相覆盖代码
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+from collections import deque
+from path_config import get_algorithm_ids_file, get_algorithm_lock_dir
+
+try:
+    import fcntl
+except ImportError:
+    # 没有 fcntl 的平台只在进程内互斥
+    fcntl = None
+
+# 默认使用的算法
+DEFAULT_ALGORITHM_ID = "c639f7b5fba58e5d1d18c693e713e87b"
+ALGORITHM_URL_PATH = "/algorithm/index/edit?algorithmId={algorithm_id}"
+
+# 聚宽网站地址，可用环境变量 JQ_BASE_URL 指向本地的模拟服务器（见 mock_joinquant_server.py）
+DEFAULT_BASE_URL = "https://joinquant.com"
+BASE_URL_ENV = "JQ_BASE_URL"
+
+# 环境变量，逗号分隔的 algorithmId 列表
+ALGORITHM_IDS_ENV = "JQ_ALGORITHM_IDS"
+
+# 所有 algorithmId 都被其他进程占用时，重新检查的间隔（秒）
+SLOT_POLL_INTERVAL = 1.0
+
+class SlotLeaseTimeout(Exception):
+    """在限定时间内没有租到空闲的 algorithmId"""
+
+def algorithm_url(algorithm_id):
+    """算法编辑页面的地址"""
+    base_url = os.environ.get(BASE_URL_ENV) or DEFAULT_BASE_URL
+    return base_url.rstrip("/") + ALGORITHM_URL_PATH.format(algorithm_id=algorithm_id)
+
+def _split_ids(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+def load_algorithm_ids(algorithm_ids=None):
+    """
+    读取可用的 algorithmId 列表
+
+    优先级：参数（命令行 --algorithms）> 环境变量 JQ_ALGORITHM_IDS >
+    ~/.jq-run/algorithms.json 的 {"algorithm_ids": [...]} > 默认算法
+    """
+    if isinstance(algorithm_ids, str):
+        algorithm_ids = _split_ids(algorithm_ids)
+    if not algorithm_ids and os.environ.get(ALGORITHM_IDS_ENV):
+        algorithm_ids = _split_ids(os.environ[ALGORITHM_IDS_ENV])
+    if not algorithm_ids:
+        try:
+            with open(get_algorithm_ids_file(), "r", encoding="utf-8") as f:
+                algorithm_ids = json.load(f).get("algorithm_ids", [])
+        except (OSError, ValueError, AttributeError):
+            algorithm_ids = []
+    # 去重并保持顺序
+    return list(dict.fromkeys(algorithm_ids)) or [DEFAULT_ALGORITHM_ID]
+
+def algorithm_pool_id(algorithm_ids):
+    """
+    结果缓存使用的算法标识
+
+    同一个池里的算法应使用相同的回测设置，结果与具体租到哪一个无关，
+    所以按整个池计算；只有一个算法时就是它本身的 algorithmId。
+    """
+    return ",".join(sorted(algorithm_ids))
+
+def _lock_algorithm(algorithm_id):
+    """加跨进程的文件锁，被其他进程占用时返回None"""
+    if fcntl is None:
+        return -1
+
+    os.makedirs(get_algorithm_lock_dir(), exist_ok=True)
+    fd = os.open(os.path.join(get_algorithm_lock_dir(), f"{algorithm_id}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+
+    # 记下占用的进程，方便排查
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode("ascii"))
+    return fd
+
+def _unlock_algorithm(fd):
+    if fcntl is None or fd < 0:
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+class AlgorithmSlotPool:
+    """
+    algorithmId 租用池
+
+    进程内按先来先得分配空闲的 algorithmId；同时给每个租出的 algorithmId 加文件锁，
+    另一个终端或守护进程正在用的算法会被跳过。进程退出时文件锁自动释放。
+    """
+
+    def __init__(self, algorithm_ids):
+        self.algorithm_ids = list(dict.fromkeys(algorithm_ids))
+        self._free = deque(self.algorithm_ids)
+        self._locks = {}
+        self._changed = asyncio.Condition()
+
+    def __len__(self):
+        return len(self.algorithm_ids)
+
+    @property
+    def leased(self):
+        """当前租出的 algorithmId"""
+        return list(self._locks)
+
+    def _try_take(self):
+        for _ in range(len(self._free)):
+            algorithm_id = self._free.popleft()
+            fd = _lock_algorithm(algorithm_id)
+            if fd is not None:
+                self._locks[algorithm_id] = fd
+                return algorithm_id
+            # 被其他进程占用，放回队尾下次再试
+            self._free.append(algorithm_id)
+        return None
+
+    async def lease(self, timeout=None):
+        """
+        租用一个空闲的 algorithmId
+
+        Raises:
+            SlotLeaseTimeout: timeout 秒内没有空闲的 algorithmId
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        async with self._changed:
+            while True:
+                algorithm_id = self._try_take()
+                if algorithm_id:
+                    return algorithm_id
+
+                wait = SLOT_POLL_INTERVAL
+                if deadline is not None:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise SlotLeaseTimeout(f"{timeout}秒内没有空闲的算法（共{len(self)}个）")
+                    wait = min(wait, remaining)
+                try:
+                    await asyncio.wait_for(self._changed.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, algorithm_id):
+        """归还 algorithmId"""
+        fd = self._locks.pop(algorithm_id, None)
+        if fd is None:
+            return
+        _unlock_algorithm(fd)
+        async with self._changed:
+            self._free.append(algorithm_id)
+            self._changed.notify()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, timeout=None):
+        """租用一个 algorithmId，退出时（包括异常和取消）自动归还"""
+        algorithm_id = await self.lease(timeout)
+        try:
+            yield algorithm_id
+        finally:
+            await self.release(algorithm_id)
+
+    async def close(self):
+        """归还所有租出的 algorithmId"""
+        for algorithm_id in self.leased:
+            await self.release(algorithm_id)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+端到端性能测试：对本地模拟的聚宽编辑器（mock_joinquant_server.py）运行完整流程
+（启动浏览器 → 打开页面 → 粘贴 → 编译运行 → 提取日志），
+按策略大小和并发数统计各阶段耗时的 p50/p95，结果写入JSON便于长期对比
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from mock_joinquant_server import DEFAULT_MOCK_CONFIG, start_mock_server
+from path_config import JQ_RUN_DIR_ENV, get_auth_state_file
+from algorithm_slots import BASE_URL_ENV
+from access_algorithm import access_algorithm_page, run_strategy_batch
+
+# 默认的测试矩阵
+DEFAULT_SIZES = [100, 1000, 10000]
+DEFAULT_CONCURRENCY_LEVELS = [1, 2, 4]
+DEFAULT_RUNS = 5
+
+# 统计的阶段，total 为单个任务的总耗时
+BENCHMARK_PHASES = ["launch", "goto", "paste", "compile", "run", "extract", "total"]
+
+def generate_strategy(line_count):
+    """生成大约 line_count 行、能通过预检的策略代码"""
+    lines = [
+        "def initialize(context):",
+        "    g.security = '000001.XSHE'",
+        "    set_benchmark('000300.XSHG')",
+        "    run_daily(market_open, time='every_bar')",
+        "",
+        "def market_open(context):",
+        "    log.info(helper_0(1))",
+        "",
+    ]
+    index = 0
+    while len(lines) < line_count:
+        lines += [f"def helper_{index}(value):", f"    return value + {index}", ""]
+        index += 1
+    return "\n".join(lines) + "\n"
+
+def percentile(values, p):
+    """最近秩法计算分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def summarize_phases(results):
+    """按阶段汇总 p50/p95/平均值（秒）"""
+    stats = {}
+    for phase in BENCHMARK_PHASES:
+        if phase == "total":
+            values = [result["elapsed"] for result in results]
+        else:
+            values = [result["phases"][phase] for result in results if phase in result.get("phases", {})]
+        if values:
+            stats[phase] = {"p50": round(percentile(values, 50), 4), "p95": round(percentile(values, 95), 4),
+                            "mean": round(sum(values) / len(values), 4), "count": len(values)}
+    return stats
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+async def run_level(strategy_files, concurrency, run_timeout, browser_options, verbose):
+    """
+    运行一组测试
+
+    并发数为1时逐个调用 access_algorithm_page（每次都启动浏览器）；
+    否则用 run_strategy_batch 在一个浏览器里并发运行，每个并发占一个模拟算法。
+    """
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    with output:
+        if concurrency == 1:
+            results = []
+            for strategy_file in strategy_files:
+                result = await access_algorithm_page(strategy_file, run_timeout, dict(browser_options),
+                                                     use_cache=False, stream_logs=False,
+                                                     algorithm_ids=["bench0"])
+                results.append(result or {"status": "failed", "elapsed": 0.0})
+        else:
+            summary = await run_strategy_batch(strategy_files, concurrency, run_timeout,
+                                               browser_options=dict(browser_options), use_cache=False,
+                                               algorithm_ids=[f"bench{i}" for i in range(concurrency)])
+            results = summary["results"] if summary else []
+    wall = loop.time() - started
+    return results, wall
+
+async def run_benchmark(sizes=DEFAULT_SIZES, concurrency_levels=DEFAULT_CONCURRENCY_LEVELS, runs=DEFAULT_RUNS,
+                        run_timeout=60, headless=True, mock_config=None, verbose=False):
+    """
+    启动模拟服务器并跑完整个测试矩阵
+
+    登录状态和浏览器数据放在临时目录（JQ_RUN_DIR），不会用到也不会改动 ~/.jq-run；
+    结果缓存关闭，每次都真正运行。
+    """
+    mock_config = {**DEFAULT_MOCK_CONFIG, **(mock_config or {})}
+    server = start_mock_server(**mock_config)
+    work_dir = tempfile.mkdtemp(prefix="jq-bench-")
+    saved_env = {name: os.environ.get(name) for name in (BASE_URL_ENV, JQ_RUN_DIR_ENV)}
+    os.environ[BASE_URL_ENV] = server.url
+    os.environ[JQ_RUN_DIR_ENV] = os.path.join(work_dir, "jq-run")
+    print(f"🧪 模拟服务器: {server.url}")
+    print(f"📁 临时数据目录: {work_dir}")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "commit": _git_commit()},
+        "config": {"sizes": sizes, "concurrency_levels": concurrency_levels, "runs": runs,
+                   "run_timeout": run_timeout, "headless": headless, "mock": mock_config},
+        "results": [],
+    }
+
+    try:
+        # 模拟服务器不校验登录，空的认证文件即可通过检查
+        os.makedirs(os.path.dirname(get_auth_state_file()), exist_ok=True)
+        with open(get_auth_state_file(), "w", encoding="utf-8") as f:
+            json.dump({"cookies": []}, f)
+
+        browser_options = {"headless": headless}
+        for size in sizes:
+            content = generate_strategy(size)
+            for concurrency in concurrency_levels:
+                strategy_files = []
+                for index in range(runs):
+                    # 每个文件内容不同，避免任何一层按内容去重
+                    strategy_file = os.path.join(work_dir, f"strategy_{size}_{concurrency}_{index}.py")
+                    with open(strategy_file, "w", encoding="utf-8") as f:
+                        f.write(content + f"# run {index}\n")
+                    strategy_files.append(strategy_file)
+
+                print(f"▶ {size} 行 × 并发 {concurrency} × {runs} 次...", flush=True)
+                results, wall = await run_level(strategy_files, concurrency, run_timeout, browser_options, verbose)
+                statuses = {}
+                for result in results:
+                    statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+
+                level = {"size_lines": size, "size_chars": len(content), "concurrency": concurrency,
+                         "runs": len(results), "statuses": statuses, "wall": round(wall, 4),
+                         "throughput": round(len(results) / wall, 4) if wall > 0 else None,
+                         "phases": summarize_phases(results)}
+                report["results"].append(level)
+                print_level(level)
+    finally:
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return report
+
+def print_level(level):
+    """打印一组测试的结果"""
+    print(f"  状态: {level['statuses']}  总耗时 {level['wall']:.2f}s  吞吐 {level['throughput'] or 0:.2f} 个/秒")
+    for phase, stats in level["phases"].items():
+        print(f"  {phase:<8} p50 {stats['p50']:>8.3f}s  p95 {stats['p95']:>8.3f}s")
+
+def _parse_int_list(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def main():
+    options = {}
+    mock_config = {}
+    output_file = f"benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    value_options = {
+        "--sizes": ("sizes", _parse_int_list),
+        "--concurrency": ("concurrency_levels", _parse_int_list),
+        "--runs": ("runs", int),
+        "--timeout": ("run_timeout", float),
+    }
+    mock_options = {
+        "--ready-delay": ("ready_delay", float),
+        "--run-delay": ("run_delay", float),
+        "--log-lines": ("log_lines", int),
+        "--error-rate": ("error_rate", float),
+        "--seed": ("seed", int),
+    }
+
+    args = sys.argv[1:]
+    while args:
+        arg = args.pop(0)
+        name, _, value = arg.partition("=")
+        if name in value_options or name in mock_options or name == "--output":
+            if not value:
+                if not args:
+                    print(f"⚠ 参数 {name} 缺少取值")
+                    continue
+                value = args.pop(0)
+            if name == "--output":
+                output_file = value
+            elif name in value_options:
+                key, convert = value_options[name]
+                options[key] = convert(value)
+            else:
+                key, convert = mock_options[name]
+                mock_config[key] = convert(value)
+        elif arg == "--headful":
+            options["headless"] = False
+        elif arg == "--verbose":
+            options["verbose"] = True
+        else:
+            print(f"⚠ 忽略未知参数: {arg}")
+
+    report = asyncio.run(run_benchmark(mock_config=mock_config, **options))
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📊 测试结果已写入: {output_file}")
+
+if __name__ == "__main__":
+    main()
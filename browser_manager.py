@@ -3,11 +3,17 @@
 独立浏览器管理工具
 """
 
+import hashlib
+import json
 import os
+import re
 import shutil
 import sys
+import time
+import zlib
 from browser_utils import get_isolated_browser_info, print_isolated_browser_info
 from path_config import get_browser_data_dir, get_browser_backup_dir, ensure_jq_run_dirs, print_jq_run_info, migrate_from_current_dir
+from session_manager import invalidate_session
 
 def show_browser_info():
     """显示浏览器信息"""
@@ -28,6 +34,8 @@ def reset_browser():
     if confirm == 'yes':
         try:
             shutil.rmtree(info['data_dir'])
+            # 新的数据目录（包括其中调试Chrome的数据目录）没有Cookie，下次运行重新注入
+            invalidate_session()
             print(f"✅ 已删除独立浏览器数据: {info['data_dir']}")
         except Exception as e:
             print(f"❌ 删除失败: {e}")
@@ -53,8 +61,101 @@ def open_browser_data_dir():
     except Exception as e:
         print(f"❌ 打开目录失败: {e}")
 
-def backup_browser_data():
-    """备份浏览器数据"""
+# 备份时默认跳过的缓存目录（可以重新生成，体积又大）
+BACKUP_SKIP_DIRS = {
+    "Cache", "Code Cache", "GPUCache", "ShaderCache", "GrShaderCache", "DawnCache",
+    "DawnGraphiteCache", "DawnWebGPUCache", "CacheStorage", "ScriptCache",
+    "component_crx_cache", "Crashpad", "Temp",
+}
+
+# 浏览器运行时的锁文件，不需要备份
+BACKUP_SKIP_FILES = {"SingletonLock", "SingletonSocket", "SingletonCookie", "LOCK"}
+
+# 默认保留的备份数量
+DEFAULT_BACKUP_RETENTION = 5
+
+def _backup_objects_dir():
+    return os.path.join(get_browser_backup_dir(), "objects")
+
+def _backup_manifests_dir():
+    return os.path.join(get_browser_backup_dir(), "manifests")
+
+def _object_path(digest):
+    return os.path.join(_backup_objects_dir(), digest[:2], digest)
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _store_object(path, digest):
+    """把文件压缩后存入对象库，已存在的内容不重复存储，返回新写入的压缩字节数"""
+    object_path = _object_path(digest)
+    if os.path.exists(object_path):
+        return 0
+
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    tmp_path = object_path + ".tmp"
+    compressor = zlib.compressobj(6)
+    written = 0
+    with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+        for chunk in iter(lambda: src.read(1024 * 1024), b""):
+            data = compressor.compress(chunk)
+            dst.write(data)
+            written += len(data)
+        data = compressor.flush()
+        dst.write(data)
+        written += len(data)
+    os.replace(tmp_path, object_path)
+    return written
+
+def _restore_object(digest, target_path):
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    decompressor = zlib.decompressobj()
+    with open(_object_path(digest), "rb") as src, open(target_path, "wb") as dst:
+        for chunk in iter(lambda: src.read(1024 * 1024), b""):
+            dst.write(decompressor.decompress(chunk))
+        dst.write(decompressor.flush())
+
+def _list_backup_manifests():
+    """按时间从旧到新列出所有备份清单"""
+    manifests_dir = _backup_manifests_dir()
+    if not os.path.isdir(manifests_dir):
+        return []
+    return sorted(os.path.join(manifests_dir, name) for name in os.listdir(manifests_dir)
+                  if name.startswith("backup_") and name.endswith(".json"))
+
+def _load_manifest(manifest_file):
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _walk_profile_files(data_dir, include_cache):
+    """遍历浏览器数据目录，返回 (相对路径, os.DirEntry)"""
+    stack = [data_dir]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_symlink():
+                continue
+            if entry.is_dir():
+                if include_cache or entry.name not in BACKUP_SKIP_DIRS:
+                    stack.append(entry.path)
+            elif entry.is_file() and entry.name not in BACKUP_SKIP_FILES:
+                yield os.path.relpath(entry.path, data_dir), entry
+
+def backup_browser_data(include_cache=False, retention=DEFAULT_BACKUP_RETENTION):
+    """
+    增量备份浏览器数据
+
+    文件按内容哈希压缩存入对象库，相同内容只存一份；
+    大小和修改时间都没变的文件直接沿用上一次的哈希，不重新读取。
+    """
     info = get_isolated_browser_info()
 
     if not info['is_initialized']:
@@ -62,45 +163,122 @@ def backup_browser_data():
         return
 
     ensure_jq_run_dirs()
-    backup_base_dir = get_browser_backup_dir()
-    timestamp = str(int(os.time()))
-    backup_dir = os.path.join(backup_base_dir, f"backup_{timestamp}")
+    os.makedirs(_backup_manifests_dir(), exist_ok=True)
+    started = time.time()
+    timestamp = str(int(started))
+
+    previous = {}
+    manifests = _list_backup_manifests()
+    if manifests:
+        previous = _load_manifest(manifests[-1])["files"]
 
+    files = {}
+    stats = {"files": 0, "bytes": 0, "rehashed": 0, "new_objects_bytes": 0}
     try:
-        shutil.copytree(info['data_dir'], backup_dir)
-        print(f"✅ 已备份数据到: {backup_dir}")
+        for rel_path, entry in _walk_profile_files(info['data_dir'], include_cache):
+            try:
+                stat = entry.stat()
+                old = previous.get(rel_path)
+                if old and old["size"] == stat.st_size and old["mtime"] == stat.st_mtime:
+                    digest = old["hash"]
+                    if not os.path.exists(_object_path(digest)):
+                        stats["new_objects_bytes"] += _store_object(entry.path, digest)
+                else:
+                    digest = _hash_file(entry.path)
+                    stats["rehashed"] += 1
+                    stats["new_objects_bytes"] += _store_object(entry.path, digest)
+            except OSError as e:
+                # 浏览器运行时部分文件可能被占用或删除
+                print(f"⚠️  跳过 {rel_path}: {e}")
+                continue
+
+            files[rel_path] = {"hash": digest, "size": stat.st_size, "mtime": stat.st_mtime,
+                               "mode": stat.st_mode & 0o777}
+            stats["files"] += 1
+            stats["bytes"] += stat.st_size
+
+        manifest_file = os.path.join(_backup_manifests_dir(), f"backup_{timestamp}.json")
+        with open(manifest_file, "w", encoding="utf-8") as f:
+            json.dump({"created": started, "include_cache": include_cache, "files": files}, f)
+
+        print(f"✅ 已备份数据到: {manifest_file}")
+        print(f"📊 {stats['files']} 个文件，{stats['bytes'] / 1024 / 1024:.2f} MB；"
+              f"重新计算哈希 {stats['rehashed']} 个，新增存储 {stats['new_objects_bytes'] / 1024 / 1024:.2f} MB，"
+              f"耗时 {time.time() - started:.1f} 秒")
     except Exception as e:
         print(f"❌ 备份失败: {e}")
+        return
+
+    prune_backups(retention)
+
+def prune_backups(retention=DEFAULT_BACKUP_RETENTION):
+    """只保留最新的 retention 个备份，并删除不再被引用的对象"""
+    manifests = _list_backup_manifests()
+    for manifest_file in manifests[:-retention] if retention > 0 else manifests:
+        os.remove(manifest_file)
+        print(f"🗑️  已删除旧备份: {os.path.basename(manifest_file)}")
+
+    referenced = set()
+    for manifest_file in _list_backup_manifests():
+        referenced.update(entry["hash"] for entry in _load_manifest(manifest_file)["files"].values())
+
+    removed = freed = 0
+    objects_dir = _backup_objects_dir()
+    if os.path.isdir(objects_dir):
+        for prefix in os.scandir(objects_dir):
+            for entry in os.scandir(prefix.path):
+                if entry.name not in referenced:
+                    freed += entry.stat().st_size
+                    os.remove(entry.path)
+                    removed += 1
+
+    if removed:
+        print(f"🧹 已清理 {removed} 个无引用对象，释放 {freed / 1024 / 1024:.2f} MB")
 
 def restore_browser_data():
     """恢复浏览器数据"""
     import glob
 
-    backup_base_dir = get_browser_backup_dir()
-    backup_pattern = os.path.join(backup_base_dir, "backup_*")
-    backup_dirs = glob.glob(backup_pattern)
+    # 增量备份清单，以及旧版本留下的整目录备份
+    manifests = _list_backup_manifests()
+    legacy_dirs = sorted(glob.glob(os.path.join(get_browser_backup_dir(), "backup_*")))
+    backups = manifests + legacy_dirs
 
-    if not backup_dirs:
+    if not backups:
         print("🔍 未找到备份数据")
         return
 
     print("📋 找到的备份数据:")
-    for i, backup_dir in enumerate(backup_dirs, 1):
-        timestamp = backup_dir.split('_')[-1]
-        print(f"  {i}. {backup_dir} (时间戳: {timestamp})")
+    for i, backup in enumerate(backups, 1):
+        timestamp = os.path.splitext(os.path.basename(backup))[0].split('_')[-1]
+        kind = "增量" if backup in manifests else "完整目录"
+        print(f"  {i}. {backup} (时间戳: {timestamp}, {kind})")
 
     try:
         choice = int(input("选择要恢复的备份编号: ")) - 1
-        if 0 <= choice < len(backup_dirs):
-            selected_backup = backup_dirs[choice]
-
-            # 先删除现有数据
+        if 0 <= choice < len(backups):
+            selected_backup = backups[choice]
             info = get_isolated_browser_info()
-            if info['is_initialized']:
-                shutil.rmtree(info['data_dir'])
 
-            # 恢复备份数据
-            shutil.copytree(selected_backup, info['data_dir'])
+            # 先在临时目录里重建，成功后再替换现有数据
+            staging_dir = info['data_dir'] + ".restoring"
+            if os.path.exists(staging_dir):
+                shutil.rmtree(staging_dir)
+
+            if selected_backup in manifests:
+                for rel_path, entry in _load_manifest(selected_backup)["files"].items():
+                    target_path = os.path.join(staging_dir, rel_path)
+                    _restore_object(entry["hash"], target_path)
+                    os.chmod(target_path, entry["mode"])
+                    os.utime(target_path, (entry["mtime"], entry["mtime"]))
+            else:
+                shutil.copytree(selected_backup, staging_dir)
+
+            if os.path.exists(info['data_dir']):
+                shutil.rmtree(info['data_dir'])
+            os.replace(staging_dir, info['data_dir'])
+            # 备份里的Cookie可能已经过期，下次运行重新注入（包括其中调试Chrome的数据目录）
+            invalidate_session()
             print(f"✅ 已从 {selected_backup} 恢复数据")
         else:
             print("❌ 无效选择")
@@ -109,40 +287,173 @@ def restore_browser_data():
     except Exception as e:
         print(f"❌ 恢复失败: {e}")
 
-def clean_browser_data():
-    """清理浏览器缓存等临时文件"""
+# 清理时统计的目录类别；HTTP缓存和代码缓存按条目判断冷热，其余类别整体删除
+CLEAN_CATEGORIES = {"Cache", "Code Cache", "GPUCache", "ShaderCache", "GrShaderCache", "DawnCache", "Temp"}
+ENTRY_CACHE_CATEGORIES = {"Cache", "Code Cache"}
+
+# 策略清理的默认参数：缓存总大小上限（MB）和"热"资源的最近访问天数
+DEFAULT_CACHE_BUDGET_MB = 200
+DEFAULT_HOT_DAYS = 14
+
+# 需要保留的聚宽静态资源（Ace编辑器和前端JS/CSS）
+HOT_HOST_SUFFIX = "joinquant.com"
+HOT_PATH_PATTERN = re.compile(r"/static/|/ace[/.-]|\.(?:js|css)(?:\?|$)", re.I)
+
+# Simple Cache 条目文件: <16位十六进制>_0 / _1 / _s
+CACHE_ENTRY_PATTERN = re.compile(r"^([0-9a-f]{16})_(?:\d|s)$")
+CACHE_KEY_URL_PATTERN = re.compile(rb"https?://[^\s\x00]+")
+
+def _read_cache_entry_url(path):
+    """从 Simple Cache 条目文件头部读取资源URL（键中最后一个URL）"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(4096)
+    except OSError:
+        return None
+    urls = CACHE_KEY_URL_PATTERN.findall(head)
+    return urls[-1].decode("utf-8", "replace") if urls else None
+
+def _scan_profile_caches(data_dir):
+    """
+    用 os.scandir 遍历一次浏览器数据目录，收集所有缓存类别中的文件
+
+    Returns:
+        list: 每项为 dict(category, path, size, age_days, entry)；entry 为缓存条目ID（非条目文件为None）
+    """
+    now = time.time()
+    files = []
+    stack = [(data_dir, None)]
+    while stack:
+        current, category = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_symlink():
+                continue
+            if entry.is_dir():
+                stack.append((entry.path, category or (entry.name if entry.name in CLEAN_CATEGORIES else None)))
+            elif category and entry.is_file():
+                stat = entry.stat()
+                match = CACHE_ENTRY_PATTERN.match(entry.name)
+                files.append({
+                    "category": category,
+                    "path": entry.path,
+                    "size": stat.st_size,
+                    "age_days": (now - max(stat.st_atime, stat.st_mtime)) / 86400,
+                    "entry": (os.path.dirname(entry.path), match.group(1)) if match else None,
+                })
+    return files
+
+def _print_cache_report(files):
+    """打印每个类别的文件数、大小和新旧程度"""
+    report = {}
+    for item in files:
+        stats = report.setdefault(item["category"], {"files": 0, "size": 0, "oldest": 0.0, "newest": None})
+        stats["files"] += 1
+        stats["size"] += item["size"]
+        stats["oldest"] = max(stats["oldest"], item["age_days"])
+        stats["newest"] = item["age_days"] if stats["newest"] is None else min(stats["newest"], item["age_days"])
+
+    print("📊 缓存统计:")
+    for category, stats in sorted(report.items(), key=lambda kv: -kv[1]["size"]):
+        print(f"  {category:<14} {stats['files']:>7} 个文件 {stats['size'] / 1024 / 1024:>9.2f} MB  "
+              f"最新 {stats['newest']:.1f} 天前，最旧 {stats['oldest']:.1f} 天前")
+
+def _plan_policy_clean(files, budget_bytes, hot_days):
+    """
+    按策略决定要删除的文件
+
+    非条目类别整体删除；HTTP缓存和代码缓存中，近期访问过的聚宽静态资源保留，
+    其他站点的条目直接删除，剩下的冷条目从最旧的开始删除，直到缓存总大小不超过预算。
+    """
+    to_delete = [item for item in files if item["category"] not in ENTRY_CACHE_CATEGORIES]
+
+    # 把同一个缓存条目的多个文件合并
+    entries = {}
+    for item in files:
+        if item["category"] in ENTRY_CACHE_CATEGORIES:
+            key = item["entry"] or (item["path"], None)
+            entries.setdefault(key, []).append(item)
+
+    hot, cold, kept_size = [], [], 0
+    for key, items in entries.items():
+        if key[1] is None:
+            # index 等非条目文件保留
+            kept_size += sum(item["size"] for item in items)
+            continue
+
+        url = _read_cache_entry_url(os.path.join(key[0], f"{key[1]}_0"))
+        host = url.split("://", 1)[-1].split("/", 1)[0].split(":", 1)[0].lower() if url else ""
+        is_joinquant = host == HOT_HOST_SUFFIX or host.endswith("." + HOT_HOST_SUFFIX)
+        age_days = min(item["age_days"] for item in items)
+        size = sum(item["size"] for item in items)
+
+        if not is_joinquant:
+            to_delete.extend(items)
+        elif HOT_PATH_PATTERN.search(url.split("://", 1)[-1]) and age_days <= hot_days:
+            hot.append(items)
+            kept_size += size
+        else:
+            cold.append((age_days, size, items))
+
+    # 冷条目按从新到旧保留，超过预算的部分删除
+    cold.sort(key=lambda entry: entry[0])
+    for age_days, size, items in cold:
+        if kept_size + size <= budget_bytes:
+            kept_size += size
+        else:
+            to_delete.extend(items)
+
+    print(f"🔥 保留热的聚宽静态资源 {len(hot)} 个条目，缓存保留 {kept_size / 1024 / 1024:.2f} MB"
+          f"（预算 {budget_bytes / 1024 / 1024:.0f} MB）")
+    return to_delete
+
+def clean_browser_data(policy=True, budget_mb=DEFAULT_CACHE_BUDGET_MB, hot_days=DEFAULT_HOT_DAYS, dry_run=False):
+    """
+    清理浏览器缓存等临时文件
+
+    Args:
+        policy: 为真时保留近期用过的聚宽静态资源缓存，为假时删除全部缓存
+        budget_mb: 策略模式下HTTP缓存和代码缓存的总大小上限
+        hot_days: 多少天内访问过的资源算"热"
+        dry_run: 只统计不删除
+    """
     info = get_isolated_browser_info()
 
     if not info['is_initialized']:
         print("🔍 独立浏览器尚未初始化")
         return
 
-    patterns_to_clean = [
-        os.path.join(info['data_dir'], "**", "Cache"),
-        os.path.join(info['data_dir'], "**", "GPUCache"),
-        os.path.join(info['data_dir'], "**", "Code Cache"),
-        os.path.join(info['data_dir'], "**", "Temp"),
-    ]
-
-    cleaned_size = 0
-    for pattern in patterns_to_clean:
-        import glob
-        for path in glob.glob(pattern, recursive=True):
-            try:
-                if os.path.isdir(path):
-                    size = sum(os.path.getsize(os.path.join(dirpath, filename))
-                             for dirpath, dirnames, filenames in os.walk(path)
-                             for filename in filenames)
-                    shutil.rmtree(path)
-                    cleaned_size += size
-                    print(f"🧹 已清理: {path}")
-            except Exception as e:
-                print(f"⚠️  清理失败 {path}: {e}")
+    if os.path.lexists(os.path.join(info['data_dir'], "SingletonLock")):
+        print("⚠️  浏览器可能正在运行，建议关闭后再清理")
 
+    files = _scan_profile_caches(info['data_dir'])
+    if not files:
+        print("📝 没有找到可清理的文件")
+        return
+    _print_cache_report(files)
+
+    to_delete = _plan_policy_clean(files, budget_mb * 1024 * 1024, hot_days) if policy else files
+
+    cleaned = {}
+    for item in to_delete:
+        try:
+            if not dry_run:
+                os.remove(item["path"])
+            cleaned[item["category"]] = cleaned.get(item["category"], 0) + item["size"]
+        except OSError as e:
+            print(f"⚠️  清理失败 {item['path']}: {e}")
+
+    for category, size in sorted(cleaned.items(), key=lambda kv: -kv[1]):
+        print(f"🧹 {'将清理' if dry_run else '已清理'} {category}: {size / 1024 / 1024:.2f} MB")
+
+    cleaned_size = sum(cleaned.values())
     if cleaned_size > 0:
-        print(f"✅ 清理完成，释放空间: {cleaned_size / 1024 / 1024:.2f} MB")
+        print(f"✅ 清理完成，{'可' if dry_run else ''}释放空间: {cleaned_size / 1024 / 1024:.2f} MB")
     else:
-        print("📝 没有找到可清理的文件")
+        print("📝 没有需要清理的文件")
 
 def migrate_data():
     """从当前目录迁移数据到 ~/.jq-run"""
@@ -168,9 +479,11 @@ def main():
         print("  info    - 显示浏览器信息")
         print("  reset   - 重置浏览器数据")
         print("  open    - 打开数据目录")
-        print("  backup  - 备份浏览器数据")
+        print("  backup  - 增量备份浏览器数据（--include-cache 同时备份缓存目录）")
         print("  restore - 恢复浏览器数据")
-        print("  clean   - 清理缓存和临时文件")
+        print(f"  prune   - 只保留最新的备份（--keep=N，默认{DEFAULT_BACKUP_RETENTION}个）")
+        print("  clean   - 清理缓存和临时文件，保留常用的聚宽静态资源")
+        print("            [--budget=MB] [--hot-days=N] [--dry-run] [--all 删除全部缓存]")
         print("  migrate - 从当前目录迁移数据到 ~/.jq-run")
         print("\n示例:")
         print("  python browser_manager.py info")
@@ -186,11 +499,18 @@ def main():
     elif command == "open":
         open_browser_data_dir()
     elif command == "backup":
-        backup_browser_data()
+        backup_browser_data(include_cache="--include-cache" in sys.argv[2:])
+    elif command == "prune":
+        keep = [arg.split("=", 1)[1] for arg in sys.argv[2:] if arg.startswith("--keep=")]
+        prune_backups(int(keep[0]) if keep else DEFAULT_BACKUP_RETENTION)
     elif command == "restore":
         restore_browser_data()
     elif command == "clean":
-        clean_browser_data()
+        options = dict(arg[2:].split("=", 1) for arg in sys.argv[2:] if arg.startswith("--") and "=" in arg)
+        clean_browser_data(policy="--all" not in sys.argv[2:],
+                           budget_mb=float(options.get("budget", DEFAULT_CACHE_BUDGET_MB)),
+                           hot_days=float(options.get("hot-days", DEFAULT_HOT_DAYS)),
+                           dry_run="--dry-run" in sys.argv[2:])
     elif command == "migrate":
         migrate_data()
     else:
@@ -4,120 +4,338 @@
 """
 
 import asyncio
+import json
 import os
+import shutil
 import subprocess
 import sys
+import urllib.request
 from playwright.async_api import async_playwright
-from path_config import get_browser_data_dir, ensure_jq_run_dirs
+from run_timing import phase
+from path_config import (
+    get_browser_data_dir, get_cdp_endpoint_file, get_chrome_cache_file, get_debug_chrome_data_dir,
+    get_resource_size_hints_file, ensure_jq_run_dirs
+)
+
+# 启动独立浏览器时使用的Chrome参数
+CHROME_LAUNCH_ARGS = [
+    "--no-sandbox",
+    "--disable-blink-features=AutomationControlled",
+    "--disable-dev-shm-usage",
+    "--disable-web-security",
+    "--disable-features=VizDisplayCompositor",
+    "--disable-extensions-except",
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+    "--disable-features=TranslateUI",
+    "--disable-ipc-flooding-protection",
+    "--disable-features=IsolateOrigins,site-per-process",
+    "--disable-site-isolation-trials",
+    "--no-first-run",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--metrics-recording-only",
+    "--disable-default-browser-check"
+]
+
+# 有界面时使用全高清窗口，无头模式用更小的视口节省渲染内存
+HEADFUL_VIEWPORT = {"width": 1920, "height": 1080}
+HEADLESS_VIEWPORT = {"width": 1280, "height": 800}
+
+# 编辑、编译和读日志都用不到的资源类型
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+
+# 第三方统计/广告域名，无论什么资源类型都拦截
+BLOCKED_HOST_KEYWORDS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "hm.baidu.com",
+    "cnzz.com",
+    "growingio.com",
+    "sensorsdata",
+    "mmstat.com",
+    "zhugeio.com",
+]
+
+# 即使匹配上面的规则也放行的URL关键字（Ace编辑器等）
+ALLOWED_URL_KEYWORDS = ["/ace/", "ace.js", "ace-builds", "/static/js/", "/static/css/"]
+
+# 资源大小记录最多保留的条数，超出后丢弃最早记录的
+MAX_RESOURCE_SIZE_HINTS = 500
+
+# 调试Chrome的远程调试端口
+DEBUG_PORT = 9222
+
+# 自动启动调试Chrome后等待端口可用的最长时间（秒）
+DEBUG_CHROME_START_TIMEOUT = 15
+
+def _load_cdp_endpoint():
+    """读取上次成功连接的CDP地址"""
+    try:
+        with open(get_cdp_endpoint_file(), "r", encoding="utf-8") as f:
+            return json.load(f)["endpoint"]
+    except (OSError, ValueError, KeyError):
+        return f"http://127.0.0.1:{DEBUG_PORT}"
+
+def _save_cdp_endpoint(endpoint):
+    try:
+        ensure_jq_run_dirs()
+        with open(get_cdp_endpoint_file(), "w", encoding="utf-8") as f:
+            json.dump({"endpoint": endpoint}, f)
+    except OSError as e:
+        print(f"⚠️ 保存CDP地址失败: {e}")
+
+def _cdp_endpoint_ready(endpoint):
+    """检查调试端口是否已经可以连接"""
+    try:
+        with urllib.request.urlopen(f"{endpoint}/json/version", timeout=1) as response:
+            return response.status == 200
+    except (OSError, ValueError):
+        return False
 
-async def create_isolated_browser(playwright, browser_type="chromium"):
+async def attach_to_debug_chrome(playwright, launch_if_missing=True, headless=False):
+    """
+    通过CDP连接已经在运行的调试Chrome，复用它的登录状态
+
+    没有调试Chrome在运行时，在后台启动一个并记住连接地址。
+
+    Returns:
+        context: 调试Chrome的默认上下文，连接失败返回None
+    """
+    loop = asyncio.get_running_loop()
+    endpoint = _load_cdp_endpoint()
+
+    if not await loop.run_in_executor(None, _cdp_endpoint_ready, endpoint):
+        if not launch_if_missing:
+            return None
+
+        endpoint = f"http://127.0.0.1:{DEBUG_PORT}"
+        started, message = start_chrome_with_debugging(DEBUG_PORT, headless)
+        print(f"{'🚀' if started else '✗'} {message}")
+        if not started:
+            return None
+
+        deadline = loop.time() + DEBUG_CHROME_START_TIMEOUT
+        while not await loop.run_in_executor(None, _cdp_endpoint_ready, endpoint):
+            if loop.time() > deadline:
+                print(f"✗ 调试Chrome在{DEBUG_CHROME_START_TIMEOUT}秒内没有就绪")
+                return None
+            await asyncio.sleep(0.2)
+
+    try:
+        browser = await playwright.chromium.connect_over_cdp(endpoint)
+    except Exception as e:
+        print(f"✗ 连接调试Chrome失败: {e}")
+        return None
+
+    _save_cdp_endpoint(endpoint)
+    print(f"🔗 已连接调试Chrome: {endpoint}")
+    return browser.contexts[0] if browser.contexts else await browser.new_context()
+
+async def open_browser_context(playwright, browser_options=None):
+    """
+    按选项打开浏览器上下文：attach 为真时连接调试Chrome，否则启动独立浏览器
+
+    Returns:
+        (context, owns_context)：owns_context 为假时上下文属于调试Chrome，
+        调用方只关闭自己打开的标签页，不要关闭上下文
+    """
+    options = dict(browser_options or {})
+    if options.pop("attach", False):
+        with phase("cdp_attach"):
+            context = await attach_to_debug_chrome(playwright, headless=options.get("headless", False))
+        if context:
+            if options.get("block_resources"):
+                await install_resource_blocker(context)
+            return context, False
+        print("⚠️ 无法连接调试Chrome，改为启动独立浏览器")
+
+    return await create_isolated_browser(playwright, "chromium", **options), True
+
+async def create_isolated_browser(playwright, browser_type="chromium", headless=False, block_resources=False):
     """
     创建独立的浏览器实例，使用用户自己的Chrome浏览器
 
     Args:
         playwright: playwright实例
         browser_type: 浏览器类型 ('chromium', 'chrome', 'firefox')
+        headless: 是否以无头模式运行（适合没有显示器的构建服务器）
+        block_resources: 是否拦截图片、字体、媒体和第三方统计脚本
 
     Returns:
         context: 浏览器上下文实例
     """
+    viewport = HEADLESS_VIEWPORT if headless else HEADFUL_VIEWPORT
     try:
         # 确保目录存在并创建专用的浏览器数据目录
         ensure_jq_run_dirs()
         persistent_dir = get_browser_data_dir()
 
-        print(f"🔧 创建独立浏览器实例，使用您的Chrome浏览器")
+        print(f"🔧 创建独立浏览器实例，使用您的Chrome浏览器{'（无头模式）' if headless else ''}")
         print(f"📁 数据将保存在: {persistent_dir}")
 
         # 查找用户Chrome可执行文件路径
-        chrome_exe = get_user_chrome_executable()
+        with phase("chrome_resolve"):
+            resolved_chrome = resolve_chrome_executable()
+        chrome_exe = resolved_chrome["path"] if resolved_chrome else None
         if chrome_exe:
-            print(f"🌐 使用Chrome: {chrome_exe}")
+            print(f"🌐 使用Chrome: {chrome_exe}（{resolved_chrome['version'] or '版本未知'}）")
             # 使用用户自己的Chrome浏览器
-            context = await playwright.chromium.launch_persistent_context(
-                user_data_dir=persistent_dir,
-                headless=False,
-                viewport={"width": 1920, "height": 1080},
-                executable_path=chrome_exe,
-                args=[
-                    "--no-sandbox",
-                    "--disable-blink-features=AutomationControlled",
-                    "--disable-dev-shm-usage",
-                    "--disable-web-security",
-                    "--disable-features=VizDisplayCompositor",
-                    "--disable-extensions-except",
-                    "--disable-background-timer-throttling",
-                    "--disable-backgrounding-occluded-windows",
-                    "--disable-renderer-backgrounding",
-                    "--disable-features=TranslateUI",
-                    "--disable-ipc-flooding-protection",
-                    "--disable-features=IsolateOrigins,site-per-process",
-                    "--disable-site-isolation-trials",
-                    "--no-first-run",
-                    "--disable-default-apps",
-                    "--disable-sync",
-                    "--metrics-recording-only",
-                    "--disable-default-browser-check"
-                ]
-            )
+            with phase("browser_launch"):
+                context = await playwright.chromium.launch_persistent_context(
+                    user_data_dir=persistent_dir,
+                    headless=headless,
+                    viewport=viewport,
+                    executable_path=chrome_exe,
+                    args=CHROME_LAUNCH_ARGS
+                )
             print("✅ 使用您的Chrome浏览器创建实例成功")
         else:
             print("⚠️ 未找到Chrome，使用Playwright内置的Chromium")
-            context = await playwright.chromium.launch_persistent_context(
-                user_data_dir=persistent_dir,
-                headless=False,
-                viewport={"width": 1920, "height": 1080},
-                args=[
-                    "--no-sandbox",
-                    "--disable-blink-features=AutomationControlled",
-                    "--disable-dev-shm-usage",
-                    "--disable-web-security",
-                    "--disable-features=VizDisplayCompositor",
-                    "--disable-extensions-except",
-                    "--disable-background-timer-throttling",
-                    "--disable-backgrounding-occluded-windows",
-                    "--disable-renderer-backgrounding",
-                    "--disable-features=TranslateUI",
-                    "--disable-ipc-flooding-protection",
-                    "--disable-features=IsolateOrigins,site-per-process",
-                    "--disable-site-isolation-trials",
-                    "--no-first-run",
-                    "--disable-default-apps",
-                    "--disable-sync",
-                    "--metrics-recording-only",
-                    "--disable-default-browser-check"
-                ]
-            )
+            with phase("browser_launch"):
+                context = await playwright.chromium.launch_persistent_context(
+                    user_data_dir=persistent_dir,
+                    headless=headless,
+                    viewport=viewport,
+                    args=CHROME_LAUNCH_ARGS
+                )
             print("✅ 使用Chromium创建实例成功")
 
         print("🔒 这是专用实例，与您的日常浏览器配置分离")
+
+        if block_resources:
+            stats = await install_resource_blocker(context)
+            context.on("close", lambda *_: print_resource_block_stats(stats))
+        else:
+            size_hints = record_resource_sizes(context)
+            context.on("close", lambda *_: save_resource_size_hints(size_hints))
+
         return context
 
     except Exception as e:
         print(f"✗ 创建独立浏览器失败: {e}")
         # 如果失败，尝试创建普通浏览器
         print("尝试创建普通浏览器实例...")
-        return await playwright.chromium.launch(headless=False)
+        return await playwright.chromium.launch(headless=headless)
+
+def _should_block_request(request):
+    """判断请求是否应该被拦截，返回拦截原因或None"""
+    url = request.url.lower()
+    if any(keyword in url for keyword in ALLOWED_URL_KEYWORDS) and request.resource_type in ("script", "stylesheet"):
+        return None
+
+    host = url.split("://", 1)[-1].split("/", 1)[0]
+    if any(keyword in host for keyword in BLOCKED_HOST_KEYWORDS):
+        return "tracker"
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return request.resource_type
+    return None
 
-def get_user_chrome_executable():
-    """获取用户Chrome可执行文件路径"""
-    chrome_paths = []
+def _resource_size_key(url):
+    """资源大小记录的键：去掉查询参数和锚点，带时间戳或版本号的同一资源只记一条"""
+    return url.split("#", 1)[0].split("?", 1)[0]
+
+def _load_resource_size_hints():
+    """读取记录过的资源大小，用来估算被拦截的字节数"""
+    try:
+        with open(get_resource_size_hints_file(), "r", encoding="utf-8") as f:
+            hints = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # 兼容以前按完整URL记录的文件
+    return {_resource_size_key(url): size for url, size in hints.items()}
+
+async def install_resource_blocker(target):
+    """
+    在页面或浏览器上下文上安装基于 route 的资源拦截
+
+    被拦截的请求不会产生下载，所以拦截字节数按以前未拦截时记录的资源大小估算。
+
+    Args:
+        target: page 或 context，两者都支持 route
+
+    Returns:
+        dict: 拦截统计，随请求实时更新
+    """
+    size_hints = _load_resource_size_hints()
+    stats = {"allowed_requests": 0, "blocked_requests": 0, "blocked_bytes_estimate": 0, "blocked_by_reason": {}}
+
+    async def handle_route(route):
+        reason = _should_block_request(route.request)
+        if reason is None:
+            stats["allowed_requests"] += 1
+            await route.continue_()
+            return
 
+        stats["blocked_requests"] += 1
+        stats["blocked_by_reason"][reason] = stats["blocked_by_reason"].get(reason, 0) + 1
+        stats["blocked_bytes_estimate"] += size_hints.get(_resource_size_key(route.request.url), 0)
+        await route.abort()
+
+    await target.route("**/*", handle_route)
+    return stats
+
+def record_resource_sizes(target):
+    """
+    记录可拦截资源的实际大小（未开启拦截时调用），供拦截模式估算节省的字节数
+
+    Returns:
+        dict: 去掉查询参数的URL -> 字节数，最近记录的在后，调用 save_resource_size_hints 写入磁盘
+    """
+    size_hints = _load_resource_size_hints()
+
+    def on_response(response):
+        request = response.request
+        url = request.url.lower()
+        host = url.split("://", 1)[-1].split("/", 1)[0]
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or any(k in host for k in BLOCKED_HOST_KEYWORDS):
+            length = response.headers.get("content-length")
+            if length and length.isdigit():
+                key = _resource_size_key(request.url)
+                size_hints.pop(key, None)
+                size_hints[key] = int(length)
+
+    target.on("response", on_response)
+    return size_hints
+
+def save_resource_size_hints(size_hints):
+    """把资源大小记录写入 ~/.jq-run，只保留最近的 MAX_RESOURCE_SIZE_HINTS 条"""
+    if not size_hints:
+        return
+    recent = dict(list(size_hints.items())[-MAX_RESOURCE_SIZE_HINTS:])
+    try:
+        with open(get_resource_size_hints_file(), "w", encoding="utf-8") as f:
+            json.dump(recent, f)
+    except OSError as e:
+        print(f"⚠️ 保存资源大小记录失败: {e}")
+
+def print_resource_block_stats(stats):
+    """打印资源拦截统计"""
+    reasons = ", ".join(f"{reason}={count}" for reason, count in sorted(stats["blocked_by_reason"].items()))
+    print(f"🚫 已拦截 {stats['blocked_requests']} 个请求（{reasons or '无'}），"
+          f"放行 {stats['allowed_requests']} 个，"
+          f"约节省 {stats['blocked_bytes_estimate'] / 1024:.1f} KB")
+
+def _chrome_candidate_paths():
+    """当前平台上可能的Chrome路径，绝对路径和命令名都可以"""
     if sys.platform == "win32":
-        chrome_paths = [
+        return [
             r"C:\Program Files\Google\Chrome\Application\chrome.exe",
             r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
             os.path.expandvars(r"%LOCALAPPDATA%\Google\Chrome\Application\chrome.exe"),
             os.path.expandvars(r"%USERPROFILE%\AppData\Local\Google\Chrome\Application\chrome.exe"),
         ]
     elif sys.platform == "darwin":  # macOS
-        chrome_paths = [
+        return [
             "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
             "/Applications/Chromium.app/Contents/MacOS/Chromium",
             os.path.expanduser("~/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"),
         ]
     else:  # Linux
-        chrome_paths = [
+        return [
             "/usr/bin/google-chrome",
             "/usr/bin/google-chrome-stable",
             "/usr/bin/google-chrome-beta",
@@ -132,21 +350,81 @@ def get_user_chrome_executable():
             "chromium",
         ]
 
-    # 检查每个路径
-    for path in chrome_paths:
-        if os.path.exists(path):
-            return path
+def _find_chrome_in_process(candidates):
+    """不启动子进程查找Chrome：绝对路径直接检查，命令名用 shutil.which 在PATH中查找"""
+    for path in candidates:
+        if os.path.isabs(path):
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                return path
         else:
-            # 尝试使用which命令
-            try:
-                result = subprocess.run(["which", path], capture_output=True, text=True)
-                if result.returncode == 0:
-                    return result.stdout.strip()
-            except:
-                continue
-
+            found = shutil.which(path)
+            if found:
+                return found
     return None
 
+def _read_chrome_version(chrome_executable):
+    """读取Chrome版本号（只在缓存失效时调用一次）"""
+    if sys.platform == "win32":
+        # Windows 上的 chrome.exe --version 不输出内容，版本号从安装目录名读取
+        app_dir = os.path.dirname(chrome_executable)
+        versions = [name for name in os.listdir(app_dir) if name[:1].isdigit()] if os.path.isdir(app_dir) else []
+        return max(versions, default=None)
+    try:
+        result = subprocess.run([chrome_executable, "--version"], capture_output=True, text=True, timeout=10)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+# 进程内缓存，同一进程多次调用只检查一次文件
+_resolved_chrome = None
+
+def resolve_chrome_executable():
+    """
+    解析Chrome可执行文件，结果缓存在 ~/.jq-run/chrome.json
+
+    缓存记录路径、版本和文件修改时间，Chrome升级或被删除后自动失效。
+
+    Returns:
+        dict: {"path", "version", "mtime"}，找不到Chrome时返回None
+    """
+    global _resolved_chrome
+    if _resolved_chrome and os.path.exists(_resolved_chrome["path"]):
+        return _resolved_chrome
+
+    cache_file = get_chrome_cache_file()
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if os.stat(cached["path"]).st_mtime == cached["mtime"]:
+            _resolved_chrome = cached
+            return cached
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    chrome_executable = _find_chrome_in_process(_chrome_candidate_paths())
+    if not chrome_executable:
+        return None
+
+    resolved = {
+        "path": chrome_executable,
+        "version": _read_chrome_version(chrome_executable),
+        "mtime": os.stat(chrome_executable).st_mtime,
+    }
+    try:
+        ensure_jq_run_dirs()
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(resolved, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"⚠️ 保存Chrome路径缓存失败: {e}")
+
+    _resolved_chrome = resolved
+    return resolved
+
+def get_user_chrome_executable():
+    """获取用户Chrome可执行文件路径"""
+    resolved = resolve_chrome_executable()
+    return resolved["path"] if resolved else None
+
 def get_isolated_browser_info():
     """获取独立浏览器信息"""
     persistent_dir = get_browser_data_dir()
@@ -203,47 +481,10 @@ def get_chrome_user_data_dir():
                 return dir_path
         return possible_dirs[0]  # 返回默认路径
 
-def start_chrome_with_debugging():
+def start_chrome_with_debugging(port=DEBUG_PORT, headless=False):
     """启动Chrome并开启远程调试"""
-    chrome_cmd = None
-
-    if sys.platform == "win32":
-        chrome_paths = [
-            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-            r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
-            os.path.expandvars(r"%LOCALAPPDATA%\Google\Chrome\Application\chrome.exe")
-        ]
-    elif sys.platform == "darwin":  # macOS
-        chrome_paths = [
-            "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
-            "/Applications/Chromium.app/Contents/MacOS/Chromium"
-        ]
-    else:  # Linux
-        chrome_paths = [
-            "google-chrome",
-            "google-chrome-stable",
-            "chromium-browser",
-            "chromium",
-            "/usr/bin/google-chrome",
-            "/usr/bin/chromium"
-        ]
-
     # 找到可执行的Chrome
-    chrome_executable = None
-    for path in chrome_paths:
-        if os.path.exists(path):
-            chrome_executable = path
-            break
-        else:
-            # 尝试which命令
-            try:
-                result = subprocess.run(["which", path],
-                                      capture_output=True, text=True)
-                if result.returncode == 0:
-                    chrome_executable = result.stdout.strip()
-                    break
-            except:
-                continue
+    chrome_executable = get_user_chrome_executable()
 
     if not chrome_executable:
         return False, "未找到Chrome浏览器"
@@ -253,13 +494,16 @@ def start_chrome_with_debugging():
         ensure_jq_run_dirs()
         args = [
             chrome_executable,
-            "--remote-debugging-port=9222",
+            f"--remote-debugging-port={port}",
             "--no-sandbox",
             "--disable-dev-shm-usage",
-            "--user-data-dir=" + os.path.join(get_browser_data_dir(), "debug")
+            "--user-data-dir=" + get_debug_chrome_data_dir()
         ]
+        if headless:
+            args.append("--headless=new")
 
-        subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # 新会话启动，脚本退出后Chrome继续在后台运行，供后续任务复用
+        subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
         return True, "Chrome已启动，等待连接..."
     except Exception as e:
         return False, f"启动Chrome失败: {e}"
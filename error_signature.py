@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+错误归类：去掉报错文本里每次运行都不同的内容（时间、日期、内存地址、编号、小数），
+把堆栈帧对应到提交的策略代码行，计算稳定的错误标识，并按标识把一批运行分组
+"""
+
+import hashlib
+import os
+import re
+
+# 按顺序替换的噪声，先替换长的格式（日期时间）再替换短的（时间、数字）
+NOISE_PATTERNS = [
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?\b"), "<datetime>"),
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}\b"), "<date>"),
+    (re.compile(r"\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b"), "<time>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), "<addr>"),
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<uuid>"),
+    (re.compile(r"\b[0-9a-f]{16,}\b"), "<id>"),
+    # 价格、收益等小数每个参数组合都不同；整数（下标、股票代码）保留
+    (re.compile(r"(?<![\w.])-?\d+\.\d+(?:[eE][-+]?\d+)?\b"), "<num>"),
+]
+
+# 标识的长度（十六进制字符数）
+SIGNATURE_LENGTH = 16
+
+# 每个错误分组最多记录的示例文件数
+MAX_EXAMPLE_FILES = 5
+
+def normalize_text(text):
+    """去掉文本中每次运行都不同的内容，合并多余空白"""
+    for pattern, replacement in NOISE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return re.sub(r"[ \t]+", " ", text).strip()
+
+def map_user_frames(frames, content):
+    """
+    把用户代码的帧对应到提交的策略代码
+
+    Returns:
+        list: 每个用户帧 {"line", "function", "source"}，source 为提交代码中该行的内容，
+        行号超出范围时退回到堆栈里显示的代码
+    """
+    lines = content.splitlines() if content else []
+    mapped = []
+    for frame in frames:
+        if not frame["user_code"]:
+            continue
+        source = lines[frame["line"] - 1].strip() if 0 < frame["line"] <= len(lines) else frame.get("code")
+        mapped.append({"line": frame["line"], "function": frame.get("function"), "source": source})
+    return mapped
+
+def analyze_error(result, content=None):
+    """
+    分析一次失败运行的错误
+
+    有 Traceback 时标识由异常类型、规范化后的错误信息和各帧组成：用户代码的帧用函数名和代码行内容
+    （在上面插入代码导致行号变化时标识不变），平台的帧用文件名和函数名；
+    没有 Traceback 的失败（超时、预检失败等）由状态和规范化后的第一行日志组成。
+
+    Returns:
+        dict: signature、exception_type、message、user_frames，成功的运行返回None
+    """
+    if result.get("status") == "success":
+        return None
+
+    details = result.get("details") or {}
+    if details.get("error_text"):
+        exception_type = details.get("exception_type")
+        message = normalize_text(details.get("message") or "")
+        user_frames = map_user_frames(details.get("frames") or [], content)
+        parts = [exception_type or "", message]
+        for frame in details.get("frames") or []:
+            if frame["user_code"]:
+                continue
+            parts.append(f"{os.path.basename(frame['file'])}:{frame.get('function') or ''}")
+        for frame in user_frames:
+            parts.append(f"user:{frame['function'] or ''}:{normalize_text(frame['source'] or str(frame['line']))}")
+    else:
+        first_line = next((line for line in (result.get("log") or "").splitlines() if line.strip()), "")
+        exception_type = None
+        message = normalize_text(first_line)
+        user_frames = []
+        parts = [result.get("status") or "", message]
+
+    digest = hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:SIGNATURE_LENGTH]
+    return {"signature": digest, "exception_type": exception_type, "message": message, "user_frames": user_frames}
+
+def describe_error(error, status=None):
+    """错误的一行描述"""
+    if error["exception_type"]:
+        text = f"{error['exception_type']}: {error['message']}" if error["message"] else error["exception_type"]
+    else:
+        text = f"{status}: {error['message']}" if status and error["message"] else (status or error["message"])
+    if error["user_frames"]:
+        # 最内层的用户代码帧最接近出错位置
+        frame = error["user_frames"][-1]
+        source = f" {frame['source']}" if frame["source"] else ""
+        text += f"（第{frame['line']}行{source}）"
+    return text
+
+class ErrorIndex:
+    """
+    按错误标识给一批运行分组
+
+    每次运行只计算一次标识并查字典，不做两两比较，运行再多也是线性的。
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.groups = {}
+
+    def add(self, result, content=None):
+        """
+        加入一次运行，失败的运行把分析结果写到 result["error"]
+
+        Returns:
+            dict: 错误分析结果，成功的运行返回None
+        """
+        self.runs += 1
+        error = analyze_error(result, content)
+        if not error:
+            return None
+
+        result["error"] = error
+        group = self.groups.get(error["signature"])
+        if not group:
+            group = self.groups[error["signature"]] = {
+                "signature": error["signature"], "status": result.get("status"),
+                "description": describe_error(error, result.get("status")), "count": 0, "files": [],
+            }
+        group["count"] += 1
+        if result.get("file") and len(group["files"]) < MAX_EXAMPLE_FILES:
+            group["files"].append(result["file"])
+        return error
+
+    def summary(self):
+        return f"{self.runs} 次运行，{len(self.groups)} 种不同的错误"
+
+    def to_list(self):
+        """错误分组，出现次数多的在前"""
+        return sorted(self.groups.values(), key=lambda group: -group["count"])
+
+def print_error_index(index):
+    """打印错误分组"""
+    print(f"🧩 {index.summary()}")
+    for group in index.to_list():
+        more = group["count"] - len(group["files"])
+        files = ", ".join(group["files"]) + (f" 等{group['count']}个" if more > 0 else "")
+        print(f"  [{group['signature'][:8]}] ×{group['count']:<4} {group['description']}")
+        if files:
+            print(f"      {files}")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+文件监听模块：Linux 上通过 ctypes 调用 inotify 监听策略文件，
+其他平台退回到定时检查修改时间；连续保存会合并成一次变化（防抖）
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+
+# inotify 常量（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# 监听所在目录而不是文件本身：很多编辑器保存时先写临时文件再改名替换
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event 的固定部分: int wd; uint32_t mask, cookie, len;
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+# 最后一次变化后安静这么久才算保存完成（秒）
+DEFAULT_DEBOUNCE = 0.3
+
+# 没有 inotify 时检查修改时间的间隔（秒）
+POLL_INTERVAL = 0.5
+
+def _load_inotify():
+    """加载 libc 中的 inotify 函数，不支持的平台返回None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+class FileWatcher:
+    """
+    监听一个文件的保存
+
+    用法:
+        watcher = FileWatcher(path)
+        watcher.start()
+        while True:
+            await watcher.wait_for_change()
+            ...
+        watcher.close()
+
+    运行策略期间发生的保存不会丢失，下一次 wait_for_change 会立即（防抖后）返回。
+    """
+
+    def __init__(self, path, debounce=DEFAULT_DEBOUNCE):
+        self.path = os.path.abspath(path)
+        self.debounce = debounce
+        self.backend = None
+        self._changed = asyncio.Event()
+        self._fd = None
+        self._poll_task = None
+
+    def start(self):
+        """开始监听，返回使用的方式（inotify / polling）"""
+        libc = _load_inotify()
+        if libc:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0 and libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), WATCH_MASK) >= 0:
+                self._fd = fd
+                asyncio.get_running_loop().add_reader(fd, self._on_inotify)
+                self.backend = "inotify"
+                return self.backend
+            if fd >= 0:
+                os.close(fd)
+
+        self._poll_task = asyncio.ensure_future(self._poll())
+        self.backend = "polling"
+        return self.backend
+
+    def _on_inotify(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        name = os.path.basename(self.path).encode()
+        offset = 0
+        while offset + INOTIFY_EVENT_HEADER.size <= len(data):
+            _, _, _, length = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+            start = offset + INOTIFY_EVENT_HEADER.size
+            if data[start:start + length].rstrip(b"\0") == name:
+                self._changed.set()
+            offset = start + length
+
+    async def _poll(self):
+        signature = _file_signature(self.path)
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            current = _file_signature(self.path)
+            if current != signature:
+                signature = current
+                self._changed.set()
+
+    async def wait_for_change(self):
+        """等到文件被保存，并且 debounce 秒内没有新的变化"""
+        await self._changed.wait()
+        self._changed.clear()
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.debounce)
+            except asyncio.TimeoutError:
+                return
+            self._changed.clear()
+
+    def close(self):
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._poll_task:
+            self._poll_task.cancel()
+            self._poll_task = None
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+常驻浏览器守护进程：保持浏览器上下文和已打开的编辑器页面，
+通过本地Unix socket接收策略并把运行输出实时传回客户端
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import sys
+from playwright.async_api import async_playwright
+from browser_utils import open_browser_context
+from path_config import get_daemon_socket_file, ensure_jq_run_dirs
+from preflight import check_strategy_source, print_preflight_report
+from result_cache import put_cached_result
+from session_manager import SessionExpiredError, is_login_url
+from run_timing import start_run_timer
+from run_history import record_run_async
+from algorithm_slots import AlgorithmSlotPool, SlotLeaseTimeout, load_algorithm_ids
+from access_algorithm import (
+    DEFAULT_RUN_TIMEOUT,
+    SLOT_LEASE_GRACE,
+    check_auth_state_file,
+    load_auth_cookies,
+    lookup_cached_result,
+    open_editor_page,
+    preflight_failed_result,
+    print_execution_logs,
+    read_strategy_file,
+    result_exit_code,
+    session_expired_result,
+    run_strategy_on_editor,
+)
+
+# 预热的编辑器页面数量
+DEFAULT_POOL_SIZE = 1
+
+# 每个页面运行多少个任务后回收重建，避免内存持续增长
+DEFAULT_RECYCLE_AFTER = 20
+
+# 页面重建失败后的重试次数和间隔（秒）
+REBUILD_ATTEMPTS = 3
+REBUILD_RETRY_DELAY = 5
+
+# 客户端连接不上守护进程（或守护进程已没有可用页面）时的退出码，jq-run 据此回退到直接运行
+EXIT_DAEMON_UNAVAILABLE = 3
+
+# 守护进程没有可用页面时返回的运行状态
+DAEMON_UNAVAILABLE_STATUS = "daemon_unavailable"
+
+# 当前任务的输出流，print 的内容会转发给对应的客户端
+_job_stream = contextvars.ContextVar("job_stream", default=None)
+
+class _JobOutputRouter:
+    """替换 sys.stdout，把任务内的输出按行转发给提交该任务的客户端"""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def write(self, text):
+        writer = _job_stream.get()
+        if writer is None or writer.is_closing():
+            return self.fallback.write(text)
+        if text:
+            message = {"type": "output", "text": text}
+            writer.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+        return len(text)
+
+    def flush(self):
+        self.fallback.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.fallback, name)
+
+async def _send(writer, message):
+    writer.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+    await writer.drain()
+
+async def serve(pool_size=DEFAULT_POOL_SIZE, recycle_after=DEFAULT_RECYCLE_AFTER, browser_options=None,
+                algorithm_ids=None):
+    """
+    启动守护进程，直到收到 stop 请求
+
+    每个预热页面在守护进程运行期间独占一个 algorithmId，页面数不超过可用的算法数；
+    其他进程正在用的算法会被跳过。
+    """
+    auth_file = check_auth_state_file()
+    if not auth_file:
+        return
+
+    algorithm_ids = load_algorithm_ids(algorithm_ids)
+    if pool_size > len(algorithm_ids):
+        print(f"⚠ 只有 {len(algorithm_ids)} 个可用算法，预热页面数从 {pool_size} 降为 {len(algorithm_ids)}")
+        pool_size = len(algorithm_ids)
+    slot_pool = AlgorithmSlotPool(algorithm_ids)
+
+    ensure_jq_run_dirs()
+    socket_file = get_daemon_socket_file()
+    if os.path.exists(socket_file):
+        os.remove(socket_file)
+
+    sys.stdout = _JobOutputRouter(sys.stdout)
+    stop_event = asyncio.Event()
+
+    async with async_playwright() as p:
+        context, owns_context = await open_browser_context(p, browser_options)
+        await load_auth_cookies(context, auth_file, "isolated" if owns_context else "attach")
+
+        # 队列里放空闲页面；所有页面都重建失败后放入 None，让等待页面的任务立即返回
+        pages = asyncio.Queue()
+        stats = {"jobs": 0, "recycled": 0, "live_pages": 0}
+
+        async def preload_page(algorithm_id):
+            page = await context.new_page()
+            try:
+                await open_editor_page(page, algorithm_id)
+            except Exception:
+                await page.close()
+                raise
+            stats["live_pages"] += 1
+            await pages.put({"page": page, "jobs": 0, "algorithm_id": algorithm_id})
+
+        async def lease_and_preload():
+            # 不等待：其他进程正在用的算法直接跳过
+            algorithm_id = await slot_pool.lease(timeout=0)
+            try:
+                await preload_page(algorithm_id)
+            except Exception:
+                await slot_pool.release(algorithm_id)
+                raise
+
+        async def recycle_page(slot):
+            stats["recycled"] += 1
+            stats["live_pages"] -= 1
+            try:
+                await slot["page"].close()
+            except Exception:
+                pass
+            # 重建的页面继续使用同一个算法，多次重建失败时归还
+            for attempt in range(1, REBUILD_ATTEMPTS + 1):
+                try:
+                    await preload_page(slot["algorithm_id"])
+                    return
+                except SessionExpiredError as e:
+                    session_expired_result(e)
+                    break
+                except Exception as e:
+                    print(f"⚠ 重建编辑器页面失败（第{attempt}次）: {e}")
+                    if attempt < REBUILD_ATTEMPTS:
+                        await asyncio.sleep(REBUILD_RETRY_DELAY)
+            await slot_pool.release(slot["algorithm_id"])
+
+            if stats["live_pages"] == 0:
+                # 没有页面可用了：唤醒等待页面的任务并退出，之后的提交由 jq-run 回退到直接运行
+                print("❌ 没有可用的编辑器页面，守护进程退出")
+                pages.put_nowait(None)
+                stop_event.set()
+
+        async def run_job(request):
+            timer = start_run_timer(os.path.basename(request.get("file") or "<strategy>"))
+            strategy_content = request.get("content")
+            if strategy_content is None:
+                # 记下读到的代码，记录运行历史时计算策略哈希
+                strategy_content = request["content"] = await read_strategy_file(request["file"])
+            if not strategy_content:
+                return {"status": "read_failed", "log": "", "elapsed": 0.0}
+
+            if request.get("preflight", True):
+                report = check_strategy_source(strategy_content, request.get("file") or "<strategy>")
+                print_preflight_report(report)
+                if not report["ok"]:
+                    result = preflight_failed_result(report)
+                    print_execution_logs(result["log"])
+                    return result
+
+            cache_key = None
+            if request.get("use_cache", True):
+                cache_key, cached = lookup_cached_result(strategy_content, algorithm_ids)
+                if cached:
+                    print_execution_logs(cached["log"])
+                    return cached
+
+            slot = await pages.get()
+            if slot is None:
+                # 留给其他正在等待的任务
+                pages.put_nowait(None)
+                return {"status": DAEMON_UNAVAILABLE_STATUS, "log": "守护进程没有可用的编辑器页面", "elapsed": 0.0}
+            healthy = True
+            try:
+                # 预热的页面可能在空闲期间被登出
+                if is_login_url(slot["page"].url):
+                    healthy = False
+                    return session_expired_result(SessionExpiredError(f"登录已失效，页面跳转到了 {slot['page'].url}"))
+
+                # 超过运行超时加余量仍未结束时取消任务，页面回收后算法继续可用
+                run_timeout = request.get("timeout", DEFAULT_RUN_TIMEOUT)
+                try:
+                    result = await asyncio.wait_for(
+                        run_strategy_on_editor(slot["page"], strategy_content, run_timeout,
+                                               request.get("stream_logs", True)),
+                        run_timeout + SLOT_LEASE_GRACE)
+                except asyncio.TimeoutError:
+                    healthy = False
+                    print(f"✗ 任务超过 {run_timeout + SLOT_LEASE_GRACE:.0f} 秒仍未结束，已取消")
+                    result = {"status": "timeout", "log": "", "elapsed": run_timeout + SLOT_LEASE_GRACE}
+                result["algorithm_id"] = slot["algorithm_id"]
+                result["phases"] = timer.durations()
+                if result["status"] != "paste_failed":
+                    print_execution_logs(result["log"])
+                if cache_key:
+                    put_cached_result(cache_key, result)
+                return result
+            except Exception as e:
+                healthy = False
+                print(f"✗ 执行过程中出现错误: {e}")
+                return {"status": "exception", "log": str(e), "elapsed": 0.0}
+            finally:
+                stats["jobs"] += 1
+                slot["jobs"] += 1
+                if not healthy or slot["jobs"] >= recycle_after:
+                    # 页面重建放到后台，不耽误把结果返回给客户端
+                    asyncio.ensure_future(recycle_page(slot))
+                else:
+                    pages.put_nowait(slot)
+
+        async def handle_client(reader, writer):
+            try:
+                line = await reader.readline()
+                if not line:
+                    return
+                request = json.loads(line.decode("utf-8"))
+                action = request.get("action", "run")
+
+                if action == "run":
+                    token = _job_stream.set(writer)
+                    try:
+                        result = await run_job(request)
+                    finally:
+                        _job_stream.reset(token)
+                    await _send(writer, {"type": "result", **result})
+                    if result["status"] != DAEMON_UNAVAILABLE_STATUS:
+                        await record_run_async(result, request.get("file"), request.get("content"))
+                elif action == "status":
+                    await _send(writer, {"type": "status", "pool_size": pool_size,
+                                         "idle_pages": pages.qsize() if stats["live_pages"] else 0,
+                                         "algorithm_ids": slot_pool.leased, **stats})
+                elif action == "stop":
+                    await _send(writer, {"type": "stopped"})
+                    stop_event.set()
+                else:
+                    await _send(writer, {"type": "error", "message": f"未知操作: {action}"})
+            except Exception as e:
+                print(f"⚠ 处理客户端请求失败: {e}")
+            finally:
+                writer.close()
+
+        try:
+            print(f"🔥 正在预热 {pool_size} 个编辑器页面...")
+            preloads = await asyncio.gather(*(lease_and_preload() for _ in range(pool_size)),
+                                            return_exceptions=True)
+            for error in preloads:
+                if isinstance(error, SessionExpiredError):
+                    session_expired_result(error)
+                    return
+                if isinstance(error, SlotLeaseTimeout):
+                    print("⚠ 部分算法正在被其他进程使用，已跳过")
+                elif isinstance(error, Exception):
+                    print(f"⚠ 预热编辑器页面失败: {error}")
+            if pages.empty():
+                print("❌ 没有可用的编辑器页面，守护进程退出")
+                return
+
+            server = await asyncio.start_unix_server(handle_client, path=socket_file)
+            print(f"✅ 守护进程已就绪: {socket_file}")
+            print(f"♻️ 每个页面运行 {recycle_after} 个任务后回收")
+
+            async with server:
+                await stop_event.wait()
+        finally:
+            if os.path.exists(socket_file):
+                os.remove(socket_file)
+            if owns_context:
+                await context.close()
+            else:
+                # 连接的调试Chrome继续运行，只关闭预热的编辑器页面
+                while not pages.empty():
+                    slot = pages.get_nowait()
+                    if slot:
+                        await slot["page"].close()
+            await slot_pool.close()
+            print("👋 守护进程已退出")
+
+async def request_daemon(request, on_message):
+    """向守护进程发送一个请求，逐条回调返回的消息"""
+    reader, writer = await asyncio.open_unix_connection(get_daemon_socket_file())
+    try:
+        writer.write((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            on_message(json.loads(line.decode("utf-8")))
+    finally:
+        writer.close()
+
+async def submit_strategy(strategy_file, run_timeout=DEFAULT_RUN_TIMEOUT, use_cache=True):
+    """把策略提交给守护进程，实时打印输出，返回运行结果"""
+    with open(strategy_file, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    result = {}
+
+    def on_message(message):
+        if message["type"] == "output":
+            sys.stdout.write(message["text"])
+            sys.stdout.flush()
+        elif message["type"] == "result":
+            result.update(message)
+
+    await request_daemon({"action": "run", "file": os.path.abspath(strategy_file),
+                          "content": content, "timeout": run_timeout, "use_cache": use_cache}, on_message)
+    return result
+
+def main():
+    if len(sys.argv) < 2:
+        print("使用方法:")
+        print("  python jq_daemon.py <command>")
+        print("\n命令:")
+        print("  serve [--pool N] [--recycle-after N] [--algorithms id1,id2] [--headless] [--attach] - 启动守护进程")
+        print("  submit <strategy_file.py> [--timeout 秒] [--no-cache] - 提交策略并等待结果")
+        print("  status                                 - 查看守护进程状态")
+        print("  stop                                   - 停止守护进程")
+        return
+
+    command = sys.argv[1].lower()
+    args = sys.argv[2:]
+    options = {}
+    positional = []
+    while args:
+        arg = args.pop(0)
+        if arg in ("--pool", "--recycle-after", "--timeout") and args:
+            options[arg] = float(args.pop(0)) if arg == "--timeout" else int(args.pop(0))
+        elif arg == "--algorithms" and args:
+            options[arg] = args.pop(0)
+        elif arg in ("--headless", "--attach", "--no-cache"):
+            options[arg] = True
+        else:
+            positional.append(arg)
+
+    if command == "serve":
+        browser_options = {"headless": True, "block_resources": True} if options.get("--headless") else {}
+        if options.get("--attach"):
+            browser_options["attach"] = True
+        asyncio.run(serve(options.get("--pool", DEFAULT_POOL_SIZE),
+                          options.get("--recycle-after", DEFAULT_RECYCLE_AFTER),
+                          browser_options, options.get("--algorithms")))
+        return
+
+    try:
+        if command == "submit":
+            if not positional or not os.path.isfile(positional[0]):
+                print("❌ 缺少策略文件参数或文件不存在")
+                sys.exit(1)
+            result = asyncio.run(submit_strategy(positional[0],
+                                                 options.get("--timeout", DEFAULT_RUN_TIMEOUT),
+                                                 not options.get("--no-cache")))
+            if result.get("status", DAEMON_UNAVAILABLE_STATUS) == DAEMON_UNAVAILABLE_STATUS:
+                # 守护进程没有页面或中途退出，没有拿到结果
+                print("⚠ 守护进程没有返回运行结果")
+                sys.exit(EXIT_DAEMON_UNAVAILABLE)
+            sys.exit(result_exit_code(result))
+        elif command in ("status", "stop"):
+            asyncio.run(request_daemon({"action": command},
+                                       lambda message: print(json.dumps(message, ensure_ascii=False))))
+        else:
+            print(f"❌ 未知命令: {command}")
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"⚠ 守护进程未运行: {get_daemon_socket_file()}")
+        sys.exit(EXIT_DAEMON_UNAVAILABLE)
+
+if __name__ == "__main__":
+    main()
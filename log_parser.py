@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+日志解析模块：把日志面板的文本解析成结构化结果
+（状态、异常类型、错误信息、用户代码行号、堆栈帧、耗时）
+"""
+
+import re
+
+# 与原来页面内提取逻辑相同：从第一个错误标记开始，到空行、加载提示或"结束."为止
+ERROR_BLOCK_PATTERN = re.compile(r"(?:ERROR|错误|Traceback|AttributeError)[\s\S]*?(?=\n\n|正在加载日志|结束\.|$)")
+
+# Traceback 中的一帧: File "user_code.py", line 12, in handle_data
+FRAME_PATTERN = re.compile(r'File "(?P<file>[^"]+)", line (?P<line>\d+)(?:, in (?P<function>[^\n]+))?(?:\n[ \t]+(?P<code>[^\n]+))?')
+
+# 异常行: NameError: name 'foo' is not defined
+EXCEPTION_PATTERN = re.compile(r"^(?P<type>[A-Za-z_][\w.]*(?:Error|Exception|Warning|Interrupt|Exit))(?::[ \t]*(?P<message>.*))?$", re.M)
+
+# 用户策略代码在平台堆栈里的文件名
+USER_CODE_FILE_PATTERN = re.compile(r"user_code|<string>", re.I)
+
+# 策略用 log.info("METRIC sharpe=1.23 returns=0.18") 输出的指标，参数扫描时汇总到结果表
+METRIC_LINE_PATTERN = re.compile(r"METRIC[:\s]+(?P<pairs>.+)$", re.M)
+METRIC_PAIR_PATTERN = re.compile(r"(?P<name>[A-Za-z_]\w*)=(?P<value>[^\s,;]+)")
+
+# 日志中的耗时信息
+ELAPSED_PATTERNS = [
+    re.compile(r"耗时[:：]?\s*(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>ms|毫秒|s|秒)"),
+    re.compile(r"(?:elapsed|took)[:\s]*(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>ms|s)", re.I),
+]
+
+def extract_error_text(log_text):
+    """从日志文本中截取错误段落，没有错误时返回空字符串"""
+    match = ERROR_BLOCK_PATTERN.search(log_text or "")
+    return match.group(0).strip() if match else ""
+
+def parse_traceback_frames(error_text):
+    """解析 Traceback 中的所有帧"""
+    frames = []
+    for match in FRAME_PATTERN.finditer(error_text):
+        frames.append({
+            "file": match.group("file"),
+            "line": int(match.group("line")),
+            "function": (match.group("function") or "").strip() or None,
+            "code": (match.group("code") or "").strip() or None,
+            "user_code": bool(USER_CODE_FILE_PATTERN.search(match.group("file"))),
+        })
+    return frames
+
+def parse_elapsed_seconds(log_text):
+    """解析日志中的耗时（秒），找不到时返回None"""
+    for pattern in ELAPSED_PATTERNS:
+        match = pattern.search(log_text)
+        if match:
+            value = float(match.group("value"))
+            return value / 1000 if match.group("unit") in ("ms", "毫秒") else value
+    return None
+
+def parse_metrics(log_text):
+    """解析日志中的 METRIC 行，同名指标以最后一次为准，数值转成float"""
+    metrics = {}
+    for line in METRIC_LINE_PATTERN.finditer(log_text or ""):
+        for pair in METRIC_PAIR_PATTERN.finditer(line.group("pairs")):
+            value = pair.group("value")
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+            metrics[pair.group("name")] = value
+    return metrics
+
+def parse_execution_log(log_text):
+    """
+    把日志面板文本解析成结构化结果
+
+    Returns:
+        dict: status、exception_type、message、user_lines、frames、elapsed_seconds、metrics、error_text
+    """
+    log_text = log_text or ""
+    error_text = extract_error_text(log_text)
+    frames = parse_traceback_frames(error_text)
+
+    exception_type = None
+    message = None
+    exceptions = list(EXCEPTION_PATTERN.finditer(error_text))
+    if exceptions:
+        # 链式异常以最后一个为准
+        exception_type = exceptions[-1].group("type")
+        message = (exceptions[-1].group("message") or "").strip() or None
+    elif error_text:
+        message = error_text.splitlines()[0].strip()
+
+    if error_text:
+        status = "error"
+    elif log_text.strip():
+        status = "success"
+    else:
+        status = "empty"
+
+    return {
+        "status": status,
+        "exception_type": exception_type,
+        "message": message,
+        "user_lines": sorted({frame["line"] for frame in frames if frame["user_code"]}),
+        "frames": frames,
+        "elapsed_seconds": parse_elapsed_seconds(log_text),
+        "metrics": parse_metrics(log_text),
+        "error_text": error_text,
+    }
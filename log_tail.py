@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+实时日志模块：策略运行期间把日志面板新增的行实时输出到终端
+"""
+
+import contextvars
+import json
+
+# 页面通过带这个前缀的 console.debug 把新增日志行发回来
+LOG_TAIL_MARKER = "__jq_log_tail__"
+
+# 页面内合并DOM变化的间隔（毫秒）
+LOG_TAIL_FLUSH_INTERVAL = 100
+
+def _print_tail_lines(lines):
+    for line in lines:
+        if line.strip():
+            print(f"│ {line}", flush=True)
+
+async def start_log_tail(page, selectors):
+    """
+    开始实时输出日志面板的新增行
+
+    页面内用 MutationObserver 只收集新增的节点和追加的文字，按完整的行通过 console 事件发回，
+    不重新读取整个面板，面板删掉旧行也不会重复输出；Python 端收到就打印，不做累积，
+    长时间回测每次输出的开销和内存都不会增长。
+
+    Args:
+        page: 页面
+        selectors: 日志容器选择器，使用第一个存在的容器
+
+    Returns:
+        console 事件处理函数，交给 stop_log_tail 移除
+    """
+    # 保存当前上下文，console 回调里的输出和发起运行的任务走同一个输出流
+    context = contextvars.copy_context()
+
+    def on_console(message):
+        text = message.text
+        if not text.startswith(LOG_TAIL_MARKER):
+            return
+        try:
+            lines = json.loads(text[len(LOG_TAIL_MARKER):])
+        except ValueError:
+            return
+        context.run(_print_tail_lines, lines)
+
+    page.on("console", on_console)
+    await page.evaluate("""
+        ({ selectors, marker, interval }) => {
+            if (window.__jqLogTail) window.__jqLogTail.stop(false);
+
+            const findContainer = () => {
+                for (const selector of selectors) {
+                    const container = document.querySelector(selector);
+                    if (container) return container;
+                }
+                return null;
+            };
+
+            // 只处理之后新增的节点和文字，不重新读取整个面板：每次输出的开销只和新增内容有关
+            let container = findContainer();
+            let pending = '';
+            // 最后一行可能还没写完，等出现换行（或停止时）再输出
+            let partial = '';
+            let timer = null;
+
+            const nodeText = node => {
+                if (node.nodeType === 3) return node.data;
+                if (node.nodeType !== 1) return '';
+                const text = node.innerText || node.textContent || '';
+                // 块级元素自成一行
+                return getComputedStyle(node).display === 'inline' ? text : '\\n' + text + '\\n';
+            };
+
+            const collect = records => {
+                if (!container || !container.isConnected) {
+                    const current = findContainer();
+                    if (current && current !== container) pending += nodeText(current);
+                    container = current;
+                }
+                if (!container) return;
+
+                const added = new Set();
+                records.forEach(record => record.addedNodes.forEach(node => added.add(node)));
+                // 祖先节点也是这一批新增的，文字已经算在祖先节点里
+                const insideAdded = node => {
+                    for (let parent = node; parent && parent !== container; parent = parent.parentNode) {
+                        if (added.has(parent)) return true;
+                    }
+                    return false;
+                };
+
+                for (const record of records) {
+                    if (record.target !== container && !container.contains(record.target)) continue;
+                    if (record.type === 'characterData') {
+                        if (insideAdded(record.target)) continue;
+                        const data = record.target.data || '';
+                        const old = record.oldValue || '';
+                        pending += data.startsWith(old) ? data.slice(old.length) : '\\n' + data;
+                    } else {
+                        record.addedNodes.forEach(node => {
+                            if (!insideAdded(node.parentNode)) pending += nodeText(node);
+                        });
+                    }
+                }
+            };
+
+            const flush = (final) => {
+                timer = null;
+                const lines = (partial + pending).split('\\n');
+                pending = '';
+                partial = final ? '' : lines.pop();
+                const complete = lines.filter(line => line.trim());
+                if (complete.length) console.debug(marker + JSON.stringify(complete));
+            };
+
+            const observer = new MutationObserver(records => {
+                collect(records);
+                if (!timer) timer = setTimeout(() => flush(false), interval);
+            });
+            observer.observe(document.body, {
+                childList: true, subtree: true, characterData: true, characterDataOldValue: true
+            });
+
+            window.__jqLogTail = {
+                stop: (final = true) => {
+                    collect(observer.takeRecords());
+                    observer.disconnect();
+                    if (timer) clearTimeout(timer);
+                    if (final) flush(true);
+                    window.__jqLogTail = null;
+                }
+            };
+        }
+    """, {"selectors": selectors, "marker": LOG_TAIL_MARKER, "interval": LOG_TAIL_FLUSH_INTERVAL})
+    return on_console
+
+async def stop_log_tail(page, handler):
+    """输出剩余的日志行并停止监听"""
+    try:
+        await page.evaluate("() => window.__jqLogTail && window.__jqLogTail.stop()")
+    except Exception as e:
+        print(f"⚠ 停止实时日志失败: {e}")
+    finally:
+        page.remove_listener("console", handler)
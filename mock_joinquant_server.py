@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+本地模拟的聚宽算法编辑页面：提供 Ace 编辑器实例、#code、#buildBtn 和 #log，
+编译运行后按设定的延迟逐步输出日志，可按比例或按策略里的指令产生错误。
+用于 benchmark.py 在不访问 joinquant.com 的情况下测量整个运行流程
+"""
+
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# 默认的模拟参数
+DEFAULT_MOCK_CONFIG = {
+    "ready_delay": 0.2,      # 编辑器加载耗时（秒）
+    "run_delay": 1.0,        # 编译运行到结束的耗时（秒）
+    "log_lines": 20,         # 每次运行输出的日志行数
+    "error_rate": 0.0,       # 随机产生运行错误的比例
+    "poll_interval": 0.2,    # 页面轮询回测状态的间隔（秒）
+    "expire_session": False, # 为真时编辑页面跳转到登录页，模拟登录失效
+    "seed": None,            # 随机数种子
+}
+
+# 策略代码里可以用注释指定本次运行的行为，例如: # mock: delay=0.5 lines=100 error=NameError
+MOCK_DIRECTIVE_PATTERN = re.compile(r"^#\s*mock:(?P<options>.*)$", re.M)
+
+EDITOR_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>模拟聚宽策略编辑器</title></head>
+<body>
+<div id="editor" class="ace_editor" style="height: 300px; border: 1px solid #ccc;">
+  <textarea class="ace_text-input"></textarea>
+</div>
+<textarea id="code" name="code" style="display: none;"></textarea>
+<button id="buildBtn" class="btn disabled" disabled>
+  <span class="active-text" title="编译运行(Ctrl+Alt+B)">编译运行</span>
+</button>
+<pre id="log"></pre>
+<script>
+(() => {
+  const config = __CONFIG__;
+  const editorEl = document.getElementById('editor');
+  const code = document.getElementById('code');
+  const button = document.getElementById('buildBtn');
+  const log = document.getElementById('log');
+
+  let value = '';
+  const session = {
+    setValue: (text) => { value = String(text); code.value = value; },
+    getValue: () => value,
+  };
+  // Ace Document 中增量更新用到的几个方法
+  session.doc = {
+    getValue: () => value,
+    getAllLines: () => value.split('\\n'),
+    insertFullLines: (row, lines) => {
+      const all = value.split('\\n');
+      all.splice(row, 0, ...lines);
+      session.setValue(all.join('\\n'));
+    },
+    removeFullLines: (first, last) => {
+      const all = value.split('\\n');
+      all.splice(first, last - first + 1);
+      session.setValue(all.join('\\n'));
+    },
+  };
+  const editor = {
+    session,
+    getValue: () => value,
+    setValue: (text) => session.setValue(text),
+    clearSelection: () => {},
+  };
+  code.addEventListener('input', () => { value = code.value; });
+
+  // 模拟 Ace 和页面脚本的加载耗时
+  setTimeout(() => {
+    editorEl.env = { editor };
+    button.disabled = false;
+    button.classList.remove('disabled');
+  }, config.ready_delay * 1000);
+
+  button.addEventListener('click', async () => {
+    log.textContent = '';
+    const response = await fetch('/mock/build?algorithmId=' + encodeURIComponent(config.algorithm_id),
+                                 { method: 'POST', body: value });
+    const { run_id } = await response.json();
+
+    let offset = 0;
+    const poll = async () => {
+      const r = await fetch('/algorithm/backtest/status?runId=' + run_id + '&offset=' + offset);
+      const { data } = await r.json();
+      for (const line of data.lines) log.appendChild(document.createTextNode(line + '\\n'));
+      offset += data.lines.length;
+      if (data.status === 'running') setTimeout(poll, config.poll_interval * 1000);
+      else if (data.status === 'done') fetch('/algorithm/backtest/result?runId=' + run_id);
+    };
+    poll();
+  });
+})();
+</script>
+</body>
+</html>
+"""
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>登录</title></head>
+<body><form><input name="username"><input type="password" name="password"></form></body>
+</html>
+"""
+
+def parse_mock_directives(code):
+    """解析策略代码里的 # mock: 指令"""
+    directives = {}
+    for match in MOCK_DIRECTIVE_PATTERN.finditer(code or ""):
+        for item in match.group("options").split():
+            key, _, value = item.partition("=")
+            directives[key.strip()] = value.strip()
+    return directives
+
+def build_run_result(seed, days=20):
+    """生成一次成功运行的收益曲线和成交记录（列式的序列 + 对象数组，和聚宽结果接口的两种形式对应）"""
+    rng = random.Random(seed)
+    times, returns, benchmark = [], [], []
+    value = base = 0.0
+    for day in range(days):
+        value += rng.gauss(0.001, 0.01)
+        base += rng.gauss(0.0005, 0.008)
+        times.append(f"2024-01-{day + 2:02d}")
+        returns.append(round(value, 6))
+        benchmark.append(round(base, 6))
+    trades = [{"time": times[day], "security": "000001.XSHE", "action": "open" if day % 2 == 0 else "close",
+               "amount": 100 * (day + 1), "price": round(10 + rng.random(), 2)} for day in range(0, days, 5)]
+    return {"returns": {"time": times, "returns": returns, "benchmark_returns": benchmark}, "trades": trades}
+
+def build_run_logs(line_count, error_type=None):
+    """生成一次运行的日志行，出错时以 Traceback 结尾，否则以"结束."结尾"""
+    lines = ["开始编译运行..."]
+    lines += [f"2024-01-02 09:{30 + i // 60:02d}:{i % 60:02d} - INFO  - 模拟日志第{i + 1}行" for i in range(line_count)]
+    if error_type:
+        lines += [
+            "Traceback (most recent call last):",
+            '  File "user_code.py", line 12, in handle_data',
+            "    value = undefined_name",
+            f"{error_type}: 模拟的运行错误",
+            "",
+        ]
+    else:
+        lines += ["运行成功", "结束."]
+    return lines
+
+class MockJoinQuantServer(ThreadingHTTPServer):
+    """保存模拟参数和进行中的运行"""
+
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, MockJoinQuantHandler)
+        self.config = config
+        self.runs = {}
+        self.results = {}
+        self.lock = threading.Lock()
+        self.random = random.Random(config.get("seed"))
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def create_run(self, code):
+        directives = parse_mock_directives(code)
+        with self.lock:
+            failed = self.random.random() < self.config["error_rate"]
+        error_type = directives.get("error") or ("RuntimeError" if failed else None)
+        run = {
+            "started": time.monotonic(),
+            "delay": float(directives.get("delay", self.config["run_delay"])),
+            "lines": build_run_logs(int(directives.get("lines", self.config["log_lines"])), error_type),
+            "failed": bool(error_type),
+        }
+        run_id = uuid.uuid4().hex
+        with self.lock:
+            self.runs[run_id] = run
+        return run_id
+
+    def run_status(self, run_id, offset):
+        with self.lock:
+            run = self.runs.get(run_id)
+        if not run:
+            return {"status": "error", "lines": [f"未知的运行: {run_id}"]}
+
+        # 日志按运行进度逐步输出，到达延迟后全部输出并进入终止状态
+        progress = min(1.0, (time.monotonic() - run["started"]) / run["delay"]) if run["delay"] > 0 else 1.0
+        visible = len(run["lines"]) if progress >= 1.0 else int(len(run["lines"]) * progress)
+        if progress < 1.0:
+            status = "running"
+        else:
+            status = "failed" if run["failed"] else "done"
+            with self.lock:
+                self.runs.pop(run_id, None)
+                if not run["failed"]:
+                    self.results[run_id] = build_run_result(run_id)
+        return {"status": status, "lines": run["lines"][offset:visible]}
+
+class MockJoinQuantHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8", headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, payload):
+        self._send(200, json.dumps(payload, ensure_ascii=False), "application/json; charset=utf-8")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == "/algorithm/index/edit":
+            if self.server.config["expire_session"]:
+                self._send(302, "", headers={"Location": "/user/login?redirect=" + url.path})
+                return
+            page_config = {key: self.server.config[key] for key in ("ready_delay", "poll_interval")}
+            page_config["algorithm_id"] = query.get("algorithmId", [""])[0]
+            self._send(200, EDITOR_PAGE.replace("__CONFIG__", json.dumps(page_config)))
+        elif url.path == "/algorithm/backtest/status":
+            offset = int(query.get("offset", ["0"])[0])
+            self._send_json({"data": self.server.run_status(query.get("runId", [""])[0], offset)})
+        elif url.path == "/algorithm/backtest/result":
+            with self.server.lock:
+                result = self.server.results.pop(query.get("runId", [""])[0], None)
+            self._send_json({"data": result} if result else {"data": None, "error": "未知的运行"})
+        elif url.path == "/user/login":
+            self._send(200, LOGIN_PAGE)
+        else:
+            self._send(404, "not found", "text/plain; charset=utf-8")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/mock/build":
+            self._send(404, "not found", "text/plain; charset=utf-8")
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        code = self.rfile.read(length).decode("utf-8", "replace")
+        self._send_json({"run_id": self.server.create_run(code)})
+
+def start_mock_server(host="127.0.0.1", port=0, **config):
+    """
+    在后台线程启动模拟服务器
+
+    Returns:
+        MockJoinQuantServer: server.url 为访问地址，用完调用 server.shutdown()
+    """
+    server = MockJoinQuantServer((host, port), {**DEFAULT_MOCK_CONFIG, **config})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    options = {}
+    value_options = {
+        "--port": ("port", int),
+        "--ready-delay": ("ready_delay", float),
+        "--run-delay": ("run_delay", float),
+        "--log-lines": ("log_lines", int),
+        "--error-rate": ("error_rate", float),
+        "--seed": ("seed", int),
+    }
+
+    args = sys.argv[1:]
+    while args:
+        arg = args.pop(0)
+        name, _, value = arg.partition("=")
+        if name in value_options and (value or args):
+            key, convert = value_options[name]
+            options[key] = convert(value or args.pop(0))
+        elif arg == "--expire-session":
+            options["expire_session"] = True
+        else:
+            print(f"⚠ 忽略未知参数: {arg}")
+
+    port = options.pop("port", 8765)
+    server = MockJoinQuantServer(("127.0.0.1", port), {**DEFAULT_MOCK_CONFIG, **options})
+    print(f"🧪 模拟聚宽服务器: {server.url}")
+    print(f"   JQ_BASE_URL={server.url} python access_algorithm.py strategy.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,12 @@
 
 import os
 
+# 环境变量，指定后所有数据放在该目录下（benchmark.py 用它隔离登录状态和浏览器数据）
+JQ_RUN_DIR_ENV = "JQ_RUN_DIR"
+
 def get_jq_run_dir():
     """获取 ~/.jq-run 目录路径"""
-    return os.path.expanduser("~/.jq-run")
+    return os.environ.get(JQ_RUN_DIR_ENV) or os.path.expanduser("~/.jq-run")
 
 def get_auth_state_file():
     """获取认证状态文件路径"""
@@ -17,16 +20,69 @@ def get_browser_data_dir():
     """获取浏览器数据目录路径"""
     return os.path.join(get_jq_run_dir(), "browser_data")
 
+def get_debug_chrome_data_dir():
+    """获取自动启动的调试Chrome的数据目录路径（在浏览器数据目录里）"""
+    return os.path.join(get_browser_data_dir(), "debug")
+
 def get_browser_backup_dir():
     """获取浏览器备份目录路径"""
     return os.path.join(get_jq_run_dir(), "backups")
 
+def get_daemon_socket_file():
+    """获取常驻浏览器守护进程的Unix socket路径"""
+    return os.path.join(get_jq_run_dir(), "daemon.sock")
+
+def get_resource_size_hints_file():
+    """获取资源大小记录文件路径（用于估算无头模式拦截的字节数）"""
+    return os.path.join(get_jq_run_dir(), "resource_sizes.json")
+
+def get_selector_cache_file():
+    """获取页面元素选择器学习记录文件路径"""
+    return os.path.join(get_jq_run_dir(), "selectors.json")
+
+def get_result_cache_dir():
+    """获取运行结果缓存目录路径"""
+    return os.path.join(get_jq_run_dir(), "result_cache")
+
+def get_chrome_cache_file():
+    """获取Chrome可执行文件解析结果的缓存路径"""
+    return os.path.join(get_jq_run_dir(), "chrome.json")
+
+def get_cdp_endpoint_file():
+    """获取调试Chrome的CDP地址记录文件路径"""
+    return os.path.join(get_jq_run_dir(), "cdp_endpoint.json")
+
+def get_session_marker_file():
+    """获取登录状态注入记录文件路径"""
+    return os.path.join(get_jq_run_dir(), "session.json")
+
+def get_algorithm_ids_file():
+    """获取可用 algorithmId 列表的配置文件路径"""
+    return os.path.join(get_jq_run_dir(), "algorithms.json")
+
+def get_algorithm_lock_dir():
+    """获取 algorithmId 租用锁文件目录路径"""
+    return os.path.join(get_jq_run_dir(), "algorithm_locks")
+
+def get_timing_log_file():
+    """获取运行计时记录文件路径（每次运行一行JSON）"""
+    return os.path.join(get_jq_run_dir(), "timings.jsonl")
+
+def get_capture_dir():
+    """获取回测接口响应捕获目录路径"""
+    return os.path.join(get_jq_run_dir(), "captures")
+
+def get_history_db_file():
+    """获取运行历史数据库路径"""
+    return os.path.join(get_jq_run_dir(), "history.sqlite3")
+
 def ensure_jq_run_dirs():
     """确保所有必要的目录存在"""
     dirs = [
         get_jq_run_dir(),
         get_browser_data_dir(),
-        get_browser_backup_dir()
+        get_browser_backup_dir(),
+        get_result_cache_dir()
     ]
 
     for dir_path in dirs:
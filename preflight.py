@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+预检模块：启动浏览器之前在本地检查策略代码，
+语法错误、缺少 initialize、回调函数签名错误等问题直接报告，不再提交远程运行
+"""
+
+import ast
+import builtins
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# 平台会调用的回调函数及其参数个数
+STRATEGY_HANDLERS = {
+    "initialize": 1,
+    "process_initialize": 1,
+    "after_code_changed": 1,
+    "before_trading_start": 1,
+    "handle_data": 2,
+    "handle_tick": 2,
+    "after_trading_end": 1,
+    "on_strategy_end": 1,
+    "on_event": 2,
+}
+
+# 必须定义的回调
+REQUIRED_HANDLERS = {"initialize"}
+
+# 策略运行环境中不需要 import 就能使用的聚宽API
+JOINQUANT_API_NAMES = {
+    # 全局对象
+    "g", "log", "context",
+    # 设置
+    "set_benchmark", "set_option", "set_order_cost", "OrderCost", "set_slippage", "FixedSlippage",
+    "PriceRelatedSlippage", "StepRelatedSlippage", "set_commission", "PerTrade", "set_universe",
+    "set_subportfolios", "SubPortfolioConfig", "set_params", "disable_cache", "enable_profile",
+    # 定时运行
+    "run_daily", "run_weekly", "run_monthly", "unschedule_all",
+    # 下单
+    "order", "order_target", "order_value", "order_target_value", "cancel_order", "get_open_orders",
+    "get_orders", "get_trades", "MarketOrderStyle", "LimitOrderStyle", "OrderStatus", "transfer_cash",
+    "batch_submit_orders", "batch_cancel_orders",
+    # 数据
+    "get_price", "history", "attribute_history", "get_bars", "get_current_data", "get_current_tick",
+    "get_ticks", "get_call_auction", "get_fundamentals", "get_fundamentals_continuously", "get_valuation",
+    "query", "valuation", "income", "balance", "cash_flow", "indicator", "bank_indicator",
+    "security_indicator", "insurance_indicator",
+    "get_index_stocks", "get_industry_stocks", "get_concept_stocks", "get_all_securities",
+    "get_security_info", "get_all_trade_days", "get_trade_days", "get_extras", "get_billboard_list",
+    "get_locked_shares", "get_index_weights", "get_industry", "get_industries", "get_concept",
+    "get_concepts", "get_mtss", "get_money_flow", "get_factor_values", "get_all_factors",
+    "get_marginsec_stocks", "get_margincash_stocks", "get_dominant_future", "get_future_contracts",
+    "normalize_code", "finance", "macro", "opt", "bond", "jy", "sup",
+    # 订阅、消息和文件
+    "subscribe", "unsubscribe", "unsubscribe_all", "record", "send_message", "write_file", "read_file",
+}
+
+def _issue(node, code, message):
+    return {"line": getattr(node, "lineno", None), "col": getattr(node, "col_offset", None),
+            "code": code, "message": message}
+
+def _positional_arg_count(function):
+    args = function.args
+    return len(args.posonlyargs) + len(args.args)
+
+def _required_arg_count(function):
+    return _positional_arg_count(function) - len(function.args.defaults)
+
+def _collect_bound_names(tree):
+    """收集模块中任何位置绑定过的名字（不区分作用域，宁可漏报不误报）"""
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                bound.add((alias.asname or alias.name).split(".")[0])
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchAs) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchStar) and node.name:
+            bound.add(node.name)
+    return bound
+
+def check_strategy_source(source, filename="<strategy>"):
+    """
+    检查策略源码
+
+    Returns:
+        dict: {"file", "ok", "errors", "warnings"}，errors 非空时不应提交远程运行
+    """
+    report = {"file": filename, "ok": True, "errors": [], "warnings": []}
+
+    # 语法检查：compile 同时覆盖 ast.parse 发现不了的问题（如 return 在函数外）
+    try:
+        tree = ast.parse(source, filename)
+        compile(tree, filename, "exec")
+    except SyntaxError as e:
+        report["errors"].append({"line": e.lineno, "col": e.offset, "code": "syntax-error",
+                                 "message": f"{type(e).__name__}: {e.msg}"})
+        report["ok"] = False
+        return report
+
+    # 回调函数检查
+    handlers = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name in STRATEGY_HANDLERS:
+            handlers[node.name] = node
+
+    for name in sorted(REQUIRED_HANDLERS - set(handlers)):
+        report["errors"].append({"line": None, "col": None, "code": "missing-handler",
+                                 "message": f"缺少必需的函数 {name}(context)"})
+
+    for name, function in handlers.items():
+        expected = STRATEGY_HANDLERS[name]
+        accepts_varargs = function.args.vararg is not None
+        if isinstance(function, ast.AsyncFunctionDef):
+            report["errors"].append(_issue(function, "async-handler", f"{name} 不能是 async 函数"))
+        elif _required_arg_count(function) > expected or (
+                _positional_arg_count(function) < expected and not accepts_varargs):
+            report["errors"].append(_issue(
+                function, "bad-signature",
+                f"{name} 应接受 {expected} 个位置参数，实际定义了 {_positional_arg_count(function)} 个"))
+
+    # 未定义名字检查：平台注入的API和内置函数之外的名字只给出警告
+    known = _collect_bound_names(tree) | JOINQUANT_API_NAMES | set(dir(builtins))
+    reported = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in known:
+            if node.id not in reported:
+                reported.add(node.id)
+                report["warnings"].append(_issue(node, "unknown-name",
+                                                 f"名字 {node.id} 未定义，也不是聚宽API"))
+
+    report["ok"] = not report["errors"]
+    return report
+
+def check_strategy_file(strategy_file):
+    """读取并检查一个策略文件"""
+    try:
+        with open(strategy_file, "r", encoding="utf-8") as f:
+            source = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return {"file": strategy_file, "ok": False, "warnings": [],
+                "errors": [{"line": None, "col": None, "code": "read-error", "message": str(e)}]}
+    return check_strategy_source(source, strategy_file)
+
+def check_strategy_files(strategy_files, max_workers=None):
+    """并行检查多个策略文件，返回顺序与输入一致"""
+    if len(strategy_files) <= 1:
+        # 单个文件不值得启动进程池
+        return [check_strategy_file(f) for f in strategy_files]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(check_strategy_file, strategy_files, chunksize=8))
+
+def _check_source_item(item):
+    name, source = item
+    return check_strategy_source(source, name)
+
+def check_strategy_sources(sources, max_workers=None):
+    """并行检查多份内存中的策略源码（{名字: 源码}），返回顺序与输入一致"""
+    items = list(sources.items())
+    if len(items) <= 1:
+        return [check_strategy_source(source, name) for name, source in items]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_check_source_item, items, chunksize=8))
+
+def print_preflight_report(report):
+    """打印单个文件的预检结果"""
+    if report["ok"] and not report["warnings"]:
+        print(f"✓ 预检通过: {report['file']}")
+        return
+
+    icon = "✓" if report["ok"] else "✗"
+    print(f"{icon} 预检{'通过（有警告）' if report['ok'] else '失败'}: {report['file']}")
+    for level, issues in (("错误", report["errors"]), ("警告", report["warnings"])):
+        for issue in issues:
+            location = f"第{issue['line']}行" if issue["line"] else "文件"
+            print(f"  {level} {location} [{issue['code']}] {issue['message']}")
+
+def format_preflight_errors(report):
+    """把预检错误格式化成日志文本，作为运行结果的 log"""
+    return "\n".join(
+        f"{os.path.basename(report['file'])}:{issue['line'] or 0}: {issue['message']}"
+        for issue in report["errors"]
+    )
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python preflight.py <strategy_file.py> [more_files.py ...]")
+        sys.exit(1)
+
+    reports = check_strategy_files(sys.argv[1:])
+    for report in reports:
+        print_preflight_report(report)
+    sys.exit(0 if all(report["ok"] for report in reports) else 1)
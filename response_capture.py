@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+回测接口响应捕获：运行期间监听页面的网络响应，识别回测状态、日志和结果接口，
+直接保存接口返回的JSON，并整理成列式数据写入 ~/.jq-run/captures
+"""
+
+import asyncio
+import importlib.util
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import weakref
+from path_config import get_capture_dir
+
+# 回测相关接口的URL特征，按顺序匹配，先匹配到的类型生效
+ENDPOINT_PATTERNS = [
+    ("status", re.compile(r"/algorithm/(?:backtest|build)[^?]*status", re.I)),
+    ("log", re.compile(r"/algorithm/(?:backtest|build)[^?]*log", re.I)),
+    ("result", re.compile(r"/algorithm/backtest[^?]*(?:result|return|position|trade|order|record|stat|risk)", re.I)),
+]
+
+# 状态/日志接口中存放日志行的字段
+LOG_LINE_KEYS = ("lines", "logs", "log")
+
+# 停止捕获时等待还没返回的回测接口请求和还没读完的响应体的最长时间（秒）
+PENDING_READ_TIMEOUT = 2.0
+PENDING_POLL_INTERVAL = 0.05
+
+# 最多保留的捕获记录数，超出后删除最早的
+MAX_CAPTURE_RUNS = 200
+
+# 每个页面上正在进行的捕获，超时或取消后留下的捕获在下一次开始时关闭
+_active_captures = weakref.WeakKeyDictionary()
+
+def classify_response_url(url):
+    """返回接口类型（status / log / result），不是回测接口时返回None"""
+    for kind, pattern in ENDPOINT_PATTERNS:
+        if pattern.search(url):
+            return kind
+    return None
+
+def _payload_data(payload):
+    return payload.get("data", payload) if isinstance(payload, dict) else payload
+
+def payload_status(payload):
+    """接口返回的运行状态（小写），没有时返回空字符串"""
+    data = _payload_data(payload)
+    return str(data.get("status", "")).lower() if isinstance(data, dict) else ""
+
+class ResponseCapture:
+    """
+    捕获一个页面上回测接口的响应
+
+    每个响应体只读取并解析一次，解析结果按到达顺序保存，
+    同时通知 add_listener 注册的回调（运行完成检测用它判断终止状态）。
+    运行结束后页面才去取的结果接口，由 stop() 等它返回。
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.responses = []
+        self._listeners = []
+        self._requests = set()
+        self._pending = set()
+        self._attached = False
+
+    def start(self):
+        previous = _active_captures.get(self.page)
+        if previous:
+            previous.close()
+        _active_captures[self.page] = self
+        self.page.on("request", self._on_request)
+        self.page.on("requestfailed", self._on_request_failed)
+        self.page.on("response", self._on_response)
+        self._attached = True
+        return self
+
+    def add_listener(self, listener):
+        """注册回调 listener(kind, payload)"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _on_request(self, request):
+        if classify_response_url(request.url):
+            self._requests.add(request)
+
+    def _on_request_failed(self, request):
+        self._requests.discard(request)
+
+    def _on_response(self, response):
+        kind = classify_response_url(response.url)
+        if not kind:
+            return
+        self._requests.discard(response.request)
+        task = asyncio.ensure_future(self._read(kind, response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _read(self, kind, response):
+        try:
+            payload = await response.json()
+        except Exception:
+            return
+        self.responses.append({"kind": kind, "url": response.url, "http_status": response.status,
+                               "time": time.time(), "payload": payload})
+        for listener in list(self._listeners):
+            listener(kind, payload)
+
+    async def stop(self, timeout=PENDING_READ_TIMEOUT):
+        """等待已经发出的回测接口请求返回并读完（最多 timeout 秒），然后停止捕获"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self._requests or self._pending) and loop.time() < deadline:
+            await asyncio.sleep(PENDING_POLL_INTERVAL)
+        self.close()
+
+    def close(self):
+        """立即停止捕获"""
+        if not self._attached:
+            return
+        self._attached = False
+        self.page.remove_listener("request", self._on_request)
+        self.page.remove_listener("requestfailed", self._on_request_failed)
+        self.page.remove_listener("response", self._on_response)
+        if _active_captures.get(self.page) is self:
+            del _active_captures[self.page]
+
+    def log_lines(self):
+        """按到达顺序拼接状态/日志接口返回的日志行，接口不带日志行时返回空列表"""
+        lines = []
+        for response in self.responses:
+            if response["kind"] == "result":
+                continue
+            data = _payload_data(response["payload"])
+            if not isinstance(data, dict):
+                continue
+            for key in LOG_LINE_KEYS:
+                value = data.get(key)
+                if isinstance(value, list) and all(isinstance(line, str) for line in value):
+                    lines += value
+                    break
+        return lines
+
+def _cell(value):
+    """嵌套的值存成JSON字符串，保证每列都是标量"""
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+
+def _collect_tables(value, path, response_index, tables):
+    """在JSON里找出可以变成表的部分：对象数组、标量数组、等长数组组成的对象"""
+    if isinstance(value, dict):
+        lists = [item for item in value.values() if isinstance(item, list)]
+        if len(lists) > 1 and len(lists) == len(value) and len({len(item) for item in lists}) == 1 and all(
+                not isinstance(cell, (dict, list)) for item in lists for cell in item):
+            # 已经是列式的序列，如 {"time": [...], "returns": [...]}
+            rows = [dict(zip(value, cells)) for cells in zip(*value.values())]
+        else:
+            for key, item in value.items():
+                _collect_tables(item, f"{path}.{key}", response_index, tables)
+            return
+    elif isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        rows = value
+    elif isinstance(value, list) and value and all(not isinstance(item, (dict, list)) for item in value):
+        rows = [{"value": item} for item in value]
+    else:
+        return
+
+    table = tables.setdefault(path, [])
+    for row in rows:
+        table.append({"response": response_index, **{key: _cell(cell) for key, cell in row.items()}})
+
+def capture_tables(responses):
+    """
+    把捕获的响应整理成列式的表
+
+    Returns:
+        dict: {表名: {列名: 值列表}}。responses 表每个响应一行，
+        其余表名为 接口类型+JSON路径（如 result.data.trades），response 列指向来源响应
+    """
+    tables = {"responses": []}
+    for index, response in enumerate(responses):
+        tables["responses"].append({"response": index, "kind": response["kind"], "url": response["url"],
+                                    "http_status": response["http_status"], "time": response["time"],
+                                    "status": payload_status(response["payload"])})
+        _collect_tables(response["payload"], response["kind"], index, tables)
+
+    columns = {}
+    for name, rows in tables.items():
+        keys = list(dict.fromkeys(key for row in rows for key in row))
+        columns[name] = {key: [row.get(key) for row in rows] for key in keys}
+    return columns
+
+def _safe_name(name):
+    return re.sub(r"[^\w.-]+", "_", name)[:60] or "capture"
+
+def _write_parquet(tables, capture_dir, pd):
+    for name, columns in tables.items():
+        frame = pd.DataFrame(columns)
+        path = os.path.join(capture_dir, f"{_safe_name(name)}.parquet")
+        try:
+            frame.to_parquet(path, index=False)
+        except (ValueError, TypeError):
+            # 同一列混合了数字和字符串，统一转成字符串
+            for column in frame.columns[frame.dtypes == object]:
+                frame[column] = frame[column].map(lambda value: None if value is None else str(value))
+            frame.to_parquet(path, index=False)
+
+def _numpy_column(np, values):
+    if all(value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)) for value in values):
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+    return np.array(["" if value is None else str(value) for value in values], dtype=str)
+
+def _write_npz(tables, capture_dir, np):
+    arrays = {f"{name}__{column}": _numpy_column(np, values)
+              for name, columns in tables.items() for column, values in columns.items()}
+    np.savez_compressed(os.path.join(capture_dir, "tables.npz"), **arrays)
+
+def _prune_captures(capture_root, keep=MAX_CAPTURE_RUNS):
+    try:
+        # 目录名以时间开头，按名字排序就是按时间排序
+        entries = sorted(entry for entry in os.listdir(capture_root)
+                         if os.path.isdir(os.path.join(capture_root, entry)))
+    except OSError:
+        return
+    for entry in entries[:max(0, len(entries) - keep)]:
+        shutil.rmtree(os.path.join(capture_root, entry), ignore_errors=True)
+
+def save_capture(responses, name):
+    """
+    把捕获的响应写入 ~/.jq-run/captures/<时间>_<name>_xxx/
+
+    原始响应写入 responses.jsonl；列式的表优先写 Parquet（需要 pandas 和 pyarrow），
+    其次写 NumPy 的 tables.npz（列名为 表名__列名），都没有时写 tables.json。
+
+    Returns:
+        str: 捕获目录，没有响应或写入失败时返回None
+    """
+    if not responses:
+        return None
+
+    capture_dir = None
+    try:
+        capture_root = get_capture_dir()
+        os.makedirs(capture_root, exist_ok=True)
+        capture_dir = tempfile.mkdtemp(prefix=f"{time.strftime('%Y%m%d_%H%M%S')}_{_safe_name(name)}_",
+                                       dir=capture_root)
+        with open(os.path.join(capture_dir, "responses.jsonl"), "w", encoding="utf-8") as f:
+            for response in responses:
+                f.write(json.dumps(response, ensure_ascii=False) + "\n")
+
+        tables = capture_tables(responses)
+        if importlib.util.find_spec("pandas") and importlib.util.find_spec("pyarrow"):
+            import pandas as pd
+            _write_parquet(tables, capture_dir, pd)
+        elif importlib.util.find_spec("numpy"):
+            import numpy as np
+            _write_npz(tables, capture_dir, np)
+        else:
+            with open(os.path.join(capture_dir, "tables.json"), "w", encoding="utf-8") as f:
+                json.dump(tables, f, ensure_ascii=False)
+
+        _prune_captures(capture_root)
+        return capture_dir
+    except Exception as e:
+        # 保存响应只是附带的记录，失败（磁盘、pyarrow/numpy 序列化等）不影响已经得到的运行结果
+        print(f"⚠ 保存接口响应失败: {e}")
+        if capture_dir:
+            shutil.rmtree(capture_dir, ignore_errors=True)
+        return None
+
+def load_capture_tables(capture_dir):
+    """读取 save_capture 写出的表，返回 {表名: {列名: 值列表}}"""
+    parquet_files = sorted(name for name in os.listdir(capture_dir) if name.endswith(".parquet"))
+    if parquet_files:
+        import pandas as pd
+        return {name[:-len(".parquet")]: pd.read_parquet(os.path.join(capture_dir, name)).to_dict("list")
+                for name in parquet_files}
+
+    npz_file = os.path.join(capture_dir, "tables.npz")
+    if os.path.exists(npz_file):
+        import numpy as np
+        tables = {}
+        with np.load(npz_file) as arrays:
+            for key in arrays.files:
+                name, _, column = key.rpartition("__")
+                tables.setdefault(name, {})[column] = arrays[key].tolist()
+        return tables
+
+    with open(os.path.join(capture_dir, "tables.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
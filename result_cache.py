@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+运行结果缓存模块：按策略源码（规范化后）和 algorithmId 的哈希缓存运行结果，
+同一份代码重复提交时直接返回，不再启动浏览器
+"""
+
+import hashlib
+import json
+import os
+import time
+from path_config import get_result_cache_dir, ensure_jq_run_dirs
+
+# 缓存有效期（秒）
+DEFAULT_CACHE_TTL = 24 * 3600
+
+# 缓存条目数和总大小上限，超出时淘汰最久未使用的条目
+MAX_CACHE_ENTRIES = 1000
+MAX_CACHE_BYTES = 100 * 1024 * 1024
+
+# 只缓存由代码本身决定的结果，超时、粘贴失败等偶发情况不缓存
+CACHEABLE_STATUSES = {"success", "error"}
+
+def normalize_strategy_source(content):
+    """规范化策略源码：统一换行符，去掉行尾空白和末尾空行"""
+    lines = content.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).rstrip("\n") + "\n"
+
+def compute_strategy_hash(content, algorithm_id):
+    """计算策略的缓存键"""
+    digest = hashlib.sha256()
+    digest.update(algorithm_id.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_strategy_source(content).encode("utf-8"))
+    return digest.hexdigest()
+
+def _cache_file(key):
+    return os.path.join(get_result_cache_dir(), f"{key}.json")
+
+def get_cached_result(key, ttl=DEFAULT_CACHE_TTL):
+    """
+    查找缓存的运行结果
+
+    Returns:
+        dict: 命中时返回结果（带 cached/cached_at 字段），未命中或已过期返回None
+    """
+    cache_file = _cache_file(key)
+    try:
+        stat = os.stat(cache_file)
+    except OSError:
+        return None
+
+    with open(cache_file, "r", encoding="utf-8") as f:
+        try:
+            entry = json.load(f)
+        except ValueError:
+            entry = None
+
+    if not entry or time.time() - entry.get("cached_at", 0) > ttl:
+        try:
+            os.remove(cache_file)
+        except OSError:
+            pass
+        return None
+
+    # 更新访问时间，淘汰时按最近使用排序
+    os.utime(cache_file, (time.time(), stat.st_mtime))
+    return {**entry["result"], "cached": True, "cached_at": entry["cached_at"]}
+
+def put_cached_result(key, result):
+    """写入运行结果，必要时淘汰旧条目"""
+    if result.get("status") not in CACHEABLE_STATUSES:
+        return False
+
+    ensure_jq_run_dirs()
+    entry = {"cached_at": time.time(), "result": {k: v for k, v in result.items() if k != "cached"}}
+    cache_file = _cache_file(key)
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_file, cache_file)
+
+    prune_result_cache()
+    return True
+
+def prune_result_cache(ttl=DEFAULT_CACHE_TTL, max_entries=MAX_CACHE_ENTRIES, max_bytes=MAX_CACHE_BYTES):
+    """删除过期条目，并按最近访问时间淘汰到条目数和大小上限以内"""
+    cache_dir = get_result_cache_dir()
+    now = time.time()
+    entries = []
+    removed = 0
+
+    try:
+        scanner = os.scandir(cache_dir)
+    except OSError:
+        return 0
+
+    with scanner:
+        for entry in scanner:
+            if not entry.name.endswith(".json"):
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > ttl:
+                os.remove(entry.path)
+                removed += 1
+            else:
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+
+    entries.sort(reverse=True)
+    total_bytes = 0
+    for index, (_, size, path) in enumerate(entries):
+        total_bytes += size
+        if index >= max_entries or total_bytes > max_bytes:
+            os.remove(path)
+            removed += 1
+
+    return removed
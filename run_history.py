@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+运行历史：每次运行的结果记入 ~/.jq-run/history.sqlite3，
+可以按策略、时间、状态查询，统计耗时分位数，按保留期限清理
+
+用法:
+    python run_history.py [list] [--file 路径或片段] [--hash 前缀] [--status 状态] [--since 7d] [--until 日期] [--limit N] [--json]
+    python run_history.py show <id>
+    python run_history.py stats [--since 7d] [--file ...] [--status ...]
+    python run_history.py errors [--since 7d] [--file ...] [--limit N]
+    python run_history.py prune [--older-than 90d] [--vacuum]
+"""
+
+import asyncio
+import contextlib
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from path_config import get_history_db_file, ensure_jq_run_dirs
+from result_cache import compute_strategy_hash
+from error_signature import analyze_error
+
+# 默认保留期限（天）
+DEFAULT_RETENTION_DAYS = 90
+
+# list 默认显示的条数
+DEFAULT_LIST_LIMIT = 20
+
+# 多个进程同时写入时等待锁的时间（秒）
+DB_BUSY_TIMEOUT = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_at REAL NOT NULL,
+    strategy_hash TEXT,
+    file TEXT,
+    algorithm_id TEXT,
+    status TEXT NOT NULL,
+    elapsed REAL,
+    cached INTEGER NOT NULL DEFAULT 0,
+    phases TEXT,
+    exception_type TEXT,
+    error_signature TEXT,
+    message TEXT,
+    capture_dir TEXT,
+    log BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_runs_hash ON runs (strategy_hash, run_at);
+CREATE INDEX IF NOT EXISTS idx_runs_time ON runs (run_at);
+CREATE INDEX IF NOT EXISTS idx_runs_status ON runs (status, run_at);
+CREATE INDEX IF NOT EXISTS idx_runs_signature ON runs (error_signature, run_at);
+"""
+
+# list/show 输出的列（不含日志）
+SUMMARY_COLUMNS = ["id", "run_at", "strategy_hash", "file", "algorithm_id", "status", "elapsed", "cached",
+                   "phases", "exception_type", "error_signature", "message", "capture_dir"]
+
+# 已经建好表的数据库，同一进程里不再重复执行建表语句
+_initialized = set()
+
+@contextlib.contextmanager
+def open_history_db():
+    """打开运行历史数据库，正常退出时提交，最后关闭连接"""
+    db_file = get_history_db_file()
+    if db_file not in _initialized:
+        ensure_jq_run_dirs()
+    connection = sqlite3.connect(db_file, timeout=DB_BUSY_TIMEOUT)
+    connection.row_factory = sqlite3.Row
+    if db_file not in _initialized:
+        # WAL 模式下查询不会被正在进行的写入阻塞
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        _initialized.add(db_file)
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+def record_run(result, file=None, content=None):
+    """
+    记录一次运行
+
+    Args:
+        result: 运行结果
+        file: 策略文件（记录为绝对路径），默认取 result["file"]
+        content: 策略源码，用来计算策略哈希（与接口响应捕获目录名中的哈希一致）
+
+    Returns:
+        int: 记录的id，写入失败时返回None
+    """
+    file = file or result.get("file")
+    if file and os.path.exists(file):
+        file = os.path.abspath(file)
+    details = result.get("details") or {}
+    error = result.get("error") or analyze_error(result, content)
+    log = result.get("log") or ""
+    row = {
+        "run_at": time.time(),
+        "strategy_hash": compute_strategy_hash(content, "") if content else None,
+        "file": file,
+        "algorithm_id": result.get("algorithm_id"),
+        "status": result["status"],
+        "elapsed": result.get("elapsed"),
+        "cached": int(bool(result.get("cached"))),
+        "phases": json.dumps(result["phases"]) if result.get("phases") else None,
+        "exception_type": details.get("exception_type"),
+        "error_signature": error["signature"] if error else None,
+        "message": details.get("message"),
+        "capture_dir": result.get("capture"),
+        "log": zlib.compress(log.encode("utf-8")),
+    }
+    try:
+        with open_history_db() as connection:
+            cursor = connection.execute(
+                f"INSERT INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})", list(row.values()))
+        return cursor.lastrowid
+    except (sqlite3.Error, OSError) as e:
+        # 历史记录只是附带的，数据库目录不可写、被锁等都不影响运行本身
+        print(f"⚠ 写入运行历史失败: {e}")
+        return None
+
+async def record_run_async(result, file=None, content=None):
+    """在线程里记录运行，不阻塞事件循环"""
+    return await asyncio.to_thread(record_run, result, file, content)
+
+def _build_filters(file=None, strategy_hash=None, status=None, since=None, until=None, signature=None):
+    clauses, params = [], []
+    if strategy_hash:
+        # 按前缀查找，用范围条件才能走索引
+        clauses.append("strategy_hash >= ? AND strategy_hash < ?")
+        params += [strategy_hash, strategy_hash + "\U0010ffff"]
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if since is not None:
+        clauses.append("run_at >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("run_at < ?")
+        params.append(until)
+    if file:
+        if os.path.exists(file):
+            clauses.append("file = ?")
+            params.append(os.path.abspath(file))
+        else:
+            clauses.append("file LIKE ?")
+            params.append(f"%{file}%")
+    if signature:
+        clauses.append("error_signature = ?")
+        params.append(signature)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def _row_dict(row):
+    record = {key: row[key] for key in row.keys() if key != "log"}
+    if record.get("phases"):
+        record["phases"] = json.loads(record["phases"])
+    if "log" in row.keys():
+        record["log"] = zlib.decompress(row["log"]).decode("utf-8") if row["log"] else ""
+    return record
+
+def query_runs(limit=DEFAULT_LIST_LIMIT, **filters):
+    """按条件查询运行记录（不含日志），最新的在前"""
+    where, params = _build_filters(**filters)
+    with open_history_db() as connection:
+        rows = connection.execute(f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM runs{where} "
+                                  f"ORDER BY run_at DESC LIMIT ?", params + [limit]).fetchall()
+    return [_row_dict(row) for row in rows]
+
+def get_run(run_id):
+    """读取一条运行记录（含日志），不存在时返回None"""
+    with open_history_db() as connection:
+        row = connection.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+    return _row_dict(row) if row else None
+
+def error_groups(limit=DEFAULT_LIST_LIMIT, **filters):
+    """按错误标识分组统计，出现次数多的在前"""
+    where, params = _build_filters(**filters)
+    where = (where + " AND" if where else " WHERE") + " error_signature IS NOT NULL"
+    with open_history_db() as connection:
+        rows = connection.execute(
+            f"SELECT error_signature, COUNT(*) AS count, MAX(run_at) AS last_run_at, MAX(id) AS last_id, "
+            f"COUNT(DISTINCT strategy_hash) AS strategies FROM runs{where} "
+            f"GROUP BY error_signature ORDER BY count DESC LIMIT ?", params + [limit]).fetchall()
+        groups = [dict(row) for row in rows]
+        # 每组取最近一次运行的状态和错误信息做说明
+        for group in groups:
+            latest = connection.execute("SELECT status, exception_type, message FROM runs WHERE id = ?",
+                                        (group["last_id"],)).fetchone()
+            group.update(dict(latest))
+    return groups
+
+def _percentile(values, p):
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)] if values else None
+
+def run_stats(**filters):
+    """
+    统计运行次数、各状态次数和耗时分位数
+
+    耗时只统计真正运行过的记录（不含缓存命中和预检失败）。
+    """
+    where, params = _build_filters(**filters)
+    with open_history_db() as connection:
+        counts = {row["status"]: row["count"] for row in connection.execute(
+            f"SELECT status, COUNT(*) AS count FROM runs{where} GROUP BY status", params)}
+        elapsed_where = (where + " AND" if where else " WHERE") + " cached = 0 AND elapsed > 0"
+        elapsed = [row[0] for row in connection.execute(
+            f"SELECT elapsed FROM runs{elapsed_where} ORDER BY elapsed", params)]
+        errors = connection.execute(
+            f"SELECT COUNT(DISTINCT error_signature) FROM runs{where}", params).fetchone()[0]
+    return {
+        "runs": sum(counts.values()),
+        "counts": counts,
+        "distinct_errors": errors,
+        "elapsed": {"count": len(elapsed), "p50": _percentile(elapsed, 50), "p95": _percentile(elapsed, 95),
+                    "mean": sum(elapsed) / len(elapsed) if elapsed else None},
+    }
+
+def prune_history(older_than_days=DEFAULT_RETENTION_DAYS, vacuum=False):
+    """删除早于保留期限的记录，返回删除的条数"""
+    cutoff = time.time() - older_than_days * 86400
+    with open_history_db() as connection:
+        deleted = connection.execute("DELETE FROM runs WHERE run_at < ?", (cutoff,)).rowcount
+    if vacuum:
+        with open_history_db() as connection:
+            connection.execute("VACUUM")
+    return deleted
+
+# 时长写法: 30m、12h、7d、2w
+DURATION_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)([mhdw])$")
+DURATION_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+def parse_time(value):
+    """把 7d（7天前）或 2024-01-02 / 2024-01-02T09:30 转成时间戳"""
+    match = DURATION_PATTERN.match(value)
+    if match:
+        return time.time() - float(match.group(1)) * DURATION_UNITS[match.group(2)]
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise ValueError(f"无法识别的时间: {value}（例如 7d、12h、2024-01-02）")
+
+def parse_days(value):
+    """保留期限: 90d、12w 或天数"""
+    match = DURATION_PATTERN.match(value)
+    if match:
+        return float(match.group(1)) * DURATION_UNITS[match.group(2)] / 86400
+    return float(value)
+
+def _format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+def print_runs(runs):
+    for run in runs:
+        elapsed = f"{run['elapsed']:.1f}s" if run["elapsed"] is not None else "-"
+        message = f"{run['exception_type'] or ''}: {run['message'] or ''}" if run["exception_type"] else ""
+        print(f"{run['id']:>6}  {_format_time(run['run_at'])}  {run['status']:<16} {elapsed:>8}"
+              f"{' (cached)' if run['cached'] else ''}  {(run['strategy_hash'] or '-')[:10]}  "
+              f"{run['file'] or '-'}  {message[:80]}")
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    command = args.pop(0) if args and not args[0].startswith("--") else "list"
+
+    filters = {}
+    options = {"limit": DEFAULT_LIST_LIMIT, "older_than_days": DEFAULT_RETENTION_DAYS}
+    value_options = {
+        "--file": (filters, "file", str),
+        "--hash": (filters, "strategy_hash", str),
+        "--status": (filters, "status", str),
+        "--signature": (filters, "signature", str),
+        "--since": (filters, "since", parse_time),
+        "--until": (filters, "until", parse_time),
+        "--limit": (options, "limit", int),
+        "--older-than": (options, "older_than_days", parse_days),
+    }
+    positional = []
+    try:
+        while args:
+            arg = args.pop(0)
+            name, _, value = arg.partition("=")
+            if name in value_options:
+                if not value:
+                    if not args:
+                        print(f"⚠ 参数 {name} 缺少取值")
+                        continue
+                    value = args.pop(0)
+                target, key, convert = value_options[name]
+                target[key] = convert(value)
+            elif arg in ("--json", "--vacuum"):
+                options[arg[2:]] = True
+            elif arg.startswith("--"):
+                print(f"⚠ 忽略未知参数: {arg}")
+            else:
+                positional.append(arg)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    try:
+        if command == "list":
+            runs = query_runs(limit=options["limit"], **filters)
+            if options.get("json"):
+                print(json.dumps(runs, ensure_ascii=False))
+            elif runs:
+                print_runs(runs)
+            else:
+                print("没有符合条件的运行记录")
+        elif command == "show":
+            if not positional or not positional[0].isdigit():
+                print("用法: python run_history.py show <id>（id 为 list 输出的第一列数字）")
+                return 1
+            run = get_run(int(positional[0]))
+            if not run:
+                print(f"❌ 没有id为 {positional[0]} 的运行记录")
+                return 1
+            if options.get("json"):
+                print(json.dumps(run, ensure_ascii=False))
+            else:
+                print_runs([run])
+                if run["phases"]:
+                    print("⏱ " + " | ".join(f"{name} {value:.2f}s" for name, value in run["phases"].items()))
+                if run["capture_dir"]:
+                    print(f"📁 {run['capture_dir']}")
+                print(run["log"])
+        elif command == "stats":
+            stats = run_stats(**filters)
+            if options.get("json"):
+                print(json.dumps(stats, ensure_ascii=False))
+            else:
+                elapsed = stats["elapsed"]
+                print(f"📈 共 {stats['runs']} 次运行，{stats['distinct_errors']} 种不同的错误: {stats['counts']}")
+                if elapsed["count"]:
+                    print(f"⏱ 耗时 p50 {elapsed['p50']:.1f}s  p95 {elapsed['p95']:.1f}s  "
+                          f"平均 {elapsed['mean']:.1f}s（{elapsed['count']} 次实际运行）")
+        elif command == "errors":
+            groups = error_groups(limit=options["limit"], **filters)
+            if options.get("json"):
+                print(json.dumps(groups, ensure_ascii=False))
+            for group in [] if options.get("json") else groups:
+                message = f"{group['exception_type']}: {group['message'] or ''}" if group["exception_type"] \
+                    else group["status"]
+                print(f"[{group['error_signature'][:8]}] ×{group['count']:<4} {message[:100]}  "
+                      f"（{group['strategies']} 份代码，最近 {_format_time(group['last_run_at'])}，id {group['last_id']}）")
+            if not groups and not options.get("json"):
+                print("没有符合条件的错误记录")
+        elif command == "prune":
+            deleted = prune_history(options["older_than_days"], options.get("vacuum", False))
+            print(f"🧹 已删除 {deleted} 条早于 {options['older_than_days']:g} 天的运行记录")
+        else:
+            print(__doc__.strip())
+            return 1
+    except (sqlite3.Error, OSError) as e:
+        print(f"❌ 读取运行历史失败: {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+运行计时模块：记录每次运行各阶段（启动浏览器、打开页面、粘贴、编译、运行、提取）的起止时间，
+输出每次运行一行的JSON计时记录，可导出 Chrome / Perfetto 能打开的 trace 文件
+"""
+
+import contextlib
+import contextvars
+import json
+import time
+from path_config import get_timing_log_file, ensure_jq_run_dirs
+
+# 当前任务的计时器；没有计时器时 phase() 返回共享的空上下文，几乎没有开销
+_current_timer = contextvars.ContextVar("run_timer", default=None)
+_NO_TIMING = contextlib.nullcontext()
+
+class PhaseTimer:
+    """记录一次运行中各阶段的起止时间（相对运行开始的秒数），阶段可以嵌套"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.spans.append({"name": name, "start": start - self.started,
+                               "end": time.perf_counter() - self.started, "depth": self._depth})
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def durations(self):
+        """各阶段耗时（秒），同名阶段累加"""
+        durations = {}
+        for span in self.spans:
+            durations[span["name"]] = durations.get(span["name"], 0.0) + span["end"] - span["start"]
+        return durations
+
+    def record(self, **fields):
+        """生成一行计时记录"""
+        return {
+            "type": "timing",
+            "name": self.name,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started_at)),
+            **fields,
+            "total": round(self.elapsed(), 4),
+            "phases": {name: round(value, 4) for name, value in self.durations().items()},
+            "spans": [{**span, "start": round(span["start"], 4), "end": round(span["end"], 4)}
+                      for span in sorted(self.spans, key=lambda span: span["start"])],
+        }
+
+def start_run_timer(name):
+    """为当前任务创建计时器，之后同一任务里的 phase() 都记到这个计时器上"""
+    timer = PhaseTimer(name)
+    _current_timer.set(timer)
+    return timer
+
+def phase(name):
+    """记录一个阶段: with phase("paste"): ..."""
+    timer = _current_timer.get()
+    return timer.phase(name) if timer else _NO_TIMING
+
+def emit_timing_record(record, target=None):
+    """
+    输出一行计时记录
+
+    Args:
+        target: "-" 输出到终端，其他值为追加写入的文件，None 时写入 ~/.jq-run/timings.jsonl
+    """
+    line = json.dumps(record, ensure_ascii=False)
+    if target == "-":
+        print(line)
+        return
+
+    try:
+        if target is None:
+            ensure_jq_run_dirs()
+            target = get_timing_log_file()
+        with open(target, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"⚠ 写入计时记录失败: {e}")
+
+def print_timing_summary(timer):
+    """打印各顶层阶段的耗时"""
+    spans = sorted((span for span in timer.spans if span["depth"] == 0), key=lambda span: span["start"])
+    parts = [f"{span['name']} {span['end'] - span['start']:.2f}s" for span in spans]
+    print(f"⏱ {timer.name} 阶段耗时: {' | '.join(parts)}（共 {timer.elapsed():.2f}s）")
+
+def report_run_timing(timer, timing, **fields):
+    """
+    按 timing 选项输出一次运行的计时
+
+    Args:
+        timing: {"log": 计时记录输出位置（见 emit_timing_record）, ...}，没有 log 时只打印摘要
+        fields: 写进计时记录的其他字段（文件、状态等）
+    """
+    print_timing_summary(timer)
+    if "log" in timing:
+        emit_timing_record(timer.record(**fields), timing["log"])
+
+def write_trace_file(timers, trace_file):
+    """
+    把一个或多个计时器导出为 Chrome trace 事件格式（Perfetto 和 chrome://tracing 都能打开），
+    每个计时器一条轨道
+    """
+    base = min((timer.started_at for timer in timers), default=0.0)
+    events = []
+    for tid, timer in enumerate(timers, 1):
+        offset = (timer.started_at - base) * 1e6
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": timer.name}})
+        for span in timer.spans:
+            events.append({"name": span["name"], "cat": "jq-run", "ph": "X", "pid": 1, "tid": tid,
+                           "ts": round(offset + span["start"] * 1e6), "dur": round((span["end"] - span["start"]) * 1e6)})
+
+    try:
+        with open(trace_file, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        print(f"📈 trace 已写入: {trace_file}（可在 https://ui.perfetto.dev 打开）")
+    except OSError as e:
+        print(f"⚠ 写入 trace 失败: {e}")
+
+async def start_playwright_trace(context):
+    """开始记录 Playwright trace（截图、DOM快照、网络），用 playwright show-trace 查看"""
+    try:
+        await context.tracing.start(screenshots=True, snapshots=True)
+        return True
+    except Exception as e:
+        print(f"⚠ 无法开始 Playwright trace: {e}")
+        return False
+
+async def stop_playwright_trace(context, trace_file):
+    """停止记录并保存 Playwright trace"""
+    try:
+        await context.tracing.stop(path=trace_file)
+        print(f"📈 Playwright trace 已写入: {trace_file}（用 playwright show-trace {trace_file} 查看）")
+    except Exception as e:
+        print(f"⚠ 保存 Playwright trace 失败: {e}")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+选择器缓存模块：并发尝试所有候选选择器，记住上次命中的选择器，
+下次优先使用，失效时自动降级；代码注入方法也用同样的方式记忆
+"""
+
+import asyncio
+import json
+import os
+from path_config import get_selector_cache_file, ensure_jq_run_dirs
+
+# 进程内缓存，避免每次查找都读写磁盘
+_learned_selectors = None
+
+def _load_learned_selectors():
+    global _learned_selectors
+    if _learned_selectors is None:
+        try:
+            with open(get_selector_cache_file(), "r", encoding="utf-8") as f:
+                _learned_selectors = json.load(f)
+        except (OSError, ValueError):
+            _learned_selectors = {}
+    return _learned_selectors
+
+def _save_learned_selectors():
+    try:
+        ensure_jq_run_dirs()
+        cache_file = get_selector_cache_file()
+        tmp_file = cache_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(_learned_selectors, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"⚠ 保存选择器缓存失败: {e}")
+
+def get_learned_selector(key):
+    """获取某类元素上次命中的选择器"""
+    return _load_learned_selectors().get(key)
+
+def remember_selector(key, selector):
+    """记录命中的选择器，只有发生变化时才写盘"""
+    learned = _load_learned_selectors()
+    if learned.get(key) != selector:
+        learned[key] = selector
+        _save_learned_selectors()
+
+def forget_selector(key):
+    """选择器不再匹配时降级，下次重新竞速"""
+    learned = _load_learned_selectors()
+    if key in learned:
+        print(f"↘ 选择器缓存失效，已降级: {key} -> {learned[key]}")
+        del learned[key]
+        _save_learned_selectors()
+
+def ordered_selectors(key, selectors):
+    """把上次命中的选择器排到最前面"""
+    learned = get_learned_selector(key)
+    if learned in selectors:
+        return [learned] + [s for s in selectors if s != learned]
+    return list(selectors)
+
+# 指定了优先选择器时，通用的后备选择器晚这么久（毫秒）才加入竞速
+SELECTOR_HEAD_START_MS = 300
+
+async def race_selectors(page, key, selectors, timeout=5000, state="visible", priority=None):
+    """
+    查找第一个出现的元素
+
+    先直接检查上次命中的选择器；不匹配就降级，然后所有候选同时等待，
+    取最先出现的一个并记住它。同时出现的多个候选取 selectors 中靠前的一个。
+
+    Args:
+        page: 页面
+        key: 缓存键，例如 'compile_button'
+        selectors: 候选选择器列表，按优先级排列
+        timeout: 竞速的总超时（毫秒）
+        state: 元素需要达到的状态（visible/attached）
+        priority: 前 priority 个是精确的选择器，先竞速 SELECTOR_HEAD_START_MS 毫秒，
+            之后（或它们全部失败后）其余的通用选择器才加入
+
+    Returns:
+        (selector, element)，全部失败时为 (None, None)
+    """
+    learned = get_learned_selector(key)
+    if learned in selectors:
+        try:
+            element = await page.query_selector(learned)
+            if element and (state != "visible" or await element.is_visible()):
+                return learned, element
+        except Exception:
+            pass
+        forget_selector(key)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    tasks = {}
+
+    def start(batch):
+        remaining = max(0, timeout - (loop.time() - started) * 1000)
+        futures = set()
+        for selector in batch:
+            task = asyncio.ensure_future(page.wait_for_selector(selector, timeout=remaining, state=state))
+            tasks[task] = selector
+            futures.add(task)
+        return futures
+
+    fallback = list(selectors[priority:]) if priority else []
+    pending = start(selectors[:priority] if priority else selectors)
+    try:
+        while pending or fallback:
+            head_start_left = SELECTOR_HEAD_START_MS / 1000 - (loop.time() - started)
+            if fallback and (not pending or head_start_left <= 0):
+                pending |= start(fallback)
+                fallback = []
+                continue
+
+            done, pending = await asyncio.wait(pending, timeout=head_start_left if fallback else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            found = [task for task in done
+                     if not task.cancelled() and task.exception() is None and task.result()]
+            if found:
+                task = min(found, key=lambda task: selectors.index(tasks[task]))
+                selector = tasks[task]
+                remember_selector(key, selector)
+                return selector, task.result()
+        return None, None
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+登录状态管理模块：跟踪 auth_state.json 中Cookie的过期时间，
+只在需要时向浏览器注入Cookie，并在页面跳转到登录页时立即判定登录失效
+"""
+
+import json
+import os
+import time
+import uuid
+from path_config import (
+    get_browser_data_dir, get_cdp_endpoint_file, get_debug_chrome_data_dir, get_session_marker_file,
+    ensure_jq_run_dirs
+)
+
+# 聚宽的Cookie域名
+SESSION_COOKIE_DOMAIN = "joinquant.com"
+
+# 出现在URL中即认为被重定向到了登录页
+LOGIN_URL_KEYWORDS = ["/user/login", "/login", "passport"]
+
+# 写在浏览器数据目录（独立浏览器或自动启动的调试Chrome）里的注入标识，
+# 数据目录被重置或替换后标识随之消失，下次运行重新注入
+PROFILE_TOKEN_FILE = ".jq_run_session"
+
+class SessionExpiredError(Exception):
+    """登录状态已失效，需要重新运行 login_save.py"""
+
+# 进程内缓存：(auth文件路径, mtime, size) -> 解析结果
+_session_cache = {}
+
+def load_session_state(auth_file):
+    """
+    读取认证状态并计算聚宽Cookie的过期时间，文件未变化时不重复解析
+
+    Returns:
+        dict: {"cookies", "expires_at", "mtime"}；expires_at 为None表示只有会话Cookie
+    """
+    stat = os.stat(auth_file)
+    cache_key = (auth_file, stat.st_mtime, stat.st_size)
+    if cache_key in _session_cache:
+        return _session_cache[cache_key]
+
+    with open(auth_file, "r", encoding="utf-8") as f:
+        cookies = json.load(f).get("cookies", [])
+
+    expiries = [cookie["expires"] for cookie in cookies
+                if SESSION_COOKIE_DOMAIN in cookie.get("domain", "") and cookie.get("expires", -1) > 0]
+    session = {"cookies": cookies, "expires_at": max(expiries) if expiries else None, "mtime": stat.st_mtime}
+    _session_cache.clear()
+    _session_cache[cache_key] = session
+    return session
+
+def session_expired(session, now=None):
+    """保存的Cookie是否已经全部过期"""
+    return session["expires_at"] is not None and session["expires_at"] <= (now or time.time())
+
+def _load_marker():
+    try:
+        with open(get_session_marker_file(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_marker(marker):
+    try:
+        ensure_jq_run_dirs()
+        with open(get_session_marker_file(), "w", encoding="utf-8") as f:
+            json.dump(marker, f, indent=2)
+    except OSError as e:
+        print(f"⚠ 保存登录状态记录失败: {e}")
+
+def _profile_token_file(profile):
+    """
+    profile 数据目录里的标识文件路径
+
+    连接的调试Chrome是自动启动的（数据目录在 browser_data/debug）时写在它的数据目录里；
+    手动启动的调试Chrome的数据目录未知，返回None，只按CDP地址区分。
+    """
+    if profile == "isolated":
+        return os.path.join(get_browser_data_dir(), PROFILE_TOKEN_FILE)
+    if profile == "attach" and os.path.isdir(get_debug_chrome_data_dir()):
+        return os.path.join(get_debug_chrome_data_dir(), PROFILE_TOKEN_FILE)
+    return None
+
+def _cdp_endpoint(profile):
+    """连接的调试Chrome的CDP地址，其他 profile 返回None"""
+    if profile != "attach":
+        return None
+    try:
+        with open(get_cdp_endpoint_file(), "r", encoding="utf-8") as f:
+            return json.load(f).get("endpoint")
+    except (OSError, ValueError):
+        return None
+
+def _read_profile_token(profile):
+    token_file = _profile_token_file(profile)
+    if not token_file:
+        return None
+    try:
+        with open(token_file, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def _write_profile_token(profile):
+    token_file = _profile_token_file(profile)
+    if not token_file:
+        return None
+    token = uuid.uuid4().hex
+    try:
+        with open(token_file, "w", encoding="utf-8") as f:
+            f.write(token)
+        return token
+    except OSError as e:
+        print(f"⚠ 保存浏览器数据目录标识失败: {e}")
+        return None
+
+async def ensure_session_cookies(context, auth_file, profile="isolated"):
+    """
+    只在需要时向浏览器上下文注入Cookie
+
+    持久化的浏览器数据目录会保留Cookie，所以同一个数据目录只在 auth_state.json
+    更新后（或上次判定登录失效后）才重新注入。注入记录同时核对数据目录里的标识文件
+    （连接调试Chrome时还核对CDP地址），数据目录被重置、从备份恢复或换了一个调试Chrome后重新注入。
+
+    Args:
+        context: 浏览器上下文
+        auth_file: 认证状态文件
+        profile: 浏览器数据目录的标识，不同数据目录分别记录
+
+    Returns:
+        bool: 本次是否注入了Cookie
+    """
+    session = load_session_state(auth_file)
+    if session_expired(session):
+        print("⚠ auth_state.json 中的Cookie已过期，如果打开页面后跳到登录页，请重新运行 login_save.py")
+
+    marker = _load_marker()
+    injected = marker.get(profile, {})
+    endpoint = _cdp_endpoint(profile)
+    if (injected.get("auth_mtime") == session["mtime"]
+            and injected.get("profile_token") == _read_profile_token(profile)
+            and injected.get("endpoint") == endpoint):
+        return False
+
+    await context.add_cookies(session["cookies"])
+    marker[profile] = {"auth_mtime": session["mtime"], "injected_at": time.time(),
+                       "expires_at": session["expires_at"], "profile_token": _write_profile_token(profile),
+                       "endpoint": endpoint}
+    _save_marker(marker)
+    print("🍪 已注入登录Cookie")
+    return True
+
+def invalidate_session(profile=None):
+    """登录失效后清除注入记录（profile 为None时清除全部），下次运行重新注入"""
+    marker = _load_marker()
+    if profile is None:
+        changed = bool(marker)
+        marker = {}
+    else:
+        changed = marker.pop(profile, None) is not None
+    if changed:
+        _save_marker(marker)
+
+def is_login_url(url):
+    """URL是否为登录页"""
+    url = (url or "").lower()
+    return any(keyword in url for keyword in LOGIN_URL_KEYWORDS)
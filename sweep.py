@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+参数扫描：用一个策略模板和参数网格（或随机抽样）在内存中生成策略变体，
+通过批量模式并发运行，把每个变体的参数、状态和指标汇总到一张CSV/Parquet表，
+中断后再次运行会跳过已经完成的变体
+"""
+
+import asyncio
+import csv
+import hashlib
+import importlib.util
+import itertools
+import json
+import os
+import random
+import re
+import sys
+from access_algorithm import DEFAULT_CONCURRENCY, DEFAULT_RUN_TIMEOUT, run_strategy_batch
+
+# 模板中的占位符: {{lookback}}
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(?P<name>[A-Za-z_]\w*)\s*\}\}")
+
+# 这些状态由代码本身决定，续跑时不再重新运行；超时、异常等状态会重新运行
+FINAL_STATUSES = {"success", "error", "preflight_failed"}
+
+# 结果表中参数和指标之外的列
+RESULT_COLUMNS = ["variant_id", "status", "elapsed", "cached", "error_signature", "exception_type", "message",
+                  "user_lines"]
+
+def parse_param_values(text):
+    """
+    解析一个参数的取值
+
+    支持逗号分隔的列表（10,20,30）和闭区间范围（0.1:0.5:0.1），
+    能按JSON解析的值转成数字/布尔，其余保留为字符串。
+    """
+    parts = text.split(":")
+    if len(parts) == 3:
+        start, stop, step = (json.loads(part) for part in parts)
+        if step <= 0:
+            raise ValueError(f"步长必须大于0: {text}")
+        values = []
+        index = 0
+        # 按下标计算，避免浮点累加误差
+        while start + index * step <= stop + abs(step) * 1e-9:
+            value = start + index * step
+            values.append(value if isinstance(value, int) else round(value, 10))
+            index += 1
+        return values
+
+    values = []
+    for item in text.split(","):
+        item = item.strip()
+        try:
+            values.append(json.loads(item))
+        except ValueError:
+            values.append(item)
+    return values
+
+def load_param_grid(grid_file=None, params=None):
+    """
+    合并JSON网格文件（{"lookback": [10, 20]}）和命令行的 name=values 参数
+
+    Returns:
+        dict: {参数名: 取值列表}，保持参数顺序
+    """
+    grid = {}
+    if grid_file:
+        with open(grid_file, "r", encoding="utf-8") as f:
+            for name, values in json.load(f).items():
+                grid[name] = values if isinstance(values, list) else [values]
+    for param in params or []:
+        name, _, text = param.partition("=")
+        if not text:
+            raise ValueError(f"参数格式应为 name=values: {param}")
+        grid[name.strip()] = parse_param_values(text)
+    return grid
+
+def grid_size(grid):
+    size = 1
+    for values in grid.values():
+        size *= len(values)
+    return size
+
+def _combination_at(grid, index):
+    """按混合进制把序号换算成一组参数，不需要展开整个网格"""
+    params = {}
+    for name, values in reversed(list(grid.items())):
+        index, position = divmod(index, len(values))
+        params[name] = values[position]
+    return dict(reversed(list(params.items())))
+
+def iter_param_sets(grid, samples=None, seed=None):
+    """按网格顺序生成所有参数组合；给出 samples 时不放回地随机抽取这么多组"""
+    total = grid_size(grid)
+    if samples is None or samples >= total:
+        names = list(grid)
+        for values in itertools.product(*grid.values()):
+            yield dict(zip(names, values))
+        return
+
+    for index in sorted(random.Random(seed).sample(range(total), samples)):
+        yield _combination_at(grid, index)
+
+def variant_id(params, template=""):
+    """参数组合的稳定标识，续跑时用它判断是否已经完成；模板改动后所有变体都会重新运行"""
+    digest = hashlib.sha1(template.encode("utf-8"))
+    digest.update(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+def render_template(template, params):
+    """把参数代入模板；字符串原样代入，引号由模板自己写，如 g.index = '{{index}}'"""
+    def replace(match):
+        name = match.group("name")
+        if name not in params:
+            raise KeyError(f"模板中的参数 {name} 没有取值")
+        value = params[name]
+        return value if isinstance(value, str) else repr(value)
+
+    return PLACEHOLDER_PATTERN.sub(replace, template)
+
+def _progress_file(output_file):
+    return output_file + ".progress.jsonl"
+
+def load_progress(output_file):
+    """读取已完成的变体 {variant_id: 结果行}，后写的覆盖先写的"""
+    rows = {}
+    try:
+        with open(_progress_file(output_file), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # 中断时可能留下半行
+                    continue
+                rows[row["variant_id"]] = row
+    except OSError:
+        pass
+    return rows
+
+def result_row(variant, result):
+    """把一次运行结果整理成结果表的一行"""
+    details = result.get("details") or {}
+    error = result.get("error") or {}
+    return {
+        "variant_id": variant["id"],
+        "params": variant["params"],
+        "status": result["status"],
+        "elapsed": result.get("elapsed"),
+        "cached": bool(result.get("cached")),
+        "error_signature": error.get("signature"),
+        "exception_type": details.get("exception_type"),
+        "message": details.get("message"),
+        "user_lines": " ".join(str(line) for line in details.get("user_lines", [])),
+        "metrics": details.get("metrics") or {},
+    }
+
+def parquet_available():
+    """是否装了 pandas 和写 Parquet 的引擎（pyarrow 或 fastparquet）"""
+    return bool(importlib.util.find_spec("pandas")
+                and (importlib.util.find_spec("pyarrow") or importlib.util.find_spec("fastparquet")))
+
+def csv_output_file(output_file):
+    """Parquet 写不了时改写的CSV文件名"""
+    return os.path.splitext(output_file)[0] + ".csv"
+
+def write_result_table(rows, output_file):
+    """
+    把结果行展开成表（参数列、结果列、指标列）写成CSV或Parquet
+
+    Parquet 写入失败时改写成同名的CSV，扫描的结果不会丢失。
+
+    Returns:
+        str: 实际写入的文件
+    """
+    param_names = list(dict.fromkeys(name for row in rows for name in row["params"]))
+    metric_names = sorted({name for row in rows for name in row["metrics"]})
+    columns = ([f"param_{name}" for name in param_names] + RESULT_COLUMNS + [f"metric_{name}" for name in metric_names])
+    records = []
+    for row in rows:
+        record = {f"param_{name}": row["params"].get(name) for name in param_names}
+        record.update({column: row.get(column) for column in RESULT_COLUMNS})
+        record.update({f"metric_{name}": row["metrics"].get(name) for name in metric_names})
+        records.append(record)
+
+    if output_file.endswith(".parquet"):
+        try:
+            import pandas as pd
+            pd.DataFrame.from_records(records, columns=columns).to_parquet(output_file, index=False)
+            return output_file
+        except Exception as e:
+            output_file = csv_output_file(output_file)
+            print(f"⚠ 写 Parquet 失败（{e}），改为写CSV: {output_file}")
+
+    tmp_file = output_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(records)
+    os.replace(tmp_file, output_file)
+    return output_file
+
+async def run_sweep(template_file, grid, output_file, samples=None, seed=None, resume=True, **batch_options):
+    """
+    运行一次参数扫描
+
+    每完成一个变体就把结果行追加到 <output>.progress.jsonl，
+    中断后再次运行同样的命令会跳过已经得到最终状态的变体；结束后写出完整的结果表。
+
+    Args:
+        batch_options: 传给 run_strategy_batch 的参数（concurrency、run_timeout、browser_options 等）
+
+    Returns:
+        dict: {"variants": 变体数, "rows": 已有结果的变体的结果行}，模板有误时返回None
+    """
+    with open(template_file, "r", encoding="utf-8") as f:
+        template = f.read()
+
+    missing = {match.group("name") for match in PLACEHOLDER_PATTERN.finditer(template)} - set(grid)
+    if missing:
+        print(f"❌ 模板中的参数没有取值: {', '.join(sorted(missing))}")
+        return None
+
+    variants = []
+    for params in iter_param_sets(grid, samples, seed):
+        variants.append({"id": variant_id(params, template), "params": params, "content": render_template(template, params)})
+    print(f"🧪 参数网格共 {grid_size(grid)} 组，本次扫描 {len(variants)} 个变体")
+
+    progress_file = _progress_file(output_file)
+    if not resume and os.path.exists(progress_file):
+        os.remove(progress_file)
+    done = {key: row for key, row in load_progress(output_file).items() if row["status"] in FINAL_STATUSES}
+    pending = [variant for variant in variants if variant["id"] not in done]
+    if done:
+        print(f"⏩ 续跑：跳过已完成的 {len(variants) - len(pending)} 个变体")
+
+    if pending:
+        template_name = os.path.basename(template_file)
+        by_name = {f"{template_name}[{variant['id']}]": variant for variant in pending}
+
+        def on_result(result):
+            row = result_row(by_name[result["file"]], result)
+            done[row["variant_id"]] = row
+            with open(progress_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+        await run_strategy_batch(list(by_name), sources={name: variant["content"] for name, variant in by_name.items()},
+                                 on_result=on_result, **batch_options)
+
+    rows = [done[variant["id"]] for variant in variants if variant["id"] in done]
+    table_file = write_result_table(rows, output_file)
+    print(f"📊 结果表已写入: {table_file}（{len(rows)}/{len(variants)} 个变体）")
+    return {"variants": len(variants), "rows": rows}
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法: python sweep.py <template.py> --param name=v1,v2 [--param name=start:stop:step] [--grid grid.json]")
+        print("       [--samples N] [--seed S] [--concurrency N] [--timeout 秒] [--output sweep.csv|sweep.parquet]")
+        print("       [--algorithms id1,id2] [--headless] [--attach] [--no-cache] [--no-preflight] [--fresh]")
+        sys.exit(1)
+
+    template_file = None
+    params = []
+    options = {"grid_file": None, "output_file": "sweep.csv"}
+    batch_options = {"concurrency": DEFAULT_CONCURRENCY, "run_timeout": DEFAULT_RUN_TIMEOUT, "browser_options": {}}
+    value_options = {
+        "--grid": (options, "grid_file", str),
+        "--output": (options, "output_file", str),
+        "--samples": (options, "samples", int),
+        "--seed": (options, "seed", int),
+        "--concurrency": (batch_options, "concurrency", int),
+        "--timeout": (batch_options, "run_timeout", float),
+        "--algorithms": (batch_options, "algorithm_ids", str),
+    }
+
+    args = sys.argv[1:]
+    while args:
+        arg = args.pop(0)
+        name, _, value = arg.partition("=")
+        if name in value_options or name == "--param":
+            if not value:
+                if not args:
+                    print(f"⚠ 参数 {name} 缺少取值")
+                    continue
+                value = args.pop(0)
+            if name == "--param":
+                params.append(value)
+            else:
+                target, key, convert = value_options[name]
+                target[key] = convert(value)
+        elif arg == "--headless":
+            batch_options["browser_options"].setdefault("block_resources", True)
+            batch_options["browser_options"]["headless"] = True
+        elif arg == "--attach":
+            batch_options["browser_options"]["attach"] = True
+        elif arg == "--no-cache":
+            batch_options["use_cache"] = False
+        elif arg == "--no-preflight":
+            batch_options["preflight"] = False
+        elif arg == "--fresh":
+            options["resume"] = False
+        elif arg.startswith("--"):
+            print(f"⚠ 忽略未知参数: {arg}")
+        else:
+            template_file = arg
+
+    try:
+        grid = load_param_grid(options.pop("grid_file"), params)
+    except (OSError, ValueError) as e:
+        print(f"❌ 参数网格有误: {e}")
+        sys.exit(1)
+    if not template_file or not grid:
+        print("❌ 需要模板文件和至少一个参数")
+        sys.exit(1)
+    if options["output_file"].endswith(".parquet") and not parquet_available():
+        # 开始扫描之前就换成CSV，不要等全部跑完才发现写不了
+        options["output_file"] = csv_output_file(options["output_file"])
+        print(f"⚠ 写 Parquet 需要安装 pandas 和 pyarrow（pip install pandas pyarrow），改为写CSV: {options['output_file']}")
+
+    sweep = asyncio.run(run_sweep(template_file, grid, options.pop("output_file"), **options, **batch_options))
+    finished = sweep and len(sweep["rows"]) == sweep["variants"] and all(
+        row["status"] in FINAL_STATUSES for row in sweep["rows"])
+    sys.exit(0 if finished else 1)
+
+if __name__ == "__main__":
+    main()